@@ -1,4 +1,5 @@
 import math
+import numpy
 
 # Calculate the total integrated S/N according to ALFALFA (Saintonge 2007)
 def aasn(totflux, w50, vres, rms):
@@ -13,3 +14,16 @@ def aasn(totflux, w50, vres, rms):
 	intsn = (1000.0*totflux / w50) * (math.sqrt(wsmo) / thisrms)
 	
 	return intsn
+
+
+# Array version of the above, for evaluating the integrated S/N over whole grids of parameters at once.
+# Inputs can be any mix of scalars and numpy arrays, as long as they broadcast together. The W50 >= 400 km/s
+# cap on the smoothing width is applied element-wise rather than with an if statement.
+def aasnarray(totflux, w50, vres, rms):
+	thisrms = numpy.asarray(rms, dtype=float) * 1000.0
+	
+	wsmo = numpy.minimum(w50, 400.0) / (2.0*vres)
+	
+	intsn = (1000.0*numpy.asarray(totflux, dtype=float) / w50) * (numpy.sqrt(wsmo) / thisrms)
+	
+	return intsn
@@ -2,8 +2,6 @@
 # Base code generated by ChatGPT-4o, tweaked for aesthetics
 
 import streamlit as st
-import math
-from math import pi as pi
 import imp
 
 # EXTERNAL SCRIPTS IMPORTED AS FUNCTIONS
@@ -13,62 +11,26 @@ import NiceNumber
 imp.reload(NiceNumber)
 from NiceNumber import nicenumber
 
+# Conversions between angular and physical size, for single values or arrays, and for CSV tables
+import SizeConversion
+imp.reload(SizeConversion)
+from SizeConversion import angular_to_physical, physical_to_angular, convertcsv
 
-# Convert angular to physical size
-def angular_to_physical(angular_size, distance, angular_unit, distance_unit):
-    # Standardise units
-	# First convert angular size to degrees. No need for any conversion if input is in parsecs
-    if angular_unit == 'arcminutes':
-        angular_size = angular_size / 60.0
-    elif angular_unit == 'arcseconds':
-        angular_size = angular_size / 3600.0
-    
-    # Next convert distance to parsecs
-    if distance_unit == 'kpc':
-        distance = distance * 1E3
-    elif distance_unit == 'Mpc':
-        distance = distance * 1E6
-    
-    # Calculate physical size in parsecs
-	# ChatGPT's solution :
-    #physical_size = 2 * distance * math.tan(math.radians(angular_size / 2))
-	# I prefer my own formulation, base on the fraction of the circumference of a circle
-    physical_size = (angular_size / 360.0) * 2.0 * pi * distance
-	
-	# Return the answer in this raw standardised form. Gets formatted and printed in different units
-	# in the main part of the code.
-    return physical_size
-
-
-def physical_to_angular(physical_size, physical_unit, distance, distance_unit):
-    # Standardise units, if input is not in pc. If it is, no need to alter the value
-	# Convert physical size 
-	if physical_unit == 'kpc':
-		physical_size = physical_size * 1E3
-	elif physical_unit == 'Mpc':
-		physical_size = physical_size * 1E6
-	
-	# Convert distance
-	if distance_unit == 'kpc':
-		distance = distance * 1E3
-	elif distance_unit == 'Mpc':
-		distance = distance * 1E6
-    
-	# Calculate angular size in degrees
-	# ChatGPT's answer with unnecessary trigonometry
-	#angular_size = 2 * math.degrees(math.atan(physical_size / (2 * distance)))
-	# My preferred, more physical formulation
-	angular_size = (360.0*physical_size) / (2.0 * pi* distance)
-    
-	# Return angular size in raw units of degrees. Formatting and conversion to arcmin/sec is done
-	# in the main part of the code.  
-	return angular_size
+# Cosmologies available for distances given as redshifts
+import CosmoDistance
+imp.reload(CosmoDistance)
+from CosmoDistance import cosmologies
+
+# Converting uploaded tables
+import TableIO
+imp.reload(TableIO)
+from TableIO import convertupload
 
 
 # Streamlit GUI
 st.title("Angular / Physical Size Converter")
 st.write('### Converts angular to physical size and vice-versa')
-st.write('Assumes a simple Euclidian geometry and does not account for any cosmological effects. Should give reasonable results at low redshifts, i.e. < 0.1 or so.')
+st.write('Distances in pc, kpc or Mpc assume a simple Euclidian geometry and do not account for any cosmological effects. Should give reasonable results at low redshifts, i.e. < 0.1 or so. For more distant sources, give the distance as a redshift (unit z) instead, and the angular diameter distance for the chosen cosmology will be used.')
 
 
 # Define columns to hold the widgets for the user-entered parameters
@@ -77,6 +39,12 @@ left_column, left_mid_column, right_mid_column, right_column = st.columns(4)
 # User first chooses which direction of conversion
 conversion_type = st.radio("Choose conversion type", ("Angular to Physical", "Physical to Angular"))
 
+# Optionally use the exact formula rather than the small-angle approximation
+exact = st.checkbox('Exact (no small-angle approximation)', key='exact', help='Use 2 D tan(theta/2) rather than the fraction of the circumference of a circle. Only makes a difference for large angles, e.g. more than a few degrees')
+
+# Cosmology for distances given as redshifts
+cosmo = st.selectbox('Cosmology', tuple(cosmologies), key='cosmo', help='Only used for distances given as redshifts')
+
 
 if conversion_type == "Angular to Physical":
 	with left_column:
@@ -89,9 +57,9 @@ if conversion_type == "Angular to Physical":
 		distance = st.number_input("Distance")
     
 	with right_column:
-		distance_unit = st.selectbox("Distance unit", ("pc", "kpc", "Mpc"))
+		distance_unit = st.selectbox("Distance unit", ("pc", "kpc", "Mpc", "z"))
     
-	physical_size = angular_to_physical(angular_size, distance, angular_unit, distance_unit)
+	physical_size = float(angular_to_physical(angular_size, distance, angular_unit, distance_unit, exact, cosmo))
 	
 	st.write('##### Physical size in friendly numbers')
 	nice_parsec  = nicenumber(physical_size)
@@ -117,11 +85,11 @@ else:
 		distance = st.number_input("Distance")
     
 	with right_column:
-		distance_unit = st.selectbox("Distance unit", ("pc", "kpc", "Mpc"))
+		distance_unit = st.selectbox("Distance unit", ("pc", "kpc", "Mpc", "z"))
     
     #if st.button("Convert"):
 	if distance > 0.0:
-		angular_size = physical_to_angular(physical_size, physical_unit, distance, distance_unit)
+		angular_size = float(physical_to_angular(physical_size, physical_unit, distance, distance_unit, exact, cosmo))
 		
 		st.write('##### Angular size in friendly numbers')
 		nice_degrees = nicenumber(angular_size)
@@ -134,3 +102,27 @@ else:
 		
 		st.write('##### Angular size unformatted')
 		st.write(f"{angular_size} degrees")
+
+
+# TABLE CONVERSION
+# Converts a whole table of sizes at once, e.g. for a catalogue of sources at different distances
+st.write('###')
+st.write('#### Table conversion')
+if st.checkbox('Convert a table of sizes', key='dosizetable', help='Upload a CSV table of sizes and distances to convert them all in the direction chosen above'):
+	st.write('Upload a CSV file with a header row and columns named **size** and **distance**. Optionally include **size_unit** and **distance_unit** columns to set the units for each row (distance units of z meaning redshifts); otherwise the units below are used for all of them. Any other columns (e.g. names) are copied to the output, followed by the converted sizes using both the small-angle approximation and the exact formula. The table is converted a chunk at a time, so it can be as long as you like. Rows which can\'t be converted are given NaN.')
+
+	left_column, right_column = st.columns(2)
+
+	with left_column:
+		if conversion_type == "Angular to Physical":
+			tablesizeunit = st.selectbox('Default size unit', ("degrees", "arcminutes", "arcseconds"), key='tablesizeunit')
+		else:
+			tablesizeunit = st.selectbox('Default size unit', ("pc", "kpc", "Mpc"), key='tablephysunit')
+
+	with right_column:
+		tabledistunit = st.selectbox('Default distance unit', ("pc", "kpc", "Mpc", "z"), index=2, key='tabledistunit')
+
+	sizefile = st.file_uploader('Table of sizes', type=['csv', 'txt'], key='sizefile')
+
+	if sizefile is not None:
+		convertupload(sizefile, lambda infile, outfile: convertcsv(infile, outfile, conversion_type, tablesizeunit, tabledistunit, cosmo), 'sizes.csv')
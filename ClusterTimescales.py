@@ -0,0 +1,185 @@
+# Timescales for the members of a galaxy cluster, from their projected positions and line-of-sight velocities:
+# the time for infalling galaxies to reach the cluster centre at their present radial speed, the time to cross R200
+# at their present speed (as in TravelTime.py), and the ram pressure from the intracluster medium. Only two of the
+# six phase-space coordinates are known, so each galaxy is deprojected by Monte Carlo over random orientations: the
+# line-of-sight depth is drawn assuming members are spread uniformly through a sphere around the cluster, and the
+# two tangential velocity components from an isotropic Gaussian with the cluster's velocity dispersion. Galaxies are
+# processed in chunks, each with its own random number stream derived from a single seed (as in MockCatalogue.py),
+# so results are reproducible however many processes the chunks are spread over.
+
+import numpy
+import imp
+import functools
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+# Reading and writing tables a chunk at a time
+import TableIO
+imp.reload(TableIO)
+from TableIO import tonumbers, converttable
+
+# Travel times from distances and speeds
+import Travel
+imp.reload(Travel)
+from Travel import solvetravel
+
+
+# Speed of light in km/s, proton mass in g, and the mean particle mass of the ICM in units of the proton mass
+c = 299792.458
+protonmass = 1.67262192E-24
+mu = 0.6
+
+# Quantities calculated for each sample, and the statistics returned for each
+quantities = ['r3d_kpc', 'v3d_kms', 'vrad_kms', 'tinfall_myr', 'tcross_myr', 'pram_dyncm2']
+statistics = ['p16', 'median', 'p84']
+
+# Fields of the structured arrays returned by timescales. Infall times only exist for the samples where the galaxy
+# is moving inwards, so their statistics are over those samples alone, and the fraction of them is given as well.
+timescaledtype = [('rproj_kpc', float), ('vlos_kms', float), ('inbound_fraction', float)] + [(quantity+'_'+statistic, float) for quantity in quantities for statistic in statistics]
+
+# Default cluster parameters : R200 (kpc), velocity dispersion (km/s), the radius out to which members are assumed to
+# be spread (in units of R200), and a beta model for the ICM density, n = n0 (1 + (r/rc)^2)^(-3 beta / 2), with n0
+# the total particle density in cm^-3 and rc in kpc
+defaultparams = {'r200':1500.0, 'sigma':700.0, 'rlimit':2.0, 'n0':1E-2, 'rc':100.0, 'beta':0.5}
+
+
+# Projected separations (kpc) of galaxies from the cluster centre, from their positions and the centre's (all in
+# degrees) and the angular diameter distance (Mpc), using the haversine formula so small separations are accurate
+def projectedradius(ra, dec, racentre, deccentre, distance):
+	ra, dec, racentre, deccentre = [numpy.radians(numpy.asarray(value, dtype=float)) for value in (ra, dec, racentre, deccentre)]
+	hav = numpy.sin((dec - deccentre)/2.0)**2.0 + numpy.cos(dec)*numpy.cos(deccentre)*numpy.sin((ra - racentre)/2.0)**2.0
+	separation = 2.0*numpy.arcsin(numpy.sqrt(numpy.clip(hav, 0.0, 1.0)))
+
+	return separation * distance * 1000.0
+
+
+# Line-of-sight velocities (km/s) relative to the cluster, in the cluster's rest frame, from the observed recession
+# velocities cz of the galaxies and the cluster
+def clustervelocity(velocity, clustervelocity):
+	return (numpy.asarray(velocity, dtype=float) - clustervelocity) / (1.0 + clustervelocity/c)
+
+
+# Monte Carlo samples of the 3D radius, speed, radial velocity, timescales and ram pressure for each of a set of
+# galaxies, shape (ngalaxies, nsamples) for each quantity. The line of sight is the z axis, with depth and vlos both
+# positive away from the observer, and the galaxy lies along the x axis in the plane of the sky, so the radial
+# velocity is (rproj vx + depth vlos) / r3d, negative for galaxies moving towards the centre. The infall time, the
+# time to reach the centre at the present radial speed, is NaN for galaxies moving outwards.
+def samplegalaxies(rng, rproj, vlos, nsamples, params):
+	rproj = numpy.asarray(rproj, dtype=float)[:,None]
+	vlos = numpy.asarray(vlos, dtype=float)[:,None]
+
+	# Depth along the line of sight, uniform along the chord through the sphere the members are spread over
+	halfchord = numpy.sqrt(numpy.maximum((params['rlimit']*params['r200'])**2.0 - rproj*rproj, 0.0))
+	depth = rng.uniform(-1.0, 1.0, (len(rproj), nsamples)) * halfchord
+	r3d = numpy.sqrt(rproj*rproj + depth*depth)
+
+	# Tangential velocity components from an isotropic distribution
+	vtangential = rng.normal(0.0, params['sigma'], (2, len(rproj), nsamples))
+	v3d = numpy.sqrt(vlos*vlos + vtangential[0]**2.0 + vtangential[1]**2.0)
+	with numpy.errstate(invalid='ignore', divide='ignore'):
+		vrad = (rproj*vtangential[0] + depth*vlos) / r3d
+
+	# Outward radial speeds are negative here, which solvetravel gives as NaN
+	tinfall = solvetravel(r3d, -vrad, None, 'kpc', 'km/s')['time_myr']
+	tcross = solvetravel(params['r200'], v3d, None, 'kpc', 'km/s')['time_myr']
+
+	# Ram pressure rho v^2 in dyn cm^-2, with v in cm/s
+	density = mu * protonmass * params['n0'] * (1.0 + (r3d/params['rc'])**2.0)**(-1.5*params['beta'])
+	pram = density * (v3d*1E5)**2.0
+
+	return {'r3d_kpc':r3d, 'v3d_kms':v3d, 'vrad_kms':vrad, 'tinfall_myr':tinfall, 'tcross_myr':tcross, 'pram_dyncm2':pram}
+
+
+# Summary statistics (16th, 50th and 84th percentiles) of the Monte Carlo samples for one chunk of galaxies. Takes
+# a single tuple so it can be mapped over processes.
+def chunktimescales(task):
+	seedseq, rproj, vlos, nsamples, params = task
+	samples = samplegalaxies(numpy.random.default_rng(seedseq), rproj, vlos, nsamples, params)
+
+	result = numpy.empty(len(rproj), dtype=timescaledtype)
+	result['rproj_kpc'] = rproj
+	result['vlos_kms'] = vlos
+	result['inbound_fraction'] = numpy.where(numpy.isfinite(rproj) & numpy.isfinite(vlos), numpy.mean(samples['vrad_kms'] < 0.0, axis=1), numpy.nan)
+	for quantity in quantities:
+		if quantity == 'tinfall_myr':
+			# Only over the inbound samples, and NaN for galaxies with none
+			with warnings.catch_warnings():
+				warnings.simplefilter('ignore', RuntimeWarning)
+				percentiles = numpy.nanpercentile(samples[quantity], [16.0, 50.0, 84.0], axis=1)
+		else:
+			percentiles = numpy.percentile(samples[quantity], [16.0, 50.0, 84.0], axis=1)
+		for statistic, values in zip(statistics, percentiles):
+			result[quantity+'_'+statistic] = values
+
+	return result
+
+
+# Timescales for a whole catalogue of galaxies, given their projected radii (kpc) and line-of-sight velocities
+# relative to the cluster (km/s). Galaxies are processed chunksize at a time with nsamples orientations each; with
+# nworkers > 1 the chunks are spread over that many processes. Returns a structured array with one row per galaxy.
+def timescales(rproj, vlos, params=defaultparams, nsamples=1000, chunksize=1000, seed=None, nworkers=1):
+	rproj = numpy.atleast_1d(numpy.asarray(rproj, dtype=float))
+	vlos = numpy.atleast_1d(numpy.asarray(vlos, dtype=float))
+	starts = range(0, len(rproj), chunksize)
+	seeds = numpy.random.SeedSequence(seed).spawn(len(starts))
+	tasks = [(seedseq, rproj[start:start+chunksize], vlos[start:start+chunksize], nsamples, params) for seedseq, start in zip(seeds, starts)]
+
+	if len(tasks) == 0:
+		return numpy.empty(0, dtype=timescaledtype)
+
+	if nworkers > 1 and len(tasks) > 1:
+		with ProcessPoolExecutor(max_workers=nworkers) as executor:
+			results = list(executor.map(chunktimescales, tasks))
+	else:
+		results = [chunktimescales(task) for task in tasks]
+
+	return numpy.concatenate(results)
+
+
+# Projected radii and line-of-sight velocities for one chunk of a table, given as a dictionary of its columns (see
+# TableIO.converttable). Radii come from an rproj column (kpc) or from ra and dec columns (degrees) with the cluster
+# centre and distance; velocities from a vlos column (km/s relative to the cluster) or from a velocity column of
+# recession velocities with the cluster's.
+def chunkinputs(table, cluster):
+	if 'rproj' in table:
+		rproj = tonumbers(table['rproj'])
+	else:
+		rproj = projectedradius(tonumbers(table['ra']), tonumbers(table['dec']), cluster['ra'], cluster['dec'], cluster['distance'])
+
+	if 'vlos' in table:
+		vlos = tonumbers(table['vlos'])
+	else:
+		vlos = clustervelocity(tonumbers(table['velocity']), cluster['velocity'])
+
+	return rproj, vlos
+
+
+# Timescales for one chunk of a table. The chunk's random numbers come from the seed spawned for its number from
+# the main one (given by its entropy), just as timescales does for its chunks, so the output doesn't depend on how
+# many processes the chunks are spread over.
+def tablechunk(table, number, entropy, cluster, params, nsamples):
+	rproj, vlos = chunkinputs(table, cluster)
+	result = chunktimescales((numpy.random.SeedSequence(entropy, spawn_key=(number,)), rproj, vlos, nsamples, params))
+
+	return [result[name] for name, dtype in timescaledtype]
+
+
+# Raise a ValueError if a table doesn't have the columns needed
+def checkcolumns(columns):
+	if 'rproj' not in columns and ('ra' not in columns or 'dec' not in columns):
+		raise ValueError('The table must have a header row with an rproj column, or ra and dec columns')
+	if 'vlos' not in columns and 'velocity' not in columns:
+		raise ValueError('The table must have a header row with a vlos or velocity column')
+
+
+# Timescales for a whole CSV table of cluster members, from an open input file to an open output file. The input
+# needs a header row with either an rproj column or ra and dec columns, and either a vlos or a velocity column (see
+# chunkinputs); cluster gives the centre (ra, dec in degrees), angular diameter distance (Mpc) and recession velocity
+# (km/s) of the cluster. All the input columns are copied to the output, followed by the timescales. The table is
+# read chunksize rows at a time, and with nworkers > 1 that many chunks are processed at once in separate processes.
+# Returns the number of rows converted.
+def convertcsv(infile, outfile, cluster, params=defaultparams, nsamples=1000, chunksize=1000, seed=None, nworkers=1):
+	convert = functools.partial(tablechunk, entropy=numpy.random.SeedSequence(seed).entropy, cluster=cluster, params=params, nsamples=nsamples)
+	incolumns = ['rproj', 'ra', 'dec', 'vlos', 'velocity']
+
+	return converttable(infile, outfile, convert, incolumns, [name for name, dtype in timescaledtype], checkcolumns, chunksize, nworkers)
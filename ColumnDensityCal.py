@@ -3,6 +3,8 @@
 # atoms per square cm and in solar masses per square parsec.
 
 import streamlit as st
+import numpy
+import os
 import math
 from math import pi as pi
 import imp
@@ -14,6 +16,21 @@ import NiceNumber
 imp.reload(NiceNumber)
 from NiceNumber import nicenumber
 
+# Column density maps from whole FITS images, plus the constants used here
+import ColumnDensityMap
+imp.reload(ColumnDensityMap)
+from ColumnDensityMap import amu, hiamu, solarmass, pc, msolpc2toatoms, beamtypes, mapunits, beamarea, totalmass, mapinfo, headerbeam, pixelarea, mapunitscale, columndensityfits
+
+# Sensitivity limits over grids of telescope parameters, cached on disk
+import SensitivityGrid
+imp.reload(SensitivityGrid)
+from SensitivityGrid import telescopes, loadgrid, interpolategrid, maxpoints
+
+# Cosmological distances, for sources given by redshift
+import CosmoDistance
+imp.reload(CosmoDistance)
+from CosmoDistance import cosmologies, angulardistance, redshiftmass
+
 # Callback function for setting checbox
 def reset_button():
 	st.session_state["dounitcheckbox"] = False
@@ -32,12 +49,8 @@ st.write('<style>div.block-container{padding-bottom:0rem;}</style>', unsafe_allo
 
 
 # MAIN CODE
-# Unit conversions
-amu = 1.660540199E-24	# In grams, for Avogadro's number
-hiamu = 1.00797
+# Unit conversions (the others are from ColumnDensityMap)
 navogadro = 6.02214076E23
-solarmass = 1.98847E30
-pc = 3.0856775812799588E16 # 1 pc in m
 
 
 st.write("# Compute HI column density")
@@ -111,7 +124,9 @@ if opmode == 'Telescope parameters':
 			dist = st.number_input("Distance to the source", value=1.0, key="dists")
 			
 		with right_column:
-			distunit = st.selectbox('Distance units', ('pc', 'kpc', 'Mpc'), index=2, key='distu')
+			distunit = st.selectbox('Distance units', ('pc', 'kpc', 'Mpc', 'z'), index=2, key='distu', help='Use z to give the redshift instead, for distant sources. The mass then uses the luminosity distance and the beam size the angular diameter distance')
+			if distunit == 'z':
+				cosmo = st.selectbox('Cosmology', tuple(cosmologies), key='cosmo')
 			
 	
 	# Beam size parameters
@@ -142,6 +157,10 @@ if opmode == 'Telescope parameters':
 		
 	if distunit == 'pc':
 		distance = dist/1000000.0
+
+	# For redshifts, the distance used for the beam size is the angular diameter distance
+	if distunit == 'z':
+		distance = float(angulardistance(dist, cosmo))
 		
 	if runit == 'Jy':
 		rmsnoise = rms
@@ -156,14 +175,18 @@ if opmode == 'Telescope parameters':
 		lwuse = lw
 
 	if lwunit == 'm/s':
-		lwuse = lw*1000.0
+		lwuse = lw/1000.0
 		
 
 	# Now we can calculate the HI mass in standard units. Distance is set by default to 1 Mpc so we can always calculate this.
 	# Distance cancels with beam area when doing the NHI calculation, so the distance and its unit don't actually matter for that,
-	# but this calculation will be wrong for the mass itself unless the user provides the correct value.
+	# but this calculation will be wrong for the mass itself unless the user provides the correct value. Redshifts are the
+	# exception, since the luminosity and angular diameter distances differ by (1+z)^2.
 	massunit = 'Linear solar mass'		
-	himass = 2.36E5* distance*distance* lw * snr * rmsnoise
+	himass = 2.36E5* distance*distance* lwuse * snr * rmsnoise
+	# At a given redshift, the mass uses the luminosity distance instead
+	if distunit == 'z':
+		himass = float(redshiftmass(lwuse * snr * rmsnoise, dist, cosmo))
 				
 
 # First do the mass conversions. We need to have mass in both atoms and linear solar masses. Do the conversion into linear 
@@ -220,12 +243,12 @@ if sizeunit == 'Arcminutes':
 	hiradm = hiradpc * pc
 
 if sizeunit == 'Arcseconds':
-	hiradpc = ((hirad/3660.0) / 360.0) * 2.0 * pi * distance * 1000000.0
+	hiradpc = ((hirad/3600.0) / 360.0) * 2.0 * pi * distance * 1000000.0
 	hiradm = hiradpc * pc
 
 
 # Finally we can actually compute column density !
-if hirad > 0.0:	# Avoid divide by zero error
+if hirad > 0.0 and hiradpc > 0.0:	# Avoid divide by zero error
 	nhi_atomssqcm = hinatoms / (pi * (hiradm*100.0)**2.0)
 	ni_msolsqpc = hisolarmasses / (pi * hiradpc**2.0)
 
@@ -237,3 +260,103 @@ if hirad > 0.0:	# Avoid divide by zero error
 if opmode == 'Telescope parameters':	
 	if st.session_state['domassconvert'] == True:
 		st.write("#### Total HI mass = "+str(nicenumber(himass))+'&thinsp;M<sub style="font-size:60%">&#9737;</sub>', unsafe_allow_html=True)
+
+
+# SENSITIVITY TABLES
+# Column density limits over whole ranges of beam size, rms and line width, for comparing telescopes. The grid is
+# only calculated the first time a given set of ranges is used, after which it's read from disk.
+st.write('###')
+st.write('#### Sensitivity tables')
+if st.checkbox('Compare sensitivity limits over ranges of parameters', key='dogrid', help='Column density limits for several telescopes over ranges of rms and line width'):
+	st.write('Column density limits for a source filling a Gaussian beam, over a grid of beam FWHM, rms and line width at the given S/N. The grid is saved to disk, and limits for any values within it are interpolated from it.')
+
+	col1, col2, col3, col4 = st.columns(4)
+	with col1:
+		gridsnr = st.number_input('S/N', value=5.0, min_value=0.001, key='gridsnr')
+		gridn = st.number_input('Grid points per axis', value=100, min_value=2, max_value=maxpoints, key='gridn', help='The grid holds this number cubed of values')
+	with col2:
+		gridbeam = st.slider('Beam FWHM (arcseconds)', min_value=1.0, max_value=1200.0, value=(5.0, 900.0), key='gridbeam')
+	with col3:
+		gridrms = st.slider('rms (mJy)', min_value=0.001, max_value=100.0, value=(0.01, 10.0), key='gridrms')
+	with col4:
+		gridwidth = st.slider('Line width (km/s)', min_value=0.1, max_value=1000.0, value=(1.0, 500.0), key='gridwidth')
+
+	grid = loadgrid(gridbeam + (gridn,), gridrms + (gridn,), gridwidth + (gridn,), gridsnr)
+
+	gridscopes = st.multiselect('Telescopes', tuple(telescopes), default=['Arecibo (ALFA)', 'ASKAP (WALLABY)', 'MeerKAT (MIGHTEE-HI)'], key='gridscopes', help='Limits are only given for beams, rms and line widths within the grid ranges')
+	col1, col2 = st.columns(2)
+	with col1:
+		queryrms = st.number_input('rms (mJy)', value=1.0, min_value=0.001, format='%.3f', key='queryrms')
+	with col2:
+		querywidth = st.number_input('Line width (km/s)', value=10.0, min_value=0.0, key='querywidth')
+
+	scopebeams = numpy.array([telescopes[name] for name in gridscopes])
+	querynhi = interpolategrid(grid, scopebeams, queryrms, querywidth)
+	if numpy.isnan(querynhi).any():
+		st.write('Some values are outside the grid ranges, so have no limit. Please widen the ranges above.')
+	st.dataframe({'Telescope': gridscopes, 'Beam FWHM (arcsec)': scopebeams, 'N_HI limit (atoms cm^-2)': querynhi, 'N_HI limit (Msolar pc^-2)': querynhi/msolpc2toatoms}, hide_index=True)
+
+	# Limits against rms for each telescope, at the line width given
+	chartdata = {'log(rms / mJy)': numpy.log10(grid['rms'])}
+	for name, beam in zip(gridscopes, scopebeams):
+		chartdata[name] = numpy.log10(interpolategrid(grid, beam, grid['rms'], querywidth))
+	st.write('log(N_HI limit / atoms cm<sup style="font-size:60%">-2</sup>) against rms at the line width given :', unsafe_allow_html=True)
+	st.line_chart(chartdata, x='log(rms / mJy)')
+
+
+# COLUMN DENSITY MAPS
+# Converts a whole FITS map (e.g. a moment-0 map) to column density. Files are read from a local path rather than
+# uploaded, since maps can be several GB; they're converted a strip at a time and written straight to disk.
+st.write('###')
+st.write('#### Column density maps')
+if st.checkbox('Convert a FITS map to column density', key='domap', help='Convert every pixel of a flux density or moment-0 map to column density'):
+	st.write('Give the path to a 2D FITS map on this machine, in Jy/beam (per channel) or Jy/beam km/s (integrated, e.g. a moment-0 map), according to its BUNIT. The beam is taken from the header (BMAJ and BMIN) if given, otherwise from the values below. The channel width is only used if the map isn\'t already integrated over velocity. The map is never loaded into memory, so this works for maps of any size.')
+
+	left_column, right_column = st.columns(2)
+
+	with left_column:
+		mapfile = st.text_input('FITS map', key='mapfile', help='Path to the FITS map')
+		mapchan = st.number_input('Channel width (km/s)', value=10.0, min_value=0.0, key='mapchan', help='Velocity width of the channel, if the map is of flux density rather than integrated flux')
+		mapdist = st.number_input('Distance (Mpc)', value=0.0, min_value=0.0, key='mapdist', help='Optional, to give the total HI mass in the map')
+
+	with right_column:
+		mapbeam = st.number_input('Beam size (arcseconds)', value=0.0, min_value=0.0, key='mapbeam', help='Only used if the header has no beam size')
+		mapbeamtype = st.selectbox('Beam size type', beamtypes, index=2, key='mapbeamtype', help='FWHM of a Gaussian beam, or the radius or diameter of a top-hat beam')
+		mapunit = st.selectbox('Output unit', tuple(mapunits), key='mapunit')
+
+	if mapfile != '':
+		try:
+			mapheader, maphdu, mapshape = mapinfo(mapfile)
+			mapscale = mapunitscale(mapheader.get('BUNIT', 'Jy/beam'))
+		except (OSError, ValueError) as err:
+			st.write('#### Could not read the map : '+str(err))
+			mapheader = None
+
+		if mapheader is not None:
+			# Beam from the header, if given
+			beam = headerbeam(mapheader)
+			if beam is not None:
+				omega = beamarea(beam[0], beam[1], 'FWHM')
+				st.write('Map of',str(mapshape[1]),'x',str(mapshape[0]),'pixels in',mapheader.get('BUNIT', 'Jy/beam (assumed)'),'with a beam of',nicenumber(beam[0]*3600.0),'x',nicenumber(beam[1]*3600.0),'arcseconds (FWHM) from the header.')
+			else:
+				omega = beamarea(mapbeam/3600.0, None, mapbeamtype)
+				st.write('Map of',str(mapshape[1]),'x',str(mapshape[0]),'pixels in',mapheader.get('BUNIT', 'Jy/beam (assumed)')+'. No beam size in the header.')
+
+			if mapscale[1] is not None:
+				st.write('The map is integrated over velocity, so the channel width isn\'t used.')
+
+			if omega <= 0.0:
+				st.write('#### Please enter the beam size.')
+			else:
+				mapbase = mapfile[:-5] if mapfile.lower().endswith('.fits') else mapfile
+				mapout = st.text_input('Output file', mapbase+'_nhi.fits')
+
+				if st.button('Write', type='primary', key='mapwrite'):
+					# Never overwrite an existing file, particularly not the input map
+					if os.path.exists(mapout):
+						st.write('#### Output file already exists, please choose another name.')
+					else:
+						npixels, pixelsum, maximum = columndensityfits(mapfile, mapout, omega, mapchan, mapunit)
+						st.write('Written to',mapout+'. Maximum column density :',nicenumber(maximum),mapunit.replace('^-2', '<sup style="font-size:60%">-2</sup>'), unsafe_allow_html=True)
+						if mapdist > 0.0:
+							st.write("#### Total HI mass in the map = "+str(nicenumber(totalmass(pixelsum, pixelarea(mapheader), omega, mapdist)))+'&thinsp;M<sub style="font-size:60%">&#9737;</sub>', unsafe_allow_html=True)
@@ -0,0 +1,195 @@
+# HI column density maps. Converts whole 2D maps of flux density (per channel, or already integrated over velocity
+# as in a moment-0 map) into HI column density, in atoms cm^-2 or Msolar pc^-2, for a given beam and channel width.
+# All the constants are combined into a single factor per map, so each pixel takes one multiplication. FITS images
+# are read and converted a strip of rows at a time, with the output written with a StreamingHDU, so maps of any
+# size (e.g. 16k x 16k) are converted within a fixed memory budget. Used by ColumnDensityCal.py.
+
+import numpy
+import re
+from astropy.io import fits
+from astropy import wcs
+from astropy.wcs import utils as wcsutils
+
+
+# Constants, as in ColumnDensityCal.py
+amu = 1.660540199E-24	# In grams, for Avogadro's number
+hiamu = 1.00797
+solarmass = 1.98847E30
+pc = 3.0856775812799588E16 # 1 pc in m
+
+# HI mass in Msolar is himassfactor * D^2 * S, for D in Mpc and S in Jy km/s
+himassfactor = 2.36E5
+
+# Atoms cm^-2 in 1 Msolar pc^-2
+msolpc2toatoms = (solarmass*1000.0 / (hiamu*amu)) / (pc*100.0)**2.0
+
+# Beam sizes can be given as the radius or diameter of a top-hat beam, or as the FWHM of a Gaussian beam
+beamtypes = ['Radius', 'Diameter', 'FWHM']
+
+# Scale factors to Jy/beam for the flux units allowed in BUNIT, and to km/s for integrated maps (by the length unit
+# of the velocity, which is always per second)
+fluxunits = {'jy':1.0, 'mjy':1E-3, 'ujy':1E-6}
+velunits = {'km':1.0, 'm':1E-3}
+
+# Output units, and the BUNIT written to the header for each
+mapunits = {'atoms cm^-2':'cm-2', 'Msolar pc^-2':'solMass/pc2'}
+
+
+# Beam solid angle (steradians) from the beam size in degrees. For Gaussian beams the major and minor axis FWHM are
+# used; for top-hat beams only the major axis is used.
+def beamarea(major, minor=None, beamtype='FWHM'):
+	major = numpy.radians(major)
+	minor = major if minor is None else numpy.radians(minor)
+
+	if beamtype == 'FWHM':
+		return numpy.pi * major * minor / (4.0*numpy.log(2.0))
+	if beamtype == 'Diameter':
+		return numpy.pi * (major/2.0)**2.0
+
+	return numpy.pi * major**2.0
+
+
+# Factor converting flux density (Jy/beam), or integrated flux (Jy/beam km/s) if the channel width is one, to column
+# density in the given units. The mass in a beam is himassfactor D^2 S dv and its area is omega (10^6 D)^2 pc^2,
+# so the distance cancels.
+def columnfactor(omega, chanwidth=1.0, units='atoms cm^-2'):
+	factor = himassfactor * chanwidth / (omega * 1E12)
+	if units == 'atoms cm^-2':
+		factor = factor * msolpc2toatoms
+
+	return factor
+
+
+# Column density map from a flux map, using a factor from columnfactor. NaN (blanked) pixels stay NaN. The output
+# can be given to avoid allocating a new array.
+def columndensity(fluxmap, factor, out=None):
+	return numpy.multiply(fluxmap, factor, out=out)
+
+
+# Total HI mass (Msolar) from the sum of the pixel values of a map (Jy/beam km/s), given the pixel and beam solid
+# angles and the distance in Mpc
+def totalmass(pixelsum, pixelarea, omega, distance):
+	return himassfactor * distance*distance * pixelsum * pixelarea / omega
+
+
+# Scale factors from the map's BUNIT to Jy/beam, and to km/s if the map is already integrated over velocity (None if
+# not). The unit is read as a product of factors separated by spaces, dots or asterisks, each optionally with a
+# power (e.g. s-1 or s^-1) and with / dividing by the next factor only, so e.g. Jy/beam km/s, Jy km/s/beam and
+# mJy beam-1 km s-1 are all understood. Maps with no BUNIT are assumed to be Jy/beam. Anything else, including
+# brightness temperature, raises a ValueError.
+def mapunitscale(bunit):
+	text = bunit.strip().lower()
+	if text == '':
+		return 1.0, None
+
+	powers = {}
+	divide = False
+	for token in re.findall(r'/|[^\s.*/]+', text):
+		if token == '/':
+			divide = True
+			continue
+		match = re.fullmatch(r'([a-z]+)\^?\(?([+-]?\d+)?\)?', token)
+		if match is None:
+			raise ValueError('Unrecognised map unit '+bunit)
+		power = int(match.group(2)) if match.group(2) is not None else 1
+		powers[match.group(1)] = powers.get(match.group(1), 0) + (-power if divide else power)
+		divide = False
+
+	if 'k' in powers:
+		raise ValueError('Maps in brightness temperature ('+bunit+') aren\'t supported, please convert to Jy/beam first')
+
+	flux = [unit for unit in fluxunits if powers.get(unit, 0) == 1]
+	velocity = [unit for unit in velunits if powers.get(unit, 0) == 1]
+	expected = {'beam':-1}
+	if len(flux) == 1:
+		expected[flux[0]] = 1
+	if len(velocity) == 1:
+		expected[velocity[0]] = 1
+		expected['s'] = -1
+	if len(flux) != 1 or len(velocity) > 1 or {unit:power for unit, power in powers.items() if power != 0} != expected:
+		raise ValueError('Unrecognised map unit '+bunit+', please use Jy/beam or Jy/beam km/s')
+
+	return fluxunits[flux[0]], velunits[velocity[0]] if len(velocity) == 1 else None
+
+
+# Header of the first image HDU in the file, its index, and the shape of its data with any length-one axes (e.g.
+# the frequency and Stokes axes of a moment-0 map) removed. Only the header is read.
+def mapinfo(filename):
+	with fits.open(filename, memmap=True) as hdul:
+		for i, hdu in enumerate(hdul):
+			if hdu.header.get('NAXIS', 0) >= 2:
+				header = hdu.header.copy()
+				shape = tuple(header['NAXIS'+str(axis)] for axis in range(header['NAXIS'], 0, -1))
+				mapshape = tuple(n for n in shape[:-2] if n > 1) + shape[-2:]
+				if len(mapshape) > 2:
+					raise ValueError('The image must be a 2D map, not a cube')
+				return header, i, mapshape
+
+	raise ValueError('No image found in the file')
+
+
+# Beam size (major and minor FWHM in degrees) from the header, or None if it isn't given
+def headerbeam(header):
+	if 'BMAJ' in header and 'BMIN' in header:
+		return header['BMAJ'], header['BMIN']
+
+	return None
+
+
+# Solid angle of one pixel in steradians, from the celestial WCS
+def pixelarea(header):
+	celestial = wcs.WCS(header).celestial
+
+	return wcsutils.proj_plane_pixel_area(celestial) * (numpy.pi/180.0)**2.0
+
+
+# Convert a FITS map to column density and write it to a new file, a strip of rows at a time, each no more than
+# maxbytes (as 64-bit floats; the memory used is a few times this). The beam solid angle is from beamarea; the channel width (km/s) is only used if the map isn't already
+# integrated over velocity. Returns the number of valid pixels, the sum of the integrated flux (Jy/beam km/s) and
+# the maximum column density, so the total mass can be found with totalmass without reading the map again.
+def columndensityfits(infile, outfile, omega, chanwidth=1.0, units='atoms cm^-2', maxbytes=64*1024**2):
+	header, hduindex, mapshape = mapinfo(infile)
+	fluxscale, velscale = mapunitscale(header.get('BUNIT', 'Jy/beam'))
+	velocity = chanwidth if velscale is None else velscale
+	# Flux in Jy/beam km/s per unit of the map, and the column density for each of those
+	intscale = fluxscale * velocity
+	factor = columnfactor(omega, intscale, units)
+
+	outheader = header.copy()
+	outheader['BITPIX'] = -32
+	outheader['BUNIT'] = mapunits[units]
+	for key in ['BSCALE', 'BZERO', 'BLANK']:
+		outheader.remove(key, ignore_missing=True)
+
+	npixels = 0
+	pixelsum = 0.0
+	maximum = numpy.nan
+	with fits.open(infile, memmap=False, do_not_scale_image_data=True) as hdul:
+		# Strips are read with section, which reads only those rows from the file. A memory map of the whole file
+		# would keep every page read so far resident, so the memory used would grow with the size of the map.
+		section = hdul[hduindex].section
+		leading = (0,) * (header['NAXIS'] - 2)
+		bscale = header.get('BSCALE', 1.0)
+		bzero = header.get('BZERO', 0.0)
+		blank = header.get('BLANK', None) if header['BITPIX'] > 0 else None
+
+		outhdu = fits.StreamingHDU(outfile, outheader)
+		nrows = max(int(maxbytes // (8*mapshape[1])), 1)
+		for start in range(0, mapshape[0], nrows):
+			raw = section[leading + (slice(start, start+nrows),)]
+			strip = raw.astype(numpy.float64)
+			if blank is not None:
+				strip[raw == blank] = numpy.nan
+			if bscale != 1.0 or bzero != 0.0:
+				strip = strip*bscale + bzero
+			del raw
+
+			npixels = npixels + int(numpy.isfinite(strip).sum())
+			pixelsum = pixelsum + float(numpy.nansum(strip)) * intscale
+			columndensity(strip, factor, out=strip)
+			maximum = numpy.fmax(maximum, numpy.fmax.reduce(strip, axis=None))
+
+			outhdu.write(strip.astype('>f4'))
+		outhdu.close()
+
+	return npixels, pixelsum, maximum
@@ -0,0 +1,91 @@
+# Cosmological distances for the size, mass and column density calculators, which otherwise assume Euclidean
+# distances (fine for z < 0.1 or so, but not for deeper surveys). Rather than integrating the Friedmann equation
+# for every value, the comoving distance is tabulated once per cosmology on an evenly-spaced grid of redshift, along
+# with its derivative (the Hubble distance divided by E(z)), and any number of redshifts are then looked up at once
+# by cubic Hermite interpolation. The angular diameter and luminosity distances follow from the comoving distance.
+
+import numpy
+from astropy import cosmology
+
+
+# Available cosmologies. The astropy realisations, plus a simple flat model for comparison with older work.
+cosmologies = {'Planck18':cosmology.Planck18, 'Planck15':cosmology.Planck15, 'WMAP9':cosmology.WMAP9,
+               'Flat LCDM (H0=70, Om0=0.3)':cosmology.FlatLambdaCDM(H0=70.0, Om0=0.3, Tcmb0=2.725)}
+
+# Redshift range and spacing of the tables
+zmax = 20.0
+zstep = 1E-3
+
+# Tables already calculated, one per cosmology
+tables = {}
+
+
+# Comoving distance (Mpc) and its derivative with respect to redshift at every point of the grid, for the named
+# cosmology, calculated the first time it's asked for. Each step of the integral of 1/E(z) uses Simpson's rule
+# with the value halfway between the grid points.
+def distancetable(name='Planck18'):
+	if name not in tables:
+		cosmo = cosmologies[name]
+		hubbledistance = cosmo.hubble_distance.to_value('Mpc')
+
+		z = numpy.arange(0.0, zmax + zstep/2.0, zstep)
+		inve = cosmo.inv_efunc(z)
+		invemid = cosmo.inv_efunc(z[:-1] + zstep/2.0)
+		steps = (zstep/6.0) * (inve[:-1] + 4.0*invemid + inve[1:])
+
+		comoving = hubbledistance * numpy.concatenate(([0.0], numpy.cumsum(steps)))
+		tables[name] = (comoving, hubbledistance*inve, hubbledistance, cosmo.Ok0)
+
+	return tables[name]
+
+
+# Comoving line-of-sight distance (Mpc) at redshift(s) z. Redshifts outside the table give NaN.
+def comovingdistance(z, name='Planck18'):
+	comoving, derivative, hubbledistance, curvature = distancetable(name)
+	z = numpy.asarray(z, dtype=float)
+
+	# Index of the grid point below each redshift, and the fractional position to the next one
+	with numpy.errstate(invalid='ignore'):
+		position = z / zstep
+		valid = (position >= 0.0) & (position <= len(comoving) - 1)
+		index = numpy.clip(numpy.where(valid, position, 0.0).astype(numpy.intp), 0, len(comoving) - 2)
+	t = position - index
+
+	# Cubic Hermite basis functions, using the values and derivatives at both ends of the interval
+	t2 = t*t
+	t3 = t2*t
+	result = ((2.0*t3 - 3.0*t2 + 1.0)*comoving[index] + (t3 - 2.0*t2 + t)*zstep*derivative[index]
+	         + (3.0*t2 - 2.0*t3)*comoving[index+1] + (t3 - t2)*zstep*derivative[index+1])
+
+	return numpy.where(valid, result, numpy.nan)
+
+
+# Transverse comoving distance (Mpc), which differs from the line-of-sight one only for curved cosmologies
+def transversedistance(z, name='Planck18'):
+	comoving = comovingdistance(z, name)
+	hubbledistance, curvature = distancetable(name)[2:4]
+
+	if curvature > 0.0:
+		return hubbledistance / numpy.sqrt(curvature) * numpy.sinh(numpy.sqrt(curvature) * comoving / hubbledistance)
+	if curvature < 0.0:
+		return hubbledistance / numpy.sqrt(-curvature) * numpy.sin(numpy.sqrt(-curvature) * comoving / hubbledistance)
+
+	return comoving
+
+
+# Angular diameter distance (Mpc) at redshift(s) z
+def angulardistance(z, name='Planck18'):
+	return transversedistance(z, name) / (1.0 + numpy.asarray(z, dtype=float))
+
+
+# Luminosity distance (Mpc) at redshift(s) z
+def luminositydistance(z, name='Planck18'):
+	return transversedistance(z, name) * (1.0 + numpy.asarray(z, dtype=float))
+
+
+# HI mass (Msolar) from the integrated flux (Jy km/s, with the velocity width measured in the observed frame) of a
+# source at redshift(s) z, M = 2.36E5 D_L^2 S / (1+z)
+def redshiftmass(flux, z, name='Planck18'):
+	z = numpy.asarray(z, dtype=float)
+
+	return 2.36E5 * luminositydistance(z, name)**2.0 * numpy.asarray(flux, dtype=float) / (1.0 + z)
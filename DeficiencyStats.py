@@ -0,0 +1,94 @@
+# Binned statistics of HI deficiency as a function of environment, with bootstrap confidence intervals. Since the
+# scatter on individual deficiencies is +/- ~0.3-0.4, what's actually meaningful is the mean deficiency and the
+# fraction of deficient galaxies in bins of projected cluster-centric radius (or any other quantity).
+# Resampling is done with arrays of random indices, so each batch of bootstrap samples is a handful of numpy
+# operations rather than a loop over samples. Batches can be spread over several processes.
+
+import numpy
+from concurrent.futures import ProcessPoolExecutor
+
+
+# Number of galaxies, mean deficiency and deficient fraction for each bin. Bin numbers run from 0 to nbins-1.
+def binstats(binnumber, hidef, nbins, deflimit):
+	counts = numpy.bincount(binnumber, minlength=nbins)
+	sums   = numpy.bincount(binnumber, weights=hidef, minlength=nbins)
+	ndefic = numpy.bincount(binnumber, weights=(hidef > deflimit), minlength=nbins)
+
+	with numpy.errstate(invalid='ignore', divide='ignore'):
+		meandef = sums / counts
+		fracdef = ndefic / counts
+
+	return counts, meandef, fracdef
+
+
+# One batch of bootstrap resamples. Galaxies are resampled with replacement within each bin, so every resample
+# has the same number of galaxies per bin as the data.
+def bootstrapbatch(task):
+	seedseq, nsamples, binnumber, hidef, nbins, deflimit = task
+	rng = numpy.random.default_rng(seedseq)
+
+	# Galaxies sorted by bin, so each bin is a contiguous block and resampling within a bin is just a random
+	# offset into its block
+	order = numpy.argsort(binnumber, kind='stable')
+	sortedbins = binnumber[order]
+	starts = numpy.searchsorted(sortedbins, sortedbins, side='left')
+	sizes  = numpy.searchsorted(sortedbins, sortedbins, side='right') - starts
+
+	index = order[starts + (rng.random((nsamples, len(order))) * sizes).astype(int)]
+	resampled = hidef[index]
+
+	# Since the bin sizes never change, the sums over each (non-empty) bin's block are all that's needed
+	occupied = numpy.unique(sortedbins)
+	blockstarts = numpy.searchsorted(sortedbins, occupied)
+	blocksizes  = numpy.bincount(sortedbins, minlength=nbins)[occupied]
+
+	meandef = numpy.full((nsamples, nbins), numpy.nan)
+	fracdef = numpy.full((nsamples, nbins), numpy.nan)
+	if len(occupied) > 0:
+		meandef[:, occupied] = numpy.add.reduceat(resampled, blockstarts, axis=1) / blocksizes
+		fracdef[:, occupied] = numpy.add.reduceat(resampled > deflimit, blockstarts, axis=1) / blocksizes
+
+	return meandef, fracdef
+
+
+# Mean deficiency and deficient fraction in bins of radius (or any other quantity), with bootstrap confidence
+# intervals. Galaxies with NaN deficiency or outside the bin edges are ignored. Returns the number of galaxies
+# in each bin, the mean deficiency and deficient fraction, and the lower and upper limits of each at the given
+# confidence level (as arrays of shape (2, bins)).
+def deficiencyprofile(radius, hidef, binedges, deflimit=0.3, nboot=5000, confidence=0.68, seed=None, batchsize=500, nworkers=1):
+	radius = numpy.asarray(radius, dtype=float)
+	hidef  = numpy.asarray(hidef, dtype=float)
+	nbins = len(binedges) - 1
+
+	binnumber = numpy.digitize(radius, binedges) - 1
+	good = numpy.isfinite(hidef) & (binnumber >= 0) & (binnumber < nbins)
+	binnumber = binnumber[good]
+	hidef = hidef[good]
+
+	counts, meandef, fracdef = binstats(binnumber, hidef, nbins, deflimit)
+
+	# Bootstrap in batches, each with its own seed, so memory is bounded by the batch size and the result
+	# doesn't depend on the number of processes
+	nbatches = int(numpy.ceil(nboot / batchsize))
+	seeds = numpy.random.SeedSequence(seed).spawn(nbatches)
+	tasks = [(seeds[i], min(batchsize, nboot - i*batchsize), binnumber, hidef, nbins, deflimit) for i in range(nbatches)]
+
+	if nworkers > 1:
+		with ProcessPoolExecutor(max_workers=nworkers) as executor:
+			results = list(executor.map(bootstrapbatch, tasks))
+	else:
+		results = [bootstrapbatch(task) for task in tasks]
+
+	bootmean = numpy.concatenate([result[0] for result in results])
+	bootfrac = numpy.concatenate([result[1] for result in results])
+
+	# Empty bins have no resamples, so their limits are left as NaN
+	occupied = counts > 0
+	percentiles = [50.0*(1.0 - confidence), 50.0*(1.0 + confidence)]
+	meanlimits = numpy.full((2, nbins), numpy.nan)
+	fraclimits = numpy.full((2, nbins), numpy.nan)
+	if occupied.any():
+		meanlimits[:, occupied] = numpy.percentile(bootmean[:, occupied], percentiles, axis=0)
+		fraclimits[:, occupied] = numpy.percentile(bootfrac[:, occupied], percentiles, axis=0)
+
+	return counts, meandef, fracdef, meanlimits, fraclimits
@@ -2,11 +2,9 @@
 # astronomical conventional units
 
 import streamlit as st
-import astropy
-from astropy import units as u
-from astropy.constants import M_sun
-from astropy.constants import G
-from astropy.constants import pc
+import numpy
+import io
+import csv
 import imp
 import math as maths
 
@@ -16,6 +14,16 @@ import NiceNumber
 imp.reload(NiceNumber)
 from NiceNumber import nicenumber
 
+# Dynamical mass, circular speed and radius for single values or whole rotation curves
+import Dynamics
+imp.reload(Dynamics)
+from Dynamics import solvedynamics, dynamicsdtype, axialratio, inclinations, inclinationdtype, correctedspeed
+
+# Dark matter halo fits to rotation curves with fixed stellar and gas components
+import RotationCurveFit
+imp.reload(RotationCurveFit)
+from RotationCurveFit import halos, fitdtype, fitgalaxies, packcurves, modelcurves
+
 
 # STREAMLIT STYLE
 # Remove the menu button
@@ -64,65 +72,6 @@ with col6:
     dynamical_mass_unit = st.selectbox("Dynamical mass unit", ("kg", "Msolar", "log(Msolar)"), index=1)
 
 
-# Unit conversions. Calculations will be done in SI units
-def distance_metres(input_value, input_unit_type):
-	if input_unit_type == 'm':
-		si_distance = input_value
-	
-	if input_unit_type == 'pc':
-		si_distance = u.pc.to(u.m, input_value)
-	
-	if input_unit_type == 'kpc':
-		si_distance = u.kpc.to(u.m, input_value)
-		
-	return si_distance
-	
-def circular_ms(input_value, input_unit_type):
-	if input_unit_type == 'm/s':
-		si_speed = input_value
-	
-	if input_unit_type == 'km/s':
-		si_speed = input_value*1000.0
-		
-	if input_unit_type == 'mph':
-		si_speed = (input_value*1609.344)/3600.0
-		
-	return si_speed
-	
-def mass_kg(input_value, input_unit_type):
-	if input_unit_type == 'kg':
-		si_mass = input_value
-		
-	if input_unit_type == 'Msolar':
-		si_mass = input_value*M_sun.value	# Use the astropy constant
-		
-	if input_unit_type == 'log(Msolar)':
-		msol_linear = 10.0**input_value
-		si_mass = msol_linear*M_sun.value	# Use the astropy constant
-		
-	return si_mass
-	
-	
-# Inclination correction for velocity. Retrieves inclination angles from the GUI, but since velocity may 
-# be calculated from the other parameters, it must be an input parameter here
-def incvel(rawvel):
-	# Thin disc correction
-	if simple_i == 0.0:
-		thindisc_vcorr = None
-	else:
-		thindisc_vcorr = rawvel / maths.sin(maths.radians(simple_i))
-		
-	if complex_i == 0.0:
-		thickdisc_vcorr = None
-	else:
-		thickdisc_vcorr = rawvel / maths.sin(maths.radians(complex_i))
-
-	# Values are set to None if incalculable. Since these are the defaults used for the local variables 
-	# in the main code, this avoids some extra checks that the calculation was done
-		
-	return thindisc_vcorr, thickdisc_vcorr
-	
-
 # Option inclination angle correction
 correctangle = st.toggle('Inclination correction', help='Enable this if you need to correct for the inclination angle. Only applies if the circular speed is input directly, not if calculated from other parameters')
 
@@ -130,7 +79,7 @@ if correctangle == True:
 	st.write("Enter either the major and minor axis dimensions, or directly the axial ratio b/a if known. If a, b and q are all entered, q will be calculated from the a and b entries. You'll also need the intrinstic axial ratio and a systematic correction. Note that as well as the standard Hubble estimate, the inclination will also be estimated assuming a simple thin circular disc.")
 	st.write("The inclination correction will only be applied in the case that velocity is known, not when calculated from mass and radius.")
 
-	col1, col2, col3, col4, col5 = st.columns(5)
+	col1, col2, col3, col4, col5, col6 = st.columns(6)
 	
 	with col1:
 		majoraxis = st.number_input('a', help="Major axis. Units don't matter as long as they're consistent with the minor axis", min_value=0.0)
@@ -139,35 +88,31 @@ if correctangle == True:
 	with col3:
 		axialratio_obs = st.number_input('q', help="Observed axial ratio. If you already know this enter it here, otherwise fill in the a and b parameters. This value will only be used if either a or b are zero", min_value=0.0, max_value=1.0)
 	with col4:
-		axialratio_act = st.number_input('q0', help="Intrinsic axial ratio - the axial ratio which would be observed if face-on. Generally assumed to be between 0.1 and 0.2", value=0.2, min_value=0.0, max_value=1.0)
+		axialratio_err = st.number_input('q error', help="Uncertainty in the observed axial ratio (however it was found), used to estimate the uncertainty in the inclination, corrected speed and mass. Leave at zero to ignore", min_value=0.0, max_value=1.0, key='qerr')
 	with col5:
+		axialratio_act = st.number_input('q0', help="Intrinsic axial ratio - the axial ratio which would be observed if face-on. Generally assumed to be between 0.1 and 0.2", value=0.2, min_value=0.0, max_value=1.0)
+	with col6:
 		sys_i = st.number_input('Systematic', help="Systematic angle correction in degrees. Inclination angles tend to give values which are slightly too low. Generally a correction of 3 degrees is applied", value=3.0, min_value=0.0, max_value=90.0)
 
 
-	# Thin circular disc estimate. Set to a default of zero and calculate if possible. This will be shown to the user in an (editable)
-	# parameter input box below
-	thindisc_i = 0.0
-	
-	# a, b both known : use this to calculate q. Ignore the value of q in the input box.
-	if (majoraxis != 0.0 and minoraxis != 0.0) and (majoraxis >= minoraxis):
-		axialratio_obs = minoraxis/majoraxis
-		
-	# But if q is known and either a or b are unknown, use the input q value
-	if (majoraxis == 0.0 or minoraxis == 0.0) and axialratio_obs != 0.0:
-		axialratio_obs = axialratio_obs
-	
-	# As long as the ratio is non-zero, we can calculate inclination angle	
-	if axialratio_obs != 0.0:
-		thindisc_i = maths.degrees(maths.acos(axialratio_obs))
-		
-		
-	# Complex calculation
-	thickdisc_i = 0.0
-	
-	# Add some tolerance : if we use exactly one, rounding errors cause problems when the input a and b
-	# values are seemingly exactly equal
-	if axialratio_obs <= (1.0-0.0001) and axialratio_obs > 0.0:
-		thickdisc_i = maths.degrees(maths.sqrt(maths.acos( (axialratio_obs**2.0 - axialratio_act**2.0) / (1.0 - axialratio_act**2.0) ))) + sys_i
+	# Axial ratio from a and b if both are given, otherwise the q entered directly, and the thin and thick disc
+	# inclinations. These are NaN if they can't be calculated (e.g. a face-on disc), in which case the defaults of
+	# zero (no correction) are shown in the (editable) parameter input boxes below.
+	axialratio_obs = axialratio(majoraxis, minoraxis, axialratio_obs)[0]
+	discincl = inclinations(axialratio_obs, axialratio_act, sys_i, axialratio_err)
+
+	thindisc_i  = float(numpy.nan_to_num(discincl['incl_thin']))
+	thickdisc_i = float(numpy.nan_to_num(discincl['incl_thick']))
+
+	# Whether each angle below has been changed by hand since it was last calculated. Changing the calculated
+	# angles resets the input boxes to them, so the flags are cleared at the same time.
+	if st.session_state.get('calculated_i') != (thindisc_i, thickdisc_i):
+		st.session_state['calculated_i'] = (thindisc_i, thickdisc_i)
+		st.session_state['thin_i_set'] = False
+		st.session_state['thick_i_set'] = False
+
+	def setangle(flag):
+		st.session_state[flag] = True
 	
 	
 	# Manual inputs for inclination angles. These are what's actually used in the calculations. If the
@@ -178,10 +123,10 @@ if correctangle == True:
 		st.write('Alternatively, enter inclination angle directly, overriding any previous calculations (you can adjust either or both of the thin and thick disc angles).')
 		
 	with col2:
-		simple_i = st.number_input('Thin disc i', help="Thin disc approximation of i", min_value=0.0, max_value=90.0, value=thindisc_i)
+		simple_i = st.number_input('Thin disc i', help="Thin disc approximation of i", min_value=0.0, max_value=90.0, value=thindisc_i, on_change=setangle, args=('thin_i_set',))
 		
 	with col3:
-		complex_i = st.number_input('Thick disc i', help="Thick disc approximation of i", min_value=0.0, max_value=90.0, value=thickdisc_i)		
+		complex_i = st.number_input('Thick disc i', help="Thick disc approximation of i", min_value=0.0, max_value=90.0, value=thickdisc_i, on_change=setangle, args=('thick_i_set',))		
 
 	
 
@@ -199,69 +144,52 @@ if non_zero_count == 2:
 	thin_vel  = None
 	thick_vel = None
 
-	# If only the radius is unknown, use the given values for mass and velocity and calculate radius
-	if radius == 0.0:
-		# Get mass and velocity in SI units
-		mass_si_no_i = mass_kg(dynamical_mass, dynamical_mass_unit)
-		vcir_si = circular_ms(circular_speed, circular_speed_unit)
-		
-		# Calculate radius in SI units, using the astropy constant for G
-		r_si = (G.value*mass_si_no_i)/(vcir_si*vcir_si)
-			
-	# If only the circular speed is unknown, use the given values for mass and radius and calculate speed			
-	elif circular_speed == 0.0:
-		# Get mass and radius in SI units
-		mass_si_no_i = mass_kg(dynamical_mass, dynamical_mass_unit)
-		r_si    = distance_metres(radius, radius_unit)
-		
-		# Calculate circular speed in SI units
-		vcir_si = maths.sqrt((G.value*mass_si_no_i)/r_si)
-		
-	# If only the dynamical mass is unknown, use the given values for radius and speed and calculate mass	
-	elif dynamical_mass == 0.0:
-		# Get the radius and speed in SI units
-		r_si    = distance_metres(radius, radius_unit)
-		vcir_si = circular_ms(circular_speed, circular_speed_unit)
-		
-		# Might need to correct for inclination angle
-		if correctangle == True:
-			thin_vel, thick_vel = incvel(vcir_si)
-			print('Velocities =', thin_vel, thick_vel)
-		
-		# Calculate mass in SI units
-		# 1) No inclination correction
-		mass_si_no_i = ((vcir_si*vcir_si)*r_si) / G.value
-		# 2) Thin disc correction
-		if thin_vel != None:
-			mass_si_thin_i = ((thin_vel*thin_vel)*r_si) / G.value
-		# 2) Thick disc correction
-		if thick_vel != None:
-			mass_si_thick_i = ((thick_vel*thick_vel)*r_si) / G.value
+	# Solve for whichever value is zero, getting everything in all units
+	solved = solvedynamics(radius if radius != 0.0 else None, circular_speed if circular_speed != 0.0 else None, dynamical_mass if dynamical_mass != 0.0 else None,
+	                       radius_unit, circular_speed_unit, dynamical_mass_unit)
+
+	r_si = float(solved['radius_m'])
+	vcir_si = float(solved['speed_ms'])
+	mass_si_no_i = float(solved['mass_kg'])
+	
+	# If only the dynamical mass is unknown, we might need to correct for inclination angle. Angles of zero mean no correction.
+	if dynamical_mass == 0.0 and correctangle == True:
+		if simple_i != 0.0:
+			thin = solvedynamics(radius, circular_speed, None, radius_unit, circular_speed_unit, inclination=simple_i)
+			thin_vel = float(thin['speed_ms'])
+			mass_si_thin_i = float(thin['mass_kg'])
+		if complex_i != 0.0:
+			thick = solvedynamics(radius, circular_speed, None, radius_unit, circular_speed_unit, inclination=complex_i)
+			thick_vel = float(thick['speed_ms'])
+			mass_si_thick_i = float(thick['mass_kg'])
+
+		# Uncertainties from the axial ratio error. These only apply if the angles haven't been changed by hand.
+		thin_i_err  = 0.0 if st.session_state['thin_i_set'] else float(numpy.nan_to_num(discincl['incl_thin_err']))
+		thick_i_err = 0.0 if st.session_state['thick_i_set'] else float(numpy.nan_to_num(discincl['incl_thick_err']))
 
-		
 
 	# Convert everything to standard astronomical conventions (everything at this stage is currently in SI
 	# units)
 	# 1) Mass, for the case of no, thin, and thick disc inclination corrections
 	# a) No inclinatnion correction
-	mass_ac_no_i  = mass_si_no_i/M_sun.value
-	mass_acl_no_i = maths.log10(mass_ac_no_i)
+	mass_ac_no_i  = float(solved['mass_msolar'])
+	mass_acl_no_i = float(solved['logmass_msolar'])
 	# b) Thin disc correction
 	if mass_si_thin_i is not None:
-		mass_ac_thin_i  = mass_si_thin_i/M_sun.value
-		mass_acl_thin_i = maths.log10(mass_ac_thin_i)
+		mass_ac_thin_i  = float(thin['mass_msolar'])
+		mass_acl_thin_i = float(thin['logmass_msolar'])
 	# c) Thick disc correction
 	if mass_si_thick_i is not None:
-		mass_ac_thick_i  = mass_si_thick_i/M_sun.value
-		mass_acl_thick_i = maths.log10(mass_ac_thick_i)	
+		mass_ac_thick_i  = float(thick['mass_msolar'])
+		mass_acl_thick_i = float(thick['logmass_msolar'])
 	
-	vcir_ac  = vcir_si/1000.0
+	vcir_ac  = float(solved['speed_kms'])
 	if thin_vel is not None:
-		thin_vel_ac = thin_vel/1000.0
+		thin_vel_ac = float(thin['speed_kms'])
 	if thick_vel is not None:
-		thick_vel_ac = thick_vel/1000.0		
-	r_ac     = r_si/pc.value
-	r_ack    = r_ac/1000.0
+		thick_vel_ac = float(thick['speed_kms'])
+	r_ac     = float(solved['radius_pc'])
+	r_ack    = float(solved['radius_kpc'])
 
 
 	# Print the values, first in a sensible format using standard astronomical conventional units
@@ -295,6 +223,15 @@ if non_zero_count == 2:
 		if thick_vel is not None :
 			st.write('**Circular speed (thick circular disc):',nicenumber(thick_vel_ac),'km/s**')		
 	
+	# Uncertainties from the axial ratio error, if given. Since M is proportional to v^2, the fractional mass error
+	# is twice that of the speed.
+	if thin_vel is not None and axialratio_err > 0.0 and thin_i_err > 0.0:
+		thin_vel_err = float(correctedspeed(vcir_si, simple_i, thin_i_err)[1])
+		st.write('Thin disc uncertainties : i &plusmn;',nicenumber(thin_i_err),'&deg;, circular speed &plusmn;',nicenumber(thin_vel_err/1000.0),'km/s, log(M) &plusmn;',nicenumber(2.0*thin_vel_err/(thin_vel*maths.log(10.0))), unsafe_allow_html=True)
+	if thick_vel is not None and axialratio_err > 0.0 and thick_i_err > 0.0:
+		thick_vel_err = float(correctedspeed(vcir_si, complex_i, thick_i_err)[1])
+		st.write('**Thick disc uncertainties : i &plusmn;',nicenumber(thick_i_err),'&deg;, circular speed &plusmn;',nicenumber(thick_vel_err/1000.0),'km/s, log(M) &plusmn;',nicenumber(2.0*thick_vel_err/(thick_vel*maths.log(10.0)))+'**', unsafe_allow_html=True)
+
 	# Finally, give dynamical mass in both linear and logarithmic units	
 	if correctangle == True:
 		st.write('Dynamical mass (no inclination correction) :',nicenumber(mass_ac_no_i),'linear M<sub style=custom_style>&#9737;</sub> ('+str(nicenumber(mass_acl_no_i)+' logarithmic M<sub style=custom_style>&#9737;</sub>)'), unsafe_allow_html=True)
@@ -318,13 +255,128 @@ if non_zero_count == 2:
 		st.write('Circular speed :',str(vcir_si),'m/s')
 		
 	if correctangle == True:
-		st.write('Dynamical mass (no inclination correction) :',str(mass_ac_no_i),'kg')
+		st.write('Dynamical mass (no inclination correction) :',str(mass_si_no_i),'kg')
 		if mass_si_thin_i is not None:
 			st.write('Dynamical mass (thin circular disc) :',str(mass_si_thin_i),'kg')
 		if mass_si_thick_i is not None:
 			st.write('**Dynamical mass (thick circular disc) :',str(mass_si_thick_i),'kg**')
 	else:
-		st.write('Dynamical mass :',str(mass_ac_no_i),'kg')
+		st.write('Dynamical mass :',str(mass_si_no_i),'kg')
 
 else:
 	st.write("Please enter non-zero values for exactly two inputs from radius, circular speed and dynamical mass.")
+
+
+# ROTATION CURVE TABLES
+# Dynamical masses for every point of one or more rotation curves at once
+st.write('##### Rotation curve tables')
+if st.checkbox('Calculate dynamical masses for a table of rotation curves', key='dotable', help='Upload a table of radii and circular speeds (e.g. rotation curves for many galaxies) to get the enclosed dynamical mass at every point'):
+	st.write('Upload a CSV file with a header row and columns named **radius** and **speed**, in the units selected at the top. To correct for inclination, optionally include either an **inclination** column (in degrees; zero means no correction), or the observed axial ratio as a **q** column or **a** and **b** columns (optionally with a **qerr** column). Thick disc inclinations are then calculated using the q0 and systematic values above (or 0.2 and 3 degrees if the inclination correction isn\'t enabled). Any other columns (e.g. galaxy names) are copied to the output, followed by the radius, speed and enclosed mass in all units, and, where axial ratios are given, the inclinations and the uncertainties of the corrected speed and mass. Face-on discs, whose inclinations can\'t be calculated, get no correction.')
+
+	tablefile = st.file_uploader('Rotation curve table', type=['csv', 'txt'], key='tablefile')
+
+	if tablefile is not None:
+		rows = list(csv.DictReader(io.StringIO(tablefile.getvalue().decode('utf-8'))))
+
+		if len(rows) == 0 or 'radius' not in rows[0] or 'speed' not in rows[0]:
+			st.write('#### The file must have columns named radius and speed.')
+		else:
+			# Numerical columns, set to zero if not present
+			try:
+				tablecols = {name:numpy.array([row[name] for row in rows], dtype=float) if name in rows[0] else numpy.zeros(len(rows)) for name in ['radius', 'speed', 'inclination', 'q', 'a', 'b', 'qerr']}
+			except ValueError:
+				tablecols = None
+				st.write('#### The radius, speed, inclination and axial ratio columns must contain only numbers.')
+
+			if tablecols is not None:
+				outnames = [name for name, dtype in dynamicsdtype]
+				outvalues = []
+
+				# Inclinations, either given directly (zero meaning no correction) or from the axial ratios
+				tableincl = None
+				if 'inclination' in rows[0]:
+					tableincl = numpy.where(tablecols['inclination'] == 0.0, 90.0, tablecols['inclination'])
+				elif 'q' in rows[0] or ('a' in rows[0] and 'b' in rows[0]):
+					tableq, tableqerr = axialratio(tablecols['a'], tablecols['b'], tablecols['q'], qerr=tablecols['qerr'])
+					tableincs = inclinations(tableq, axialratio_act if correctangle == True else 0.2, sys_i if correctangle == True else 3.0, tableqerr)
+					# As for a single galaxy, discs whose inclination can't be calculated (e.g. face-on) get no correction
+					tableincl = numpy.where(numpy.isfinite(tableincs['incl_thick']), tableincs['incl_thick'], 90.0)
+					tableinclerr = numpy.where(numpy.isfinite(tableincs['incl_thick']), numpy.nan_to_num(tableincs['incl_thick_err']), 0.0)
+					outnames = outnames + [name for name, dtype in inclinationdtype]
+					outvalues = [tableincs[name] for name, dtype in inclinationdtype]
+
+				solved = solvedynamics(tablecols['radius'], tablecols['speed'], None, radius_unit, circular_speed_unit, inclination=tableincl)
+				outvalues = [solved[name] for name, dtype in dynamicsdtype] + outvalues
+
+				# Uncertainties of the corrected speeds and masses from those of the thick disc inclinations, with the
+				# mass going as the speed squared
+				if 'q' in rows[0] or ('a' in rows[0] and 'b' in rows[0]):
+					with numpy.errstate(invalid='ignore', divide='ignore'):
+						vcorr, vcorrerr = correctedspeed(tablecols['speed'], tableincl, tableinclerr)
+						fractionerr = numpy.where(vcorr != 0.0, numpy.abs(vcorrerr / vcorr), 0.0)
+					outnames = outnames + ['vcorr_err_kms', 'mass_msolar_err', 'logmass_msolar_err']
+					outvalues = outvalues + [solved['speed_kms']*fractionerr, 2.0*solved['mass_msolar']*fractionerr, 2.0*fractionerr/numpy.log(10.0)]
+
+				outfile = io.StringIO()
+				writer = csv.writer(outfile)
+				writer.writerow(list(rows[0].keys()) + outnames)
+				writer.writerows([list(row.values()) + list(values) for row, values in zip(rows, numpy.column_stack(outvalues).tolist())])
+
+				st.write('Calculated',str(len(rows)),'points.')
+				st.download_button('Download CSV file', outfile.getvalue(), file_name='dynamicalmasses.csv')
+
+
+# ROTATION CURVE DECOMPOSITION
+# Fits a dark matter halo to each rotation curve, with the stellar and gas contributions fixed
+st.write('##### Rotation curve decomposition')
+if st.checkbox('Fit dark matter halos to rotation curves', key='dofit', help='Upload rotation curves together with the circular speeds of the stellar disc, bulge and gas, and fit an NFW or pseudo-isothermal halo to each one'):
+	st.write('Upload a CSV file with a header row and one row per point, with columns named **galaxy**, **radius** (kpc), **speed** and **speed_err** (the observed circular speed and its error) and **vdisc** and **vgas** (the circular speeds of the stellar disc, for a mass-to-light ratio of one, and the gas), plus optionally **vbulge**, all in km/s. Gas speeds may be negative. Any number of galaxies can be included, and each is fitted independently.')
+
+	col1, col2, col3, col4 = st.columns(4)
+	with col1:
+		fithalo = st.selectbox('Halo', halos, key='fithalo', help='NFW : rho = rho_s / [(r/rs) (1 + r/rs)^2]. Pseudo-isothermal : rho = rho_0 / [1 + (r/rc)^2]')
+	with col2:
+		fitml = st.number_input('Disc M/L', value=0.5, min_value=0.0, key='fitml', help='Mass-to-light ratio of the stellar disc, by which the squared disc speeds are multiplied. 0.5 is typical at 3.6 microns')
+	with col3:
+		fitmlbulge = st.number_input('Bulge M/L', value=0.7, min_value=0.0, key='fitmlbulge', help='Mass-to-light ratio of the bulge')
+	with col4:
+		fitprocesses = st.number_input('Processes', value=1, min_value=1, max_value=64, key='fitprocesses', help='Number of processes used to fit the galaxies in parallel. Only worthwhile for thousands of galaxies')
+
+	fitfile = st.file_uploader('Rotation curves', type=['csv', 'txt'], key='fitfile')
+
+	if fitfile is not None:
+		rows = list(csv.DictReader(io.StringIO(fitfile.getvalue().decode('utf-8'))))
+		fitcols = ['radius', 'speed', 'speed_err', 'vdisc', 'vgas', 'vbulge']
+
+		if len(rows) == 0 or any(name not in rows[0] for name in ['galaxy'] + fitcols[0:5]):
+			st.write('#### The file must have columns named galaxy, radius, speed, speed_err, vdisc and vgas.')
+		else:
+			# Numerical columns, with no bulge if not present
+			try:
+				columns = [numpy.array([row[name] for row in rows], dtype=float) if name in rows[0] else numpy.zeros(len(rows)) for name in fitcols]
+			except ValueError:
+				columns = None
+				st.write('#### The radius, speed and component columns must contain only numbers.')
+
+			if columns is not None:
+				galaxies, curves = packcurves([row['galaxy'] for row in rows], *columns)
+				fits = fitgalaxies(*curves, halo=fithalo, mlratio=fitml, mlbulge=fitmlbulge, processes=int(fitprocesses))
+
+				st.write('Fitted',str(int(fits['converged'].sum())),'of',str(len(galaxies)),'galaxies. Scale radii are rs for NFW and rc for the pseudo-isothermal halo, and densities are rho_s and rho_0 respectively. Galaxies need at least three points to be fitted.')
+				fittable = {'Galaxy': galaxies}
+				fittable.update({name: fits[name] for name, dtype in fitdtype})
+				st.dataframe(fittable, hide_index=True)
+
+				outfile = io.StringIO()
+				writer = csv.writer(outfile)
+				writer.writerow(['galaxy'] + [name for name, dtype in fitdtype])
+				writer.writerows([[galaxy] + list(values) for galaxy, values in zip(galaxies, fits.tolist())])
+				st.download_button('Download fits as CSV file', outfile.getvalue(), file_name='halofits.csv')
+
+				# Observed and model curves for one galaxy
+				showgalaxy = st.selectbox('Show the fit for', galaxies, key='showgalaxy')
+				i = list(galaxies).index(showgalaxy)
+				used = numpy.isfinite(curves[0][i])
+				vhalo, vtotal = modelcurves(curves[0][i][used], fits['scale_kpc'][i], fits['density_msolar_kpc3'][i], curves[3][i][used], curves[4][i][used], curves[5][i][used], fithalo, fitml, fitmlbulge)
+				st.line_chart({'Radius (kpc)': curves[0][i][used], 'Observed': curves[1][i][used], 'Total': vtotal, 'Halo': vhalo,
+				               'Disc': numpy.sqrt(fitml)*curves[3][i][used], 'Gas': curves[4][i][used]}, x='Radius (kpc)')
@@ -0,0 +1,129 @@
+# Dynamical mass, circular speed and radius from M = v^2 r / G, for arrays of any size. Given any two of the three
+# (e.g. a whole rotation curve of radii and speeds), calculates the third and returns all of them in every supported
+# unit as a structured array. Unit conversions are fixed scale factors to SI, worked out once here rather than
+# with astropy units on every call. Used by DynamicalMass.py.
+
+import numpy
+from astropy import constants
+
+
+# Constants in SI units
+G = constants.G.value
+solarmass = constants.M_sun.value
+pc = constants.pc.value
+
+# Scale factors to SI for each supported unit. Logarithmic solar masses are handled separately.
+radiusscale = {'m':1.0, 'pc':pc, 'kpc':1000.0*pc}
+speedscale  = {'m/s':1.0, 'km/s':1000.0, 'mph':1609.344/3600.0}
+massscale   = {'kg':1.0, 'Msolar':solarmass}
+
+# Fields of the structured arrays returned by solvedynamics
+dynamicsdtype = [('radius_m', float), ('radius_pc', float), ('radius_kpc', float),
+                 ('speed_ms', float), ('speed_kms', float), ('speed_mph', float),
+                 ('mass_kg', float), ('mass_msolar', float), ('logmass_msolar', float)]
+
+
+# Mass in kg, from any of the supported units
+def masskg(mass, massunit):
+	mass = numpy.asarray(mass, dtype=float)
+	if massunit == 'log(Msolar)':
+		return solarmass * 10.0**mass
+
+	return mass * massscale[massunit]
+
+
+# Solve M = v^2 r / G for whichever one of radius, speed and mass is None, from the other two (arrays or single
+# values, which are broadcast against each other). Speeds can optionally be corrected for inclination (in degrees,
+# also an array or single value), which only applies when the speed is given rather than calculated. Returns a
+# structured array of all three quantities in every unit. Non-physical inputs give NaN rather than an error.
+def solvedynamics(radius=None, speed=None, mass=None, radiusunit='kpc', speedunit='km/s', massunit='Msolar', inclination=None):
+	with numpy.errstate(invalid='ignore', divide='ignore'):
+		if radius is not None:
+			r = numpy.asarray(radius, dtype=float) * radiusscale[radiusunit]
+		if speed is not None:
+			v = numpy.asarray(speed, dtype=float) * speedscale[speedunit]
+			if inclination is not None:
+				sini = numpy.sin(numpy.radians(numpy.asarray(inclination, dtype=float)))
+				v = v / numpy.where(sini > 0.0, sini, numpy.nan)
+		if mass is not None:
+			m = masskg(mass, massunit)
+
+		if mass is None:
+			r, v = numpy.broadcast_arrays(r, v)
+			m = v*v*r / G
+		elif speed is None:
+			r, m = numpy.broadcast_arrays(r, m)
+			v = numpy.sqrt(G*m / r)
+		else:
+			v, m = numpy.broadcast_arrays(v, m)
+			r = G*m / (v*v)
+
+		result = numpy.empty(numpy.shape(m), dtype=dynamicsdtype)
+		result['radius_m']   = r
+		result['radius_pc']  = r / pc
+		result['radius_kpc'] = r / (1000.0*pc)
+		result['speed_ms']   = v
+		result['speed_kms']  = v / 1000.0
+		result['speed_mph']  = v / speedscale['mph']
+		result['mass_kg']    = m
+		result['mass_msolar'] = m / solarmass
+		result['logmass_msolar'] = numpy.log10(numpy.where(m > 0.0, m, numpy.nan) / solarmass)
+
+	return result
+
+
+# Fields of the structured arrays returned by inclinations. Angles and their errors are in degrees.
+inclinationdtype = [('q', float), ('q_err', float), ('incl_thin', float), ('incl_thin_err', float), ('incl_thick', float), ('incl_thick_err', float)]
+
+
+# Observed axial ratio q = b/a and its error. Where both a and b are given (non-zero, with b <= a) q is calculated
+# from them, otherwise the given q is used. Errors on a and b are propagated, or the given q error is used.
+def axialratio(a=0.0, b=0.0, q=0.0, aerr=0.0, berr=0.0, qerr=0.0):
+	a, b, q, aerr, berr, qerr = numpy.broadcast_arrays(*[numpy.asarray(value, dtype=float) for value in (a, b, q, aerr, berr, qerr)])
+
+	with numpy.errstate(invalid='ignore', divide='ignore'):
+		useab = (a > 0.0) & (b > 0.0) & (b <= a)
+		qab = b / a
+		qaberr = qab * numpy.sqrt((aerr/a)**2.0 + (berr/b)**2.0)
+
+	return numpy.where(useab, qab, q), numpy.where(useab, qaberr, qerr)
+
+
+# Inclinations (degrees) from observed axial ratios, for a thin circular disc, cos(i) = q, and a thick disc with
+# intrinsic axial ratio q0 (Hubble 1926), cos^2(i) = (q^2 - q0^2) / (1 - q0^2), plus a systematic correction. Discs
+# flatter than q0 are taken to be edge-on. Axial ratio errors are propagated to the angles using the derivatives of
+# the formulae. Anything with q outside 0 < q < 1 can't be corrected (face-on discs have no rotation along the line
+# of sight), so gives NaN.
+def inclinations(q, q0=0.2, systematic=3.0, qerr=0.0):
+	q, q0, systematic, qerr = numpy.broadcast_arrays(*[numpy.asarray(value, dtype=float) for value in (q, q0, systematic, qerr)])
+	valid = (q > 0.0) & (q < 1.0)
+
+	result = numpy.empty(q.shape, dtype=inclinationdtype)
+	result['q'] = q
+	result['q_err'] = qerr
+
+	with numpy.errstate(invalid='ignore', divide='ignore'):
+		# Thin disc
+		result['incl_thin'] = numpy.where(valid, numpy.degrees(numpy.arccos(q)), numpy.nan)
+		result['incl_thin_err'] = numpy.where(valid, numpy.degrees(qerr / numpy.sqrt(1.0 - q*q)), numpy.nan)
+
+		# Thick disc. Clipping x to [0, 1] takes care of both discs flatter than q0 and rounding errors.
+		x = numpy.clip((q*q - q0*q0) / (1.0 - q0*q0), 0.0, 1.0)
+		result['incl_thick'] = numpy.where(valid, numpy.minimum(numpy.degrees(numpy.arccos(numpy.sqrt(x))) + systematic, 90.0), numpy.nan)
+		# The error is zero where x has been clipped, since the angle is then fixed
+		thickerr = numpy.where((x > 0.0) & (x < 1.0), numpy.degrees(qerr * q / ((1.0 - q0*q0) * numpy.sqrt(x*(1.0 - x)))), 0.0)
+		result['incl_thick_err'] = numpy.where(valid, thickerr, numpy.nan)
+
+	return result
+
+
+# Inclination-corrected speeds, v / sin(i), and their errors given errors on the inclination (both in degrees).
+# Inclinations of zero or less give NaN.
+def correctedspeed(speed, incl, inclerr=0.0):
+	with numpy.errstate(invalid='ignore', divide='ignore'):
+		irad = numpy.radians(numpy.asarray(incl, dtype=float))
+		sini = numpy.where(irad > 0.0, numpy.sin(irad), numpy.nan)
+		vcorr = numpy.asarray(speed, dtype=float) / sini
+		vcorrerr = numpy.abs(vcorr * numpy.cos(irad)/sini * numpy.radians(inclerr))
+
+	return vcorr, vcorrerr
@@ -1,14 +1,39 @@
 # Code from ChatGPT to provide a GUI wrapper for HIPS2FITS
 
 import streamlit as st
+import os
 from io import BytesIO
 import astropy
 from astropy.coordinates import SkyCoord	
 from astropy import units as u
-from astroquery.hips2fits import Hips2Fits
+from astropy.coordinates import Angle, Longitude, Latitude
+from astroquery.hips2fits import hips2fits
 from astropy.io import fits
+from astropy.wcs import WCS
 import numpy as np
 from PIL import Image
+import imp
+import tempfile
+
+# Disk cache of the retrieved images, so repeat views don't go back to the server
+import HipsCache
+imp.reload(HipsCache)
+from HipsCache import cachedimage, cachefile, fitsbytes
+
+# Batch cutouts for lists of sources
+import HipsBatch
+imp.reload(HipsBatch)
+from HipsBatch import fetchcutouts, cutoutquery, readpositions, writetar, writemef, outformats, defaultserver
+
+# Reading uploaded tables
+import TableIO
+imp.reload(TableIO)
+from TableIO import uploadtext
+
+# Cutouts from HiPS surveys on local disk, for working offline. Not reloaded like the other modules, since that
+# would empty its cache of open tiles on every rerun.
+import HipsLocal
+from HipsLocal import localcutout, localcutoutwcs
 
 st.set_page_config(page_title="HIPS2FITS Browser", layout="wide")
 st.title("HIPS2FITS Image Retriever")
@@ -21,6 +46,8 @@ if mode == "Coordinates":
 	coord_str = st.sidebar.text_input(
 		"Coordinates (RA Dec, sexagesimal or decimal)", "10h00m00s +02d00m00s")
 	fov = st.sidebar.slider("Field of view (arcmin)", min_value=1.0, max_value=180.0, value=30.0)
+	size = st.sidebar.number_input("Image size (pixels)", min_value=16, max_value=4000, value=500, step=50)
+	projection = st.sidebar.selectbox("Projection", ["TAN", "SIN", "STG", "ARC", "CAR", "AIT"])
 	if coord_str:
 		try:
 			coord = SkyCoord(coord_str, unit=(u.hourangle, u.deg))
@@ -32,8 +59,12 @@ else:
 	if fits_file:
 		hdul = fits.open(fits_file)
 		header = hdul[0].header
-		wcs = WCS(header)
+		# Only the celestial axes (e.g. of a data cube) are used, with the image size so the cutout matches it
+		wcs = WCS(header).celestial
 		region_center = None  # could extract from WCS if desired
+		wcsheader = wcs.to_header()
+		wcsheader['NAXIS'] = 2
+		wcsheader['NAXIS1'], wcsheader['NAXIS2'] = wcs.pixel_shape
 
 # Dataset selection
 datasets = {
@@ -46,6 +77,12 @@ datasets = {
 selection = st.sidebar.selectbox("Data set", list(datasets.keys()))
 dataset_id = datasets[selection]
 
+# A local survey replaces the selected data set
+local_root = st.sidebar.text_input("Local HiPS directory (optional)", "",
+	help="Directory of a HiPS survey with FITS tiles on this machine. Images are then cut from its tiles here rather than by the hips2fits service, so no network is needed.")
+if local_root:
+	dataset_id = "local:" + local_root
+
 # Waveband options
 wavebands = st.sidebar.multiselect(
 	"Wavebands (leave empty for full-color)",
@@ -63,33 +100,75 @@ if not wavebands:
 else:
 	img_format = "fits"
 
-# Query button
+# Retrieve the FITS image for a query from hips2fits, or from a local survey, as bytes for the cache. Queries are
+# tuples of the input mode and dataset, followed by the centre, field of view (degrees), size and projection, or the
+# header of the WCS.
+def fetchimage(query):
+	service = query[1]
+	local = service.startswith("local:")
+	if query[0] == "Coordinates":
+		ra, dec, fov, width, height, projection = query[2:]
+		if local:
+			hdulist = localcutout(service[6:], ra, dec, fov, width, height, projection)
+		else:
+			hdulist = hips2fits.query(hips=service, width=width, height=height, projection=projection,
+				ra=Longitude(ra * u.deg), dec=Latitude(dec * u.deg), fov=Angle(fov * u.deg), format="fits")
+	else:
+		wcs = WCS(fits.Header.fromstring(query[2]))
+		if local:
+			hdulist = localcutoutwcs(service[6:], wcs)
+		else:
+			hdulist = hips2fits.query_with_wcs(hips=service, wcs=wcs, format="fits")
+	return fitsbytes(hdulist)
+
+
+# Local cutouts are quick to make but may change if the survey is updated, so rather than going in the disk cache
+# the most recent are kept in memory, so changing the display options doesn't cut them again
+@st.cache_data(max_entries=32)
+def localimage(query):
+	return fetchimage(query)
+
+
+# Query button. The query is kept in the session state, so the image is still shown (from the cache) when the
+# display options are changed afterwards.
 if st.sidebar.button("Retrieve Image"):
-	hips = Hips2Fits()
+	if mode == "Coordinates":
+		# Same key as batch cutouts, so each mode finds the other's images in the cache
+		st.session_state["hipsquery"] = cutoutquery(dataset_id, region_center.ra.deg, region_center.dec.deg, fov / 60.0, size, projection)
+	elif fits_file:
+		st.session_state["hipsquery"] = (mode, dataset_id, wcsheader.tostring())
+	else:
+		st.error("Upload a FITS file to define the region")
+
+if "hipsquery" in st.session_state:
+	query = st.session_state["hipsquery"]
 	try:
-		if mode == "Coordinates":
-			result = hips.get_image(
-				hips_service=datasets[selection],
-				hips_frame=f"{region_center.ra.deg},{region_center.dec.deg},{fov}"  # ra,dec,fov in degrees
-			)
+		if query[1].startswith("local:"):
+			result, fromcache = localimage(query), False
 		else:
-			result = hips.get_image(
-				hips_service=datasets[selection],
-				fits_file=fits_file
-			)
+			result, fromcache = cachedimage(query, lambda: fetchimage(query))
 		hdulist = fits.open(BytesIO(result))
-		data = hdulist[0].data
-		# Normalize and apply sliders
+		data = hdulist[0].data.astype(float)
+		# Colour surveys give a cube of red, green and blue planes
+		if data.ndim == 3:
+			data = np.moveaxis(data, 0, -1)
+		# Normalize and apply sliders. Each image has its own slider, since their ranges differ.
+		datamin, datamax = float(np.nanmin(data)), float(np.nanmax(data))
+		if datamax <= datamin:
+			datamax = datamin + 1.0
 		vmin, vmax = st.sidebar.slider(
-			"Intensity range", float(np.min(data)), float(np.max(data)),
-			(float(np.min(data)), float(np.max(data)))
+			"Intensity range", datamin, datamax, (datamin, datamax),
+			key="intensity_" + os.path.basename(cachefile(query))
 		)
-		img_arr = np.clip((data - vmin) / (vmax - vmin), 0, 1)
+		img_arr = np.clip((np.nan_to_num(data, nan=vmin) - vmin) / max(vmax - vmin, 1e-30), 0, 1)
+		if fromcache:
+			st.caption("Image loaded from the local cache")
 		if img_format in ["png", "jpg"]:
-			img = Image.fromarray((img_arr * 255).astype(np.uint8))
-			st.image(img, use_column_width=True)
+			# FITS images have their origin at the bottom left
+			img = Image.fromarray((np.flipud(img_arr) * 255).astype(np.uint8))
+			st.image(img, use_container_width=True)
 			buf = BytesIO()
-			img.save(buf, format=img_format.upper())
+			img.save(buf, format="JPEG" if img_format == "jpg" else "PNG")
 			buf.seek(0)
 			st.download_button(
 				label=f"Download {img_format.upper()}",
@@ -99,14 +178,64 @@ if st.sidebar.button("Retrieve Image"):
 			)
 		else:
 			# FITS
-			buf = BytesIO()
-			hdulist.writeto(buf)
-			buf.seek(0)
 			st.download_button(
 				label="Download FITS file",
-				data=buf,
+				data=result,
 				file_name="hips_image.fits",
 				mime="application/fits"
 			)
 	except Exception as e:
 		st.error(f"Error retrieving image: {e}")
+
+
+# Batch mode : cutouts around every source in a table, with the dataset, field of view, size and projection above
+st.sidebar.header("Batch Cutouts")
+if st.sidebar.checkbox("Batch mode", help="Retrieve FITS cutouts for a whole list of sources at once"):
+	st.write("### Batch cutouts")
+	st.write("Upload a CSV file with a header row and **ra** and **dec** columns (decimal degrees), and optionally a **name** column used to name the cutouts. Every source gets a FITS cutout with the dataset, field of view, image size and projection chosen in the sidebar. Requests are sent several at a time, failed ones are retried, and cutouts already retrieved (including single images above) are taken from the local cache.")
+	batch_file = st.file_uploader("Table of source positions", type=["csv", "txt"], key="batchfile")
+	left_column, mid_column, right_column = st.columns(3)
+	with left_column:
+		batch_format = st.radio("Output", outformats, key="batchformat")
+	with mid_column:
+		batch_workers = st.number_input("Simultaneous requests", min_value=1, max_value=32, value=8, key="batchworkers")
+	with right_column:
+		batch_server = st.text_input("hips2fits server", defaultserver, key="batchserver", help="URL of the service, e.g. a local mock server for testing")
+
+	if mode != "Coordinates":
+		st.error("Batch mode uses the field of view and image size of the Coordinates input mode")
+	elif batch_file is not None and st.button("Retrieve Cutouts", key="batchgo"):
+		try:
+			with uploadtext(batch_file) as infile:
+				names, ras, decs = readpositions(infile)
+		except (ValueError, UnicodeDecodeError) as e:
+			st.error(f"Could not read the table: {e}")
+			names = []
+		if len(names) > 0:
+			if local_root:
+				# Errors are caught for each source, so one bad position doesn't lose the rest
+				errors = []
+				def localcutouts():
+					for ra, dec in zip(ras, decs):
+						try:
+							yield fetchimage(cutoutquery(dataset_id, ra, dec, fov / 60.0, size, projection))
+						except (OSError, ValueError) as e:
+							errors.append(str(e))
+							yield None
+				cutouts = localcutouts()
+			else:
+				cutouts, errors = fetchcutouts(ras, decs, dataset_id, fov / 60.0, size, projection, batch_server, batch_workers)
+			# Each cutout is written to a temporary file on disk as it arrives, rather than all being held in memory
+			with tempfile.TemporaryFile("w+b") as outfile:
+				with st.spinner(f"Retrieving {len(names)} cutouts"):
+					if batch_format == outformats[0]:
+						nwritten = writetar(outfile, names, cutouts)
+						file_name, mime = "hips_cutouts.tar", "application/x-tar"
+					else:
+						nwritten = writemef(outfile, names, cutouts)
+						file_name, mime = "hips_cutouts.fits", "application/fits"
+				st.write(f"Retrieved {nwritten} of {len(names)} cutouts.")
+				if errors:
+					st.error(f"{len(errors)} cutouts failed, e.g. : {errors[0]}")
+				outfile.seek(0)
+				st.download_button(label="Download cutouts", data=outfile.read(), file_name=file_name, mime=mime)
@@ -6,6 +6,9 @@ import streamlit as st
 import math
 from math import pi as pi
 import imp
+import io
+import csv
+import numpy
 
 # EXTERNAL SCRIPTS IMPORTED AS FUNCTIONS
 # "nicenumber" function returns human-readable versions of numbers, e.g, comma-separated or scientific notation depending
@@ -14,6 +17,16 @@ import NiceNumber
 imp.reload(NiceNumber)
 from NiceNumber import nicenumber
 
+# Registry of preset coefficients, plus deficiency calculations for whole catalogues. Deliberately not reloaded
+# on every rerun (unlike the other external scripts) so that the coefficient file is only read once per process.
+import HIDeficiency
+from HIDeficiency import hidefbatch, presetcoefficients, diameterkpc, references, morphologies
+
+# Binned deficiency statistics with bootstrap errors
+import DeficiencyStats
+imp.reload(DeficiencyStats)
+from DeficiencyStats import deficiencyprofile
+
 # Callback function for setting checbox
 def reset_button():
 	st.session_state["dounitcheckbox"] = False
@@ -67,7 +80,7 @@ with right_column:
 
 
 # Column-independent dropdown for morphology
-mtypechoice = st.selectbox('Morphology', ('Early', 'Sa, Sab', 'Sb', 'Sbc', 'Sc', 'Scd', 'Sd', 'Sdm, Sm', 'Im', 'Later (generally >= Scd)', 'General'), index=10, key="htype", help='Choose the morphology of the galaxy. Different groups have derived slightly different coefficients for the different morphologies')
+mtypechoice = st.selectbox('Morphology', morphologies, index=morphologies.index('General'), key="htype", help='Choose the morphology of the galaxy. Different groups have derived slightly different coefficients for the different morphologies')
 
 
 
@@ -80,38 +93,22 @@ lcol, mcol, rcol = st.columns([2,1,1])
 	
 with lcol:
 	# Morphology parameter selection box
-	mparams = st.selectbox("Use preset or custom parameters", ('Haynes & Giovanelli 1984', 'Solanes et al. 1996', 'Gavazzi et al. 2005', 'Gavazzi et al. 2013', 'Denes et al. 2014', 'Jones et al. 2018', 'Custom'), index=0, key="type", help='Choose whichever set of preset morphology coefficients you like best, or set your own')
-
-# Set the coefficient dictionaries depending on the current choice of parameter catalogue
-if mparams == 'Haynes & Giovanelli 1984':
-	mvalues = {'Early':[6.88, 0.89*2.0], 'Sa, Sab':[6.88, 0.89*2.0], 'Sb':[7.17, 0.82*2.0], 'Sbc':[7.17, 0.82*2.0], 'Sc':[7.29, 0.83*2.0], 'Scd':[7.27, 0.85*2.0], 'Sd':[6.91, 0.95*2.0], 'Sdm, Sm':[7.0, 0.94*2.0], 'Im':[7.75, 0.66*2.0], 'Later (generally >= Scd)':[7.75, 0.66*2.0], 'General':[7.12, 0.88*2.0]} 
-	
-if mparams == 'Solanes et al. 1996':
-	mvalues = {'Early':[-0.0, -0.0], 'Sa, Sab':[7.75, 1.19], 'Sb':[7.82, 1.25], 'Sbc':[7.84, 1.22], 'Sc':[7.16, 1.74], 'Scd':[7.16, 1.74], 'Sd':[7.16, 1.74], 'Sdm, Sm':[7.16, 1.74], 'Im':[7.16, 1.74], 'Later (generally >= Scd)':[7.16, 1.74], 'General':[7.51, 1.46]} 
-	
-if mparams == 'Gavazzi et al. 2005':
-	mvalues = {'Early':[-0.0, -0.0], 'Sa, Sab':[7.29, 1.66], 'Sb':[7.27, 1.70], 'Sbc':[6.91, 1.90], 'Sc':[7.00, 1.88], 'Scd':[7.00, 1.88], 'Sd':[7.00, 1.88], 'Sdm, Sm':[7.00, 1.88], 'Im':[7.00, 1.88], 'Later (generally >= Scd)':[7.00, 1.88], 'General':[7.16, 1.64]} 
-
-if mparams == 'Gavazzi et al. 2013':
-	mvalues = {'Early':[-0.0, -0.0], 'Sa, Sab':[7.51, 1.36], 'Sb':[7.51, 1.36], 'Sbc':[7.51, 1.36], 'Sc':[7.51, 1.36], 'Scd':[7.51, 1.36], 'Sd':[7.51, 1.36], 'Sdm, Sm':[7.51, 1.36], 'Im':[7.51, 1.36], 'Later (generally >= Scd)':[7.51, 1.36], 'General':[7.51, 1.36]} 
-
-if mparams == 'Denes et al. 2014':
-	mvalues = {'Early':[-0.0, -0.0], 'Sa, Sab':[8.21, 1.27], 'Sb':[8.21, 1.27], 'Sbc':[8.21, 1.27], 'Sc':[8.21, 1.27], 'Scd':[8.21, 1.27], 'Sd':[8.21, 1.27], 'Sdm, Sm':[8.21, 1.27], 'Im':[8.21, 1.27], 'Later (generally >= Scd)':[8.21, 1.27], 'General':[8.21, 1.27]} 
+	mparams = st.selectbox("Use preset or custom parameters", references + ('Custom',), index=0, key="type", help='Choose whichever set of preset morphology coefficients you like best, or set your own')
 
-if mparams == 'Jones et al. 2018':
-	mvalues = {'Early':[6.44, 2.08], 'Sa, Sab':[6.44, 2.08], 'Sb':[7.14, 1.86], 'Sbc':[7.14, 1.86], 'Sc':[7.14, 1.86], 'Scd':[7.53, 1.62], 'Sd':[7.53, 1.62], 'Sdm, Sm':[7.53, 1.62], 'Im':[7.53, 1.62], 'Later (generally >= Scd)':[7.53, 1.62], 'General':[7.30, 1.72]} 
-	
+# Look up the preset coefficients for the current choice of parameter catalogue and morphology
 if mparams == 'Custom':
-	mvalues = {'Early':[0.0, 0.0], 'Sa, Sab':[0.0, 0.0], 'Sb':[0.0, 0.0], 'Sbc':[0.0, 0.0], 'Sc':[0.0, 0.0], 'Scd':[0.0, 0.0], 'Sd':[0.0, 0.0], 'Sdm, Sm':[0.0, 0.0], 'Im':[0.0, 0.0], 'Later (generally >= Scd)':[0.0, 0.0], 'General':[0.0, 0.0]} 	
+	apreset, bpreset = 0.0, 0.0
+else:
+	apreset, bpreset = presetcoefficients(mparams, mtypechoice)
 
 
 with mcol:
 	# A parameter number widget
-	aparam = st.number_input("a", format="%.3f", value=mvalues[mtypechoice][0], key="keya", help='Coefficient "a" used in the predicted HI mass equation')	
+	aparam = st.number_input("a", format="%.3f", value=apreset, key="keya", help='Coefficient "a" used in the predicted HI mass equation')	
 	
 with rcol:
 	# B parameter number widget
-	bparam = st.number_input("b", format="%.3f", value=mvalues[mtypechoice][1], key="keyb", help='Coefficient "b" used in the predicted HI mass equation')
+	bparam = st.number_input("b", format="%.3f", value=bpreset, key="keyb", help='Coefficient "b" used in the predicted HI mass equation')
 
 
 
@@ -131,17 +128,7 @@ if hisolarmasses > 0.0:
 	
 
 # Next convert the optical diameter into kpc
-if optdunit == 'm':
-	optd = optd25 / (1000.0*pc)
-	
-if optdunit == 'pc':
-	optd = optd25 / 1000.0
-	
-if optdunit == 'kpc':
-	optd = optd25
-	
-if optdunit == 'Mpc':
-	optd = optd25 / 1000000.0
+optd = float(diameterkpc(optd25, optdunit))
 
 
 st.write("# Essential notes")
@@ -170,4 +157,86 @@ if aparam != -0.0 and bparam != -0.0 and optd != -0.0:
 			st.write('Used the preset parameter values a='+str(aparam)+' and b='+str(bparam))
 
 
+# Batch mode : deficiencies for a whole catalogue, for every set of preset coefficients at once
+st.write("# Batch mode")
+if st.checkbox('Calculate deficiencies for a catalogue', key='dobatch', help='Upload a table of galaxies to calculate the HI deficiency of each using all the preset coefficients'):
+	st.write('Upload a CSV file with a header row and columns named **mass**, **diameter** and **morphology**. Optionally include **massunit** and **diameterunit** columns to give units for each galaxy; otherwise the units selected below are used for all of them. Morphologies can be any of the menu options above or individual types (e.g. Sa, Sdm, Irr). Include a **radius** column (projected distance from the cluster centre, in any unit) to also calculate the deficiency as a function of environment. Any other columns (e.g. names) are copied to the output.')
 	
+	left_column2, right_column2 = st.columns(2)
+	with left_column2:
+		batchmassunit = st.selectbox('Default mass units', ('Linear solar mass', 'Logarithmic solar mass', 'kg'), key="bmunit")
+	with right_column2:
+		batchdunit = st.selectbox('Default optical diameter units', ('m', 'pc', 'kpc', 'Mpc'), index=2, key="bodunit")
+		
+	batchfile = st.file_uploader('Galaxy catalogue', type=['csv', 'txt'], key='batchfile')
+	
+	if batchfile is not None:
+		rows = list(csv.DictReader(io.StringIO(batchfile.getvalue().decode('utf-8'))))
+		
+		if len(rows) == 0 or not {'mass', 'diameter', 'morphology'}.issubset(rows[0].keys()):
+			st.write('#### The file must have columns named mass, diameter and morphology.')
+		else:
+			try:
+				batchmass = numpy.array([row['mass'] for row in rows], dtype=float)
+				batchdiam = numpy.array([row['diameter'] for row in rows], dtype=float)
+			except ValueError:
+				batchmass = None
+				st.write('#### The mass and diameter columns must contain only numbers.')
+				
+			if batchmass is not None:
+				batchmunits = [row['massunit'] for row in rows] if 'massunit' in rows[0] else batchmassunit
+				batchdunits = [row['diameterunit'] for row in rows] if 'diameterunit' in rows[0] else batchdunit
+				
+				MHI_exps, HIdefs = hidefbatch(batchmass, batchmunits, batchdiam, batchdunits, [row['morphology'] for row in rows])
+				
+				# Add a deficiency column for each reference to the original table
+				outfile = io.StringIO()
+				writer = csv.writer(outfile)
+				writer.writerow(list(rows[0].keys()) + ['HIdef '+ref for ref in references])
+				for i in range(len(rows)):
+					writer.writerow(list(rows[i].values()) + [f'{x:.3f}' for x in HIdefs[i]])
+					
+				st.write('#### Deficiencies calculated for '+str(len(rows))+' galaxies')
+				st.write('Blank (NaN) entries mean the morphology or units were not recognised, the mass or diameter was not positive, or that reference does not define coefficients for that morphology.')
+				st.dataframe({ref: HIdefs[:, i] for i, ref in enumerate(references)})
+				st.download_button('Download CSV file', outfile.getvalue(), file_name='HIdeficiencies.csv')
+				
+				# Statistics as a function of environment. Individual deficiencies are too uncertain to say much, but the
+				# mean deficiency and fraction of deficient galaxies in bins of radius are meaningful.
+				if 'radius' in rows[0]:
+					st.write('#### Deficiency as a function of cluster-centric radius')
+					st.write('Mean deficiency and fraction of deficient galaxies in bins of projected radius, with confidence intervals from bootstrap resampling of the galaxies in each bin.')
+					
+					try:
+						batchradius = numpy.array([row['radius'] for row in rows], dtype=float)
+					except ValueError:
+						batchradius = None
+						st.write('#### The radius column must contain only numbers.')
+						
+					if batchradius is not None:
+						left_column3, right_column3 = st.columns(2)
+						with left_column3:
+							statref = st.selectbox('Coefficients', references, key='statref')
+							statnbins = st.number_input('Number of radial bins', min_value=1, max_value=50, value=5, key='statnbins')
+							statdeflimit = st.number_input('Deficient above', value=0.3, key='statdeflimit', help='Galaxies with a deficiency above this count as deficient')
+						with right_column3:
+							statnboot = st.number_input('Bootstrap resamples', min_value=100, max_value=100000, value=5000, step=1000, key='statnboot')
+							statconf = st.number_input('Confidence level', min_value=0.01, max_value=0.999, value=0.68, key='statconf')
+							statseed = st.number_input('Random seed', min_value=0, value=1, key='statseed')
+						
+						finiter = batchradius[numpy.isfinite(batchradius)]
+						if len(finiter) == 0:
+							st.write('#### No valid radius values.')
+						else:
+							statedges = numpy.linspace(finiter.min(), finiter.max(), statnbins+1)
+							statedges[-1] = numpy.nextafter(statedges[-1], numpy.inf)	# So the outermost galaxy is included
+							
+							bincounts, meandef, fracdef, meanlimits, fraclimits = deficiencyprofile(batchradius, HIdefs[:, references.index(statref)], statedges, statdeflimit, statnboot, statconf, statseed)
+							
+							bincentres = 0.5*(statedges[1:] + statedges[:-1])
+							st.write('##### Mean deficiency')
+							st.line_chart({'Radius': bincentres, 'Mean': meandef, 'Lower limit': meanlimits[0], 'Upper limit': meanlimits[1]}, x='Radius')
+							st.write('##### Deficient fraction')
+							st.line_chart({'Radius': bincentres, 'Fraction': fracdef, 'Lower limit': fraclimits[0], 'Upper limit': fraclimits[1]}, x='Radius')
+							st.dataframe({'Inner radius': statedges[:-1], 'Outer radius': statedges[1:], 'Galaxies': bincounts, 'Mean deficiency': meandef, 'Mean lower': meanlimits[0], 'Mean upper': meanlimits[1],
+							              'Deficient fraction': fracdef, 'Fraction lower': fraclimits[0], 'Fraction upper': fraclimits[1]}, hide_index=True)
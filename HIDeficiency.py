@@ -0,0 +1,132 @@
+# HI deficiency calculations, using the expected mass relation log(MHI_expected) = a + b.log10(d). Holds the
+# registry of preset a and b coefficients used by both the interactive and batch modes of HIDefCal.py. These are
+# stored as arrays so that they can be looked up for every galaxy and every reference set in one go, giving a
+# (galaxies x references) matrix of deficiencies for whole catalogues.
+
+import numpy
+import csv
+import os
+
+
+pc = 3.0856775812799588E16 # 1 pc in m
+solarmass = 1.98847E30
+
+# Preset coefficients are read from a data file, so new calibrations can be added without changing the code. The
+# file is read once when this module is first imported and the result is shared by every session of the app.
+coefffile = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'HIDefCoefficients.csv')
+
+
+# Read the coefficient file into a structured array with one row per (reference, morphology) pair, in file order.
+# Lines beginning with # are comments.
+def loadcoefficients(filename):
+	with open(filename, newline='') as infile:
+		rows = list(csv.DictReader(line for line in infile if not line.startswith('#')))
+		
+	table = numpy.array([(row['reference'], row['morphology'], float(row['a']), float(row['b'])) for row in rows],
+	                    dtype=[('reference', 'U64'), ('morphology', 'U64'), ('a', float), ('b', float)])
+	
+	return table
+
+
+coefftable = loadcoefficients(coefffile)
+
+# Reference and morphology names, in the order they first appear in the file (which sets the menu order in
+# HIDefCal.py), and their positions for direct indexing
+references   = tuple(dict.fromkeys(coefftable['reference']))
+morphologies = tuple(dict.fromkeys(coefftable['morphology']))
+refpos   = {name:i for i, name in enumerate(references)}
+morphpos = {name:i for i, name in enumerate(morphologies)}
+
+# Coefficients indexed as [reference, morphology, (a, b)]. Zero means the coefficient isn't defined by that
+# reference, in which case no deficiency is calculated. Missing pairs are treated the same way. Made read-only,
+# since it's shared between sessions.
+coefficients = numpy.zeros((len(references), len(morphologies), 2))
+coefficients[[refpos[name] for name in coefftable['reference']], [morphpos[name] for name in coefftable['morphology']]] = numpy.column_stack((coefftable['a'], coefftable['b']))
+coefficients.flags.writeable = False
+
+
+# Preset a and b coefficients for a single reference and morphology, as used by the interactive calculator
+def presetcoefficients(reference, morphology):
+	a, b = coefficients[refpos[reference], morphpos[morphology]]
+
+	return float(a), float(b)
+
+
+# Catalogues rarely use the exact menu names, so also accept the individual types. Stored sorted, so names can
+# be matched for a whole column at once with a binary search.
+morphaliases = {'E':'Early', 'S0':'Early', 'Sa':'Sa, Sab', 'Sab':'Sa, Sab', 'Sdm':'Sdm, Sm', 'Sm':'Sdm, Sm', 'Irr':'Im', 'Later':'Later (generally >= Scd)'}
+morphnames = dict(morphpos)
+morphnames.update({alias:morphpos[name] for alias, name in morphaliases.items() if name in morphpos})
+morphkeys = numpy.array(sorted(morphnames))
+morphindex = numpy.array([morphnames[name] for name in morphkeys])
+
+# Unit conversions into linear solar masses and kpc, matched in the same way (so also kept in sorted order)
+massunits = numpy.array(['Linear solar mass', 'Logarithmic solar mass', 'kg'])
+diamunits = numpy.array(['Mpc', 'kpc', 'm', 'pc'])
+diamscale = numpy.array([1000.0, 1.0, 1.0/(1000.0*pc), 1.0/1000.0])
+
+
+# Index of each of the given strings within a sorted array of names, or -1 if not present
+def lookup(values, sortednames):
+	values = numpy.char.strip(numpy.asarray(values, dtype=str))
+	index = numpy.searchsorted(sortednames, values)
+	index = numpy.minimum(index, len(sortednames)-1)
+	index[sortednames[index] != values] = -1
+
+	return index
+
+
+# Log of the HI mass in solar masses, for masses given in any of the HIDefCal.py units. Units can be a single
+# string or one per galaxy. Non-positive masses give NaN.
+def logsolarmass(himass, massunit):
+	himass = numpy.asarray(himass, dtype=float)
+	unit = unitindex(massunit, massunits)
+
+	with numpy.errstate(invalid='ignore', divide='ignore'):
+		logmass = numpy.where(unit == 1, himass, numpy.log10(numpy.where(himass > 0.0, himass, numpy.nan)))
+		logmass = numpy.where(unit == 2, logmass - numpy.log10(solarmass), logmass)
+		
+	return numpy.where(unit == -1, numpy.nan, logmass)
+
+
+# Optical diameter in kpc, for diameters given in m, pc, kpc or Mpc
+def diameterkpc(optdiam, optdunit):
+	optdiam = numpy.asarray(optdiam, dtype=float)
+	unit = unitindex(optdunit, diamunits)
+
+	return numpy.where(unit == -1, numpy.nan, optdiam * diamscale[unit])
+
+
+# Unit lookup which returns a plain integer when a single unit is given, so that it broadcasts against values
+# of any shape
+def unitindex(units, sortednames):
+	unit = lookup(numpy.atleast_1d(units), sortednames)
+	if unit.size == 1:
+		unit = unit[0]
+
+	return unit
+
+
+# Deficiency of every galaxy for every reference set. Masses, diameters and morphologies are 1D arrays (or
+# lists) with one entry per galaxy; units can be given per galaxy or once for all. Returns the expected log HI
+# mass and the deficiency, both of shape (galaxies, references). Entries are NaN where the morphology isn't
+# recognised, the reference doesn't define coefficients for it, or the mass or diameter isn't positive.
+def hidefbatch(himass, massunit, optdiam, optdunit, morphology):
+	logmass = logsolarmass(himass, massunit)
+	optd    = diameterkpc(optdiam, optdunit)
+
+	# One vectorised lookup into the coefficient array for all galaxies and references
+	morph = lookup(morphology, morphkeys)
+	morph = numpy.where(morph >= 0, morphindex[morph], -1)
+	coeffs = coefficients[:, morph, :]
+	coeffs[:, morph == -1, :] = numpy.nan
+	coeffs[(coeffs[:, :, 0] == 0.0) & (coeffs[:, :, 1] == 0.0)] = numpy.nan
+
+	with numpy.errstate(invalid='ignore', divide='ignore'):
+		logoptd = numpy.log10(numpy.where(optd > 0.0, optd, numpy.nan))
+
+	# Transpose so galaxies are along the first axis
+	MHI_exp = (coeffs[:, :, 0] + coeffs[:, :, 1]*logoptd).T
+	HIdef = MHI_exp - logmass[:, None]
+
+	return MHI_exp, HIdef
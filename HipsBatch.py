@@ -0,0 +1,235 @@
+# Batch cutouts from the hips2fits service for GetImages.py, e.g. stamps for every source in a catalogue. Requests
+# are sent from a pool of threads sharing one HTTP session, so connections to the server are reused, with failed
+# requests retried after increasing delays. Every cutout goes through the disk cache used for single images, and is
+# kept there while the batch runs, so identical cutouts (e.g. the same source listed twice) are only fetched once,
+# and repeating a batch fetches only the cutouts which have since been evicted (all of them, if the batch is bigger
+# than the cache). The cutouts are written to either a tar file of FITS files or a single multi-extension FITS file
+# as they arrive, so only a few are held in memory at once. The server can be changed, e.g. to the simple mock
+# server here, which makes images locally without any network access.
+
+import numpy
+import csv
+import io
+import re
+import tarfile
+import threading
+import imp
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from astropy.io import fits
+
+# Disk cache of the retrieved images
+import HipsCache
+imp.reload(HipsCache)
+from HipsCache import cachedimage, keep
+
+
+# The public hips2fits service
+defaultserver = 'https://alasky.cds.unistra.fr/hips-image-services/hips2fits'
+
+# Coordinates are rounded to this many decimal places of a degree (0.0036 arcseconds) when deciding whether two
+# cutouts are the same
+decimals = 6
+
+# Output formats
+outformats = ['Tar file of FITS images', 'Multi-extension FITS file']
+
+
+# HTTP session for a batch, keeping up to nworkers connections open. Requests which fail to connect, or get a
+# "too many requests" or server error response, are retried up to retries times, waiting backoff x 2^n seconds
+# before the nth retry.
+def makesession(nworkers=8, retries=4, backoff=0.5):
+	retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=['GET'])
+	adapter = HTTPAdapter(pool_connections=1, pool_maxsize=nworkers, max_retries=retry)
+	session = requests.Session()
+	session.mount('http://', adapter)
+	session.mount('https://', adapter)
+
+	return session
+
+
+# Cache key for a cutout. These match the queries of GetImages.py, so single images and batches share the cache;
+# cutouts from any other server are kept apart by adding the server to the key.
+def cutoutquery(service, ra, dec, fov, size, projection, server=defaultserver):
+	query = ('Coordinates', service, round(float(ra), decimals), round(float(dec), decimals), float(fov), int(size), int(size), projection)
+	if server != defaultserver:
+		query = query + (server,)
+
+	return query
+
+
+# Download one cutout (given by its cache key) as FITS bytes
+def fetchcutout(session, server, query, timeout=60.0):
+	service, ra, dec, fov, width, height, projection = query[1:8]
+	payload = {'hips':service, 'ra':ra, 'dec':dec, 'fov':fov, 'width':width, 'height':height, 'projection':projection, 'format':'fits'}
+
+	response = session.get(server, params=payload, timeout=timeout)
+	response.raise_for_status()
+	if not response.content.startswith(b'SIMPLE'):
+		raise ValueError('The server did not return a FITS file')
+
+	return response.content
+
+
+# Cutouts centred on every position in ras and decs (degrees), each fov degrees across and size pixels square, from
+# the given HiPS survey. Returns an iterator giving the FITS bytes for each position in turn, or None if the cutout
+# couldn't be retrieved, and a list to which the error messages for those are added as they happen. Cutouts are
+# only fetched as the iterator is used, nworkers at a time and up to ahead positions in advance of the one being
+# returned, so however many there are only a few are held in memory at once.
+def fetchcutouts(ras, decs, service, fov, size=200, projection='TAN', server=defaultserver, nworkers=8, retries=4, timeout=60.0, ahead=32):
+	queries = [cutoutquery(service, ra, dec, fov, size, projection, server) for ra, dec in zip(ras, decs)]
+	errors = []
+
+	def task(session, query):
+		try:
+			return cachedimage(query, lambda: fetchcutout(session, server, query, timeout))[0], None
+		except (requests.RequestException, ValueError, OSError) as err:
+			return None, str(err)
+
+	def cutouts():
+		# Position of the last use of each distinct cutout, after which it's no longer needed
+		last = {query: i for i, query in enumerate(queries)}
+		with keep(queries), makesession(nworkers, retries) as session, ThreadPoolExecutor(max_workers=nworkers) as executor:
+			# Each distinct cutout is only fetched once
+			futures = {}
+			for i, query in enumerate(queries):
+				for upcoming in queries[i:i+max(ahead, 1)]:
+					if upcoming not in futures:
+						futures[upcoming] = executor.submit(task, session, upcoming)
+				cutout, error = futures[query].result()
+				if last[query] == i:
+					del futures[query]
+				if error is not None:
+					errors.append(error)
+				yield cutout
+
+	return cutouts(), errors
+
+
+# Names, right ascensions and declinations (degrees) of the sources in a CSV table with a header row, from an open
+# file. The table needs ra and dec columns; names are taken from a name column if there is one, otherwise the
+# sources are numbered. Rows with positions which aren't numbers are skipped.
+def readpositions(infile):
+	reader = csv.reader(infile)
+	columns = [name.strip() for name in next(reader, [])]
+	if 'ra' not in columns or 'dec' not in columns:
+		raise ValueError('The table must have a header row with columns named ra and dec')
+
+	iname = columns.index('name') if 'name' in columns else None
+	ira = columns.index('ra')
+	idec = columns.index('dec')
+
+	names, ras, decs = [], [], []
+	for row in reader:
+		try:
+			ra, dec = float(row[ira]), float(row[idec])
+		except (ValueError, IndexError):
+			continue
+		names.append(row[iname].strip() if iname is not None and iname < len(row) and row[iname].strip() != '' else 'source'+str(len(names)+1))
+		ras.append(ra)
+		decs.append(dec)
+
+	return names, numpy.array(ras), numpy.array(decs)
+
+
+# Names for the cutouts of sources with the given names, safe to use as file names in a tar file and as EXTNAMEs :
+# anything but letters, digits and . + - _ is replaced with _, with leading dots removed (so there can be no hidden
+# files or ..), and names which have already been used get a numeric suffix.
+def cutoutnames(names):
+	used = set()
+	safenames = []
+	for name in names:
+		base = re.sub(r'[^\w.+-]', '_', str(name)).lstrip('.')
+		base = base if base != '' else 'source'
+		safename = base
+		number = 1
+		while safename in used:
+			number = number + 1
+			safename = base+'_'+str(number)
+		used.add(safename)
+		safenames.append(safename)
+
+	return safenames
+
+
+# Write the cutouts that were retrieved to an open binary file as a tar file, each as name.fits with the names made
+# safe by cutoutnames. Cutouts can be any iterable (e.g. from fetchcutouts), and are written one at a time. Returns
+# the number written.
+def writetar(outfile, names, cutouts):
+	nwritten = 0
+	with tarfile.open(fileobj=outfile, mode='w') as tar:
+		for cutout, name in zip(cutouts, cutoutnames(names)):
+			if cutout is None:
+				continue
+			info = tarfile.TarInfo(name+'.fits')
+			info.size = len(cutout)
+			tar.addfile(info, io.BytesIO(cutout))
+			nwritten = nwritten + 1
+
+	return nwritten
+
+
+# Write the cutouts that were retrieved to an open binary file as a single FITS file, with an empty primary HDU and
+# one image extension per cutout named after its source (as in cutoutnames). Cutouts can be any iterable, and each
+# extension is written as soon as its cutout arrives : it's written on its own after an empty primary HDU, and
+# everything after that primary HDU is added to the file. Returns the number written.
+def writemef(outfile, names, cutouts):
+	buffer = io.BytesIO()
+	fits.PrimaryHDU().writeto(buffer)
+	primarysize = buffer.tell()
+	outfile.write(buffer.getvalue())
+
+	nwritten = 0
+	for cutout, name in zip(cutouts, cutoutnames(names)):
+		if cutout is None:
+			continue
+		buffer = io.BytesIO()
+		with fits.open(io.BytesIO(cutout)) as image:
+			fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(image[0].data, image[0].header, name=name)]).writeto(buffer)
+		outfile.write(buffer.getbuffer()[primarysize:])
+		nwritten = nwritten + 1
+
+	return nwritten
+
+
+# Handles requests to the mock server, returning a FITS image of the requested size with a simple TAN WCS. The
+# pixel values are a smooth function of the position on the sky, so different cutouts give different images.
+class MockHandler(BaseHTTPRequestHandler):
+	def do_GET(self):
+		query = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+		try:
+			ra, dec, fov = float(query['ra']), float(query['dec']), float(query['fov'])
+			width, height = int(query['width']), int(query['height'])
+		except (KeyError, ValueError):
+			self.send_error(400, 'ra, dec, fov, width and height are required')
+			return
+
+		y, x = numpy.mgrid[0:height, 0:width]
+		scale = fov / width
+		image = numpy.sin(numpy.radians(ra + (x - width/2.0)*scale)*50.0) * numpy.cos(numpy.radians(dec + (y - height/2.0)*scale)*50.0)
+		header = fits.Header({'CTYPE1':'RA---TAN', 'CTYPE2':'DEC--TAN', 'CRVAL1':ra, 'CRVAL2':dec, 'CDELT1':-scale, 'CDELT2':scale,
+		                      'CRPIX1':width/2.0 + 0.5, 'CRPIX2':height/2.0 + 0.5, 'HIPS':query.get('hips', '')})
+		buffer = io.BytesIO()
+		fits.PrimaryHDU(image.astype(numpy.float32), header).writeto(buffer)
+
+		self.send_response(200)
+		self.send_header('Content-Type', 'application/fits')
+		self.send_header('Content-Length', str(len(buffer.getvalue())))
+		self.end_headers()
+		self.wfile.write(buffer.getvalue())
+
+	def log_message(self, format, *args):
+		pass
+
+
+# Start a mock hips2fits server on the local machine in a background thread, on the given port (0 for any free
+# one). Returns the server, to shut it down when finished, and its URL to use in place of the real service.
+def mockserver(port=0):
+	server = ThreadingHTTPServer(('127.0.0.1', port), MockHandler)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+
+	return server, 'http://127.0.0.1:'+str(server.server_address[1])+'/hips2fits'
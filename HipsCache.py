@@ -0,0 +1,126 @@
+# Disk cache of images from the hips2fits service for GetImages.py, so the same cutout is only ever downloaded once.
+# Each image is stored as the bytes of its FITS file, named by a hash of everything that determines its content (the
+# HiPS survey, centre, field of view, size and projection, or the WCS of an uploaded image). Reading a file marks it
+# as recently used by touching its modification time, and when the cache grows beyond its size limit the least
+# recently used files are deleted first. Files can also be kept from being deleted for a while, e.g. while a batch
+# which is still running needs them.
+
+import os
+import hashlib
+import tempfile
+import threading
+import contextlib
+import collections
+from io import BytesIO
+
+
+# Where the images are stored, and the default limit on their total size in bytes
+cachedir = os.path.join(tempfile.gettempdir(), 'HipsCache')
+maxbytes = 500*1024*1024
+
+# Files which mustn't be evicted, with the number of batches keeping each, shared by all the sessions (threads) of
+# the app. These are carried over if the module is reloaded, as the apps do on every rerun.
+pinned = globals().get('pinned', collections.Counter())
+pinlock = globals().get('pinlock', threading.Lock())
+
+
+# Name of the cache file for an image, from a hash of its parameters. Floats are written with repr so that e.g.
+# 30 and 30.0 give the same key.
+def cachefile(parameters):
+	text = repr(tuple(float(value) if isinstance(value, (int, float)) else str(value) for value in parameters))
+	key = hashlib.sha1(text.encode()).hexdigest()
+
+	return os.path.join(cachedir, 'hips_'+key+'.fits')
+
+
+# Keep the images with the given parameters (a list of them) from being evicted until the end of the with block
+@contextlib.contextmanager
+def keep(parameterlist):
+	files = collections.Counter(set(cachefile(parameters) for parameters in parameterlist))
+	with pinlock:
+		pinned.update(files)
+	try:
+		yield
+	finally:
+		with pinlock:
+			pinned.subtract(files)
+			for filename in files:
+				if pinned[filename] <= 0:
+					del pinned[filename]
+
+
+# Delete the least recently used images until the total size of the cache is within the limit, or only the images
+# being kept are left
+def evict(limit=maxbytes):
+	if not os.path.isdir(cachedir):
+		return
+
+	with pinlock:
+		kept = set(pinned)
+
+	entries = []
+	for entry in os.scandir(cachedir):
+		if entry.name.startswith('hips_') and entry.name.endswith('.fits'):
+			try:
+				info = entry.stat()
+			except OSError:
+				# Removed by another session since the directory was listed
+				continue
+			entries.append((info.st_mtime, info.st_size, entry.path))
+
+	total = sum(size for mtime, size, path in entries)
+	for mtime, size, path in sorted(entries):
+		if total <= limit:
+			break
+		if path in kept:
+			continue
+		try:
+			os.remove(path)
+		except OSError:
+			# Another session may have removed it already
+			pass
+		total = total - size
+
+
+# FITS bytes for an image with the given parameters, from the cache if it's been fetched before, otherwise by calling
+# fetch (which must return the bytes) and storing the result. Returns the bytes and whether they came from the cache.
+def cachedimage(parameters, fetch, limit=maxbytes):
+	filename = cachefile(parameters)
+	try:
+		with open(filename, 'rb') as infile:
+			data = infile.read()
+	except OSError:
+		data = None
+
+	if data is not None:
+		try:
+			os.utime(filename)
+		except OSError:
+			# Evicted by another session since it was read
+			pass
+		return data, True
+
+	data = fetch()
+
+	os.makedirs(cachedir, exist_ok=True)
+	# Written to a uniquely-named temporary file first, so another session (which may be another thread of the same
+	# process) never reads a half-written file or writes to the same one
+	handle, tempname = tempfile.mkstemp(dir=cachedir, suffix='.tmp')
+	try:
+		with os.fdopen(handle, 'wb') as outfile:
+			outfile.write(data)
+		os.replace(tempname, filename)
+	except BaseException:
+		os.remove(tempname)
+		raise
+	evict(limit)
+
+	return data, False
+
+
+# Bytes of a FITS HDUList, for storing in the cache
+def fitsbytes(hdulist):
+	buffer = BytesIO()
+	hdulist.writeto(buffer)
+
+	return buffer.getvalue()
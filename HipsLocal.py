@@ -0,0 +1,214 @@
+# Cutouts from HiPS surveys stored on local disk, as a drop-in replacement for the hips2fits service in GetImages.py
+# when working offline. A HiPS survey is a directory of square FITS tiles, one per HEALPix cell at each order (level
+# of resolution), with each tile pixel itself a HEALPix cell of a higher order in the nested scheme. The sky position
+# of every pixel of the requested image is found from its WCS, converted to a tile and a pixel within it by the
+# nested HEALPix indexing (implemented here with numpy, so no HEALPix library is needed), and the value of that tile
+# pixel is used (nearest-neighbour resampling). Tiles are memory-mapped and the most recently used are kept open, so
+# neighbouring cutouts only read what they need from disk; tiles which have changed on disk since are opened again.
+
+import numpy
+import os
+import functools
+from astropy.io import fits
+from astropy.wcs import WCS
+from astropy import units as u
+from astropy.coordinates import BarycentricMeanEcliptic
+
+
+# Number of tiles kept open at once
+maxtiles = 256
+
+# Coordinate frames of HiPS surveys (hips_frame), as astropy frames. Ecliptic coordinates are for the mean equinox
+# of J2000.
+frames = {'equatorial':'icrs', 'galactic':'galactic', 'ecliptic':BarycentricMeanEcliptic(equinox='J2000')}
+
+
+# Settings of a HiPS survey from the properties file in its directory, as a dictionary of strings
+def readproperties(root):
+	properties = {}
+	with open(os.path.join(root, 'properties'), encoding='utf-8') as infile:
+		for line in infile:
+			line = line.strip()
+			if line == '' or line.startswith('#') or '=' not in line:
+				continue
+			key, value = line.split('=', 1)
+			properties[key.strip()] = value.strip()
+
+	return properties
+
+
+# Maximum and minimum tile orders, tile width in pixels, and coordinate frame of a HiPS survey. Only surveys with
+# FITS tiles, in one of the frames above, can be used.
+def hipsinfo(root):
+	properties = readproperties(root)
+	if 'fits' not in properties.get('hips_tile_format', 'fits').split():
+		raise ValueError('The survey in '+root+' has no FITS tiles')
+	if properties.get('hips_frame', 'equatorial') not in frames:
+		raise ValueError('The survey in '+root+' is in an unsupported frame ('+properties['hips_frame']+')')
+
+	maxorder = int(properties.get('hips_order', 3))
+	minorder = int(properties.get('hips_order_min', 0))
+	tilewidth = int(properties.get('hips_tile_width', 512))
+	frame = properties.get('hips_frame', 'equatorial')
+
+	return maxorder, minorder, tilewidth, frame
+
+
+# Spread the bits of integers out to the even bit positions (e.g. 0b111 -> 0b10101), for interleaving two indices
+def spreadbits(values):
+	values = numpy.asarray(values, dtype=numpy.int64)
+	result = numpy.zeros_like(values)
+	for bit in range(30):
+		result |= ((values >> bit) & 1) << (2*bit)
+
+	return result
+
+
+# Base HEALPix cell (face, 0-11) and position within it (ix, iy, each 0 to 2^order - 1) of points at the given
+# longitudes and latitudes (degrees), following ang2pix in the nested scheme. ix increases from the southern corner
+# of the cell towards the eastern one, iy towards the western one.
+def ang2xyf(order, lon, lat):
+	nside = 2**order
+	z = numpy.sin(numpy.radians(lat))
+	za = numpy.abs(z)
+	tt = numpy.mod(numpy.asarray(lon, dtype=float), 360.0) / 90.0
+
+	# Equatorial region
+	temp1 = nside * (0.5 + tt)
+	temp2 = nside * z * 0.75
+	jp = (temp1 - temp2).astype(numpy.int64)
+	jm = (temp1 + temp2).astype(numpy.int64)
+	ifp = jp >> order
+	ifm = jm >> order
+	face = numpy.where(ifp == ifm, ifp | 4, numpy.where(ifp < ifm, ifp, ifm + 8))
+	ix = jm & (nside - 1)
+	iy = nside - (jp & (nside - 1)) - 1
+
+	# Polar caps. 1 - |z| is found from the latitude directly so it's accurate close to the poles.
+	ntt = numpy.minimum(tt.astype(numpy.int64), 3)
+	tp = tt - ntt
+	tmp = nside * numpy.sqrt(3.0 * numpy.cos(numpy.radians(lat))**2.0 / (1.0 + za))
+	jpp = numpy.minimum((tp * tmp).astype(numpy.int64), nside - 1)
+	jmp = numpy.minimum(((1.0 - tp) * tmp).astype(numpy.int64), nside - 1)
+	polar = za > 2.0/3.0
+	north = z >= 0.0
+	face = numpy.where(polar, numpy.where(north, ntt, ntt + 8), face)
+	ix = numpy.where(polar, numpy.where(north, nside - jmp - 1, jpp), ix)
+	iy = numpy.where(polar, numpy.where(north, nside - jpp - 1, jmp), iy)
+
+	return ix, iy, face
+
+
+# Nested HEALPix index at the given order of points at the given longitudes and latitudes (degrees)
+def ang2pix(order, lon, lat):
+	ix, iy, face = ang2xyf(order, lon, lat)
+
+	return face * 4**order + spreadbits(ix) + 2*spreadbits(iy)
+
+
+# Path of the FITS file of a tile
+def tilepath(root, order, tile):
+	return os.path.join(root, 'Norder'+str(order), 'Dir'+str((tile // 10000) * 10000), 'Npix'+str(tile)+'.fits')
+
+
+# Data of one tile as a (memory-mapped where possible) array, or None if the survey has no data there. Blank
+# values of integer tiles are left as they are, and replaced when the cutout is made.
+def readtile(path):
+	try:
+		mtime = os.stat(path).st_mtime_ns
+	except OSError:
+		return None
+
+	return opentile(path, mtime)
+
+
+# Data of a tile as for readtile, kept open by its path and modification time, so a tile which is rewritten on disk
+# is opened again rather than the old version used
+@functools.lru_cache(maxsize=maxtiles)
+def opentile(path, mtime):
+	with fits.open(path, memmap=True) as hdulist:
+		return hdulist[0].data, hdulist[0].header.get('BLANK')
+
+
+# Values of a HiPS survey at the given longitudes and latitudes (degrees, in the survey's frame), from the tiles of
+# the given order. Points with no data give NaN.
+def samplehips(root, order, tilewidth, lon, lat):
+	lon = numpy.asarray(lon, dtype=float)
+	lat = numpy.asarray(lat, dtype=float)
+	values = numpy.full(lon.shape, numpy.nan)
+	valid = numpy.isfinite(lon) & numpy.isfinite(lat)
+
+	# Each tile pixel is a cell of a higher order, with the tile given by the leading bits of its position in the
+	# base cell and the position within the tile by the rest. Within a tile, the FITS column increases with ix and
+	# the row with decreasing iy, as in the HiPS standard.
+	shift = int(round(numpy.log2(tilewidth)))
+	ix, iy, face = ang2xyf(order + shift, lon[valid], lat[valid])
+	tiles = face * 4**order + spreadbits(ix >> shift) + 2*spreadbits(iy >> shift)
+	columns = ix & (tilewidth - 1)
+	rows = tilewidth - 1 - (iy & (tilewidth - 1))
+
+	sampled = numpy.full(len(tiles), numpy.nan)
+	# Points are grouped by tile, so each tile is only looked up once
+	unique, inverse = numpy.unique(tiles, return_inverse=True)
+	grouped = numpy.argsort(inverse, kind='stable')
+	bounds = numpy.searchsorted(inverse[grouped], numpy.arange(len(unique) + 1))
+	for i, tile in enumerate(unique):
+		entry = readtile(tilepath(root, order, int(tile)))
+		if entry is None:
+			continue
+		data, blank = entry
+		points = grouped[bounds[i]:bounds[i+1]]
+		tilevalues = data[rows[points], columns[points]].astype(float)
+		if blank is not None and numpy.issubdtype(data.dtype, numpy.integer):
+			tilevalues[data[rows[points], columns[points]] == blank] = numpy.nan
+		sampled[points] = tilevalues
+
+	values[valid] = sampled
+
+	return values
+
+
+# Tile order to use for an image with the given pixel size (degrees) : the lowest whose pixels are no bigger,
+# within the orders the survey has
+def bestorder(pixelsize, maxorder, minorder, tilewidth):
+	# HEALPix cells at order k are sqrt(4 pi / (12 4^k)) radians across
+	pixelorder = numpy.log2(numpy.sqrt(4.0*numpy.pi/12.0) / numpy.radians(pixelsize))
+	order = int(numpy.ceil(pixelorder - numpy.log2(tilewidth) - 1E-6))
+
+	return min(max(order, minorder), maxorder)
+
+
+# Cutout of a local HiPS survey covering the pixels of the given celestial WCS, which must include the image size.
+# Returns an HDUList with the image and the WCS in its header, like the hips2fits service.
+def localcutoutwcs(root, wcs):
+	maxorder, minorder, tilewidth, frame = hipsinfo(root)
+	width, height = wcs.pixel_shape
+
+	y, x = numpy.mgrid[0:height, 0:width]
+	with numpy.errstate(invalid='ignore'):
+		coords = wcs.pixel_to_world(x, y)
+	coords = coords.transform_to(frames[frame])
+	lon, lat = coords.spherical.lon.deg, coords.spherical.lat.deg
+
+	pixelsize = numpy.mean([scale.to_value(u.deg) for scale in wcs.proj_plane_pixel_scales()])
+	order = bestorder(pixelsize, maxorder, minorder, tilewidth)
+	data = samplehips(root, order, tilewidth, lon, lat)
+
+	header = wcs.to_header()
+	header['HIPSROOT'] = os.path.abspath(root)
+	header['HIPSORD'] = (order, 'HiPS tile order used')
+
+	return fits.HDUList([fits.PrimaryHDU(data.astype(numpy.float32), header)])
+
+
+# Cutout of a local HiPS survey centred on ra, dec (degrees), fov degrees wide and width x height pixels, in the
+# given projection, as for hips2fits.query
+def localcutout(root, ra, dec, fov, width, height, projection='TAN'):
+	wcs = WCS(naxis=2)
+	wcs.wcs.ctype = ['RA---'+projection, 'DEC--'+projection]
+	wcs.wcs.crval = [ra, dec]
+	wcs.wcs.crpix = [width/2.0 + 0.5, height/2.0 + 0.5]
+	wcs.wcs.cdelt = [-fov/width, fov/width]
+	wcs.pixel_shape = (width, height)
+
+	return localcutoutwcs(root, wcs)
@@ -22,7 +22,7 @@ import pytz
 # Returns human-readable versions of numbers, e.g, comma-separated or scientific notation depending on size
 import NiceNumber
 imp.reload(NiceNumber)
-from NiceNumber import nicenumber
+from NiceNumber import nicenumber, nicenumbers
 
 
 # Angular separation calculator. Taken from astropy source code (later verison, this since this not included in 3.2.2; modified to assume inputs are radians)
@@ -219,6 +219,14 @@ if docalc == True:
 		ObsFileString = ObsFileString+'#Telescope : MinAngle='+str(minelvangle)+', MaxAngle='+str(maxelvangle)+', SunMaxAngle='+str(maxsunang)+'\n'
 		ObsFileString = ObsFileString+'#Date-Time Day SourceAltitude SunAltitude SunAng.Separation Errors/Problems'+'\n'
 		
+		# The per-minute values for the text file are stored here and only formatted once the loop is finished, so each
+		# column can be formatted in one go rather than one number at a time
+		FileDateTimes  = []
+		FileSourceAlts = []
+		FileSunAlts    = []
+		FileSunSeps    = []
+		FileProblems   = []
+		
 		
 	# Start at the beginning, incrementing in steps of one minute until we go beyond the end point
 	while currentdatetime <= finaldatetime and okaytoproceed == True:
@@ -327,8 +335,12 @@ if docalc == True:
 		if minutecount == 0 or minutecount == 15:
 			st.markdown(f":blue[{str(currentdatetime.time())}] $~~~~~~~~~$ {sourcecolour}{str(nicenumber(SourceAltAz.alt.deg)).zfill(6)}] $~~~~~~~~~~~~~~~~~~$ {suncolour}{str(nicenumber(SunCoordsAlt)).zfill(6)}] $~~~~~~~~~~~~~~~~~~~$ {sunsepcolor}{str(nicenumber(skysep)).zfill(6)}]")
 		
-		# Store similar information in the text file string		
-		ObsFileString = ObsFileString+str(currentdatetime)+' '+str(calendar.day_name[currentdatetime.weekday()])+' '+str(nicenumber(SourceAltAz.alt.deg))+' '+str(nicenumber(SunCoordsAlt))+' '+str(nicenumber(skysep))+' '+problems+'\n'
+		# Store similar information for the text file
+		FileDateTimes.append(str(currentdatetime)+' '+str(calendar.day_name[currentdatetime.weekday()]))
+		FileSourceAlts.append(SourceAlt)
+		FileSunAlts.append(SunCoordsAlt)
+		FileSunSeps.append(skysep)
+		FileProblems.append(problems)
 		
 		
 		# Advance the time by one minute in a test variable
@@ -350,4 +362,8 @@ if docalc == True:
 		
 	# Only allow the download of the file contents if it was produced
 	if okaytoproceed == True:
+		# Format the numerical columns in bulk and assemble the rows of the text file
+		FileColumns = zip(FileDateTimes, nicenumbers(FileSourceAlts), nicenumbers(FileSunAlts), nicenumbers(FileSunSeps), FileProblems)
+		ObsFileString = ObsFileString+''.join(' '.join(row)+'\n' for row in FileColumns)
+		
 		st.download_button('Download ASCII text file', ObsFileString, file_name='MyObservations.txt')
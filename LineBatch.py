@@ -0,0 +1,68 @@
+# Batch conversion of tables of observed values (frequencies, wavelengths, redshifts or velocities) using the same
+# maths as WhatsMyLIne.py. Tables are read and written as CSV a chunk of rows at a time (by TableIO.py), with each
+# chunk converted in one go with numpy, so memory use stays the same however long the table is.
+
+import numpy
+import imp
+
+# Conversions between observed frequency, redshift, wavelength and velocities
+import LineConversion
+imp.reload(LineConversion)
+from LineConversion import lineconversion, observedfrequency
+
+# Scale factors between the supported units and SI
+import UnitScale
+imp.reload(UnitScale)
+from UnitScale import tosi, unitmatch
+
+# Reading and writing tables a chunk at a time
+import TableIO
+imp.reload(TableIO)
+from TableIO import tonumbers, stripped, converttable
+
+
+# Columns read from the input table, and added to the output
+incolumns = ['value', 'type', 'unit', 'restline']
+outcolumns = ['Frequency (Hz)', 'Wavelength (m)', 'Redshift', 'Optical velocity (km/s)', 'Radio velocity (km/s)', 'Relativistic velocity (km/s)']
+
+
+# Rest frequencies (Hz) for a column of rest lines, each either the name of one of the preset lines (a dictionary of
+# names and frequencies in Hz) or a frequency in Hz. Unknown names give NaN. Each distinct name is only looked up once.
+def restfrequencies(restlines, presets):
+	names, inverse = numpy.unique(numpy.asarray(restlines, dtype=str), return_inverse=True)
+	restfreqs = numpy.array([presets.get(name.strip(), tonumbers([name])[0]) for name in names])
+	restfreqs[~(restfreqs > 0.0)] = numpy.nan
+
+	return restfreqs[inverse].reshape(numpy.shape(restlines))
+
+
+# Convert one chunk of rows. Values are a list with one entry per row; types, units and rest lines can be lists
+# of the same length or single values for all the rows. Returns the observed frequency, redshifted wavelength,
+# redshift and velocities, with NaN where a row can't be converted (e.g. units which don't match the type).
+def convertchunk(values, types, units, restlines, presets):
+	types = stripped(types)
+	units = stripped(units)
+	restfreqs = restfrequencies(restlines, presets)
+
+	with numpy.errstate(invalid='ignore', divide='ignore'):
+		obsfreq = observedfrequency(tosi(tonumbers(values), units), types, restfreqs)
+		obsfreq = numpy.where(unitmatch(units, types), obsfreq, numpy.nan)
+		redshift, redwave, obsoptvel, obsradvel, obsrelvel = lineconversion(restfreqs, obsfreq)
+
+	return obsfreq, redwave, redshift, obsoptvel, obsradvel, obsrelvel
+
+
+# Raise a ValueError if a table doesn't have the columns needed
+def checkcolumns(columns):
+	if 'value' not in columns:
+		raise ValueError('The table must have a header row with a column named value')
+
+
+# Convert a whole CSV table, from an open input file to an open output file. The input needs a header row with a
+# value column; type, unit and restline columns are optional, with the given defaults used for any that are
+# missing. All the input columns are copied to the output, followed by the converted values. Returns the number
+# of rows converted.
+def convertcsv(infile, outfile, presets, deftype='Frequency', defunit='Hz', defrestline='HI', chunksize=100000):
+	convert = lambda table, number: convertchunk(table['value'], table.get('type', deftype), table.get('unit', defunit), table.get('restline', defrestline), presets)
+
+	return converttable(infile, outfile, convert, incolumns, outcolumns, checkcolumns, chunksize)
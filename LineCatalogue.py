@@ -0,0 +1,206 @@
+# Local spectral line catalogue. Reads line lists exported from Splatalogue (CSV or colon-separated) or in the
+# JPL/CDMS .cat format, and stores them as a pair of .npy files (rest frequencies in Hz and line names) sorted by
+# frequency. These are opened memory-mapped, so even catalogues of millions of transitions load instantly and take
+# no memory until used, and lines in any frequency range are found with a binary search.
+
+import numpy
+import csv
+import os
+import hashlib
+import tempfile
+
+
+# Default catalogue shipped with the code
+defaultcatalogue = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'LineCatalogue.csv')
+
+# Where the converted catalogues are stored
+cachedir = os.path.join(tempfile.gettempdir(), 'LineCatalogueCache')
+
+# Frequency units recognised in CSV column names. Splatalogue and the JPL/CDMS catalogues use MHz, so this is
+# assumed if the column name doesn't give a unit.
+frequnits = {'THz':1E12, 'GHz':1E9, 'MHz':1E6, 'kHz':1E3, 'Hz':1.0}
+
+
+# Scale factor to Hz from a column name such as 'Freq-GHz(rest frame,redshifted)'
+def unitfactor(columnname):
+	for unit in frequnits:
+		if unit in columnname:
+			return frequnits[unit]
+
+	return 1E6
+
+
+# Names and rest frequencies (Hz) from a Splatalogue-style export. The delimiter is detected automatically. Line
+# names are the species plus the quantum numbers, if given. Measured frequencies are used where available,
+# otherwise calculated ones. Lines without any frequency are skipped. Lines beginning with # are comments.
+def readsplatalogue(filename):
+	with open(filename, newline='') as infile:
+		lines = (line for line in infile if not line.startswith('#') and line.strip() != '')
+		firstline = next(lines)
+		# Splatalogue column names contain commas, so the delimiter is taken as the most common candidate in the
+		# header rather than guessed by csv.Sniffer
+		delimiter = max(',:\t;', key=firstline.count)
+		reader = csv.reader(lines, delimiter=delimiter)
+		columns = [name.strip() for name in next(csv.reader([firstline], delimiter=delimiter))]
+
+		namecol = next(i for i, name in enumerate(columns) if name.lower() in ['species', 'name', 'line'])
+		qncols = [i for i, name in enumerate(columns) if 'QN' in name]
+		freqcols = [i for i, name in enumerate(columns) if 'freq' in name.lower() and 'err' not in name.lower()]
+		# Measured frequencies take priority
+		freqcols.sort(key=lambda i: 'meas' not in columns[i].lower())
+		factors = [unitfactor(columns[i]) for i in freqcols]
+
+		names = []
+		freqs = []
+		for row in reader:
+			for i, factor in zip(freqcols, factors):
+				if i < len(row) and row[i].strip() != '':
+					freqs.append(float(row[i]) * factor)
+					names.append(' '.join([row[namecol].strip()] + [row[j].strip() for j in qncols if j < len(row) and row[j].strip() != '']))
+					break
+
+	return names, freqs
+
+
+# Names and rest frequencies (Hz) from a JPL or CDMS catalogue file. These have fixed-width columns, with the
+# frequency in MHz in the first 13 characters and the species tag (negative for measured lines) in characters 45-51.
+# The species name isn't in the file, so lines are named by their tag and quantum numbers.
+def readcat(filename):
+	names = []
+	freqs = []
+	with open(filename) as infile:
+		for line in infile:
+			if line.strip() == '':
+				continue
+			freqs.append(float(line[0:13]) * 1E6)
+			names.append('Tag '+str(abs(int(line[44:51])))+' '+line[55:].strip())
+
+	return names, freqs
+
+
+# Read a catalogue in either format, according to the file extension
+def readcatalogue(filename):
+	if filename.lower().endswith('.cat'):
+		return readcat(filename)
+
+	return readsplatalogue(filename)
+
+
+# Names of the .npy files holding the sorted frequencies and names for a catalogue. These are kept in a cache
+# directory (the original may well be somewhere read-only), named by a hash of the catalogue's full path.
+def npyfiles(filename):
+	key = hashlib.sha1(os.path.abspath(filename).encode()).hexdigest()[0:16]
+	basename = os.path.join(cachedir, key)
+
+	return basename+'_freq.npy', basename+'_names.npy'
+
+
+# Save an array to a .npy file. It's written to a uniquely-named temporary file first and then renamed, so another
+# session never memory-maps a half-written file.
+def savenpy(filename, array):
+	handle, tempname = tempfile.mkstemp(dir=cachedir, suffix='.tmp')
+	try:
+		with os.fdopen(handle, 'wb') as outfile:
+			numpy.save(outfile, array)
+		os.replace(tempname, filename)
+	except BaseException:
+		os.remove(tempname)
+		raise
+
+
+# Convert a catalogue to the sorted .npy files. The names are written first, since the frequency file's time is what
+# shows the conversion is up to date.
+def savecatalogue(filename):
+	names, freqs = readcatalogue(filename)
+	freqs = numpy.asarray(freqs, dtype=float)
+	order = numpy.argsort(freqs, kind='stable')
+
+	freqfile, namefile = npyfiles(filename)
+	os.makedirs(cachedir, exist_ok=True)
+	savenpy(namefile, numpy.asarray(names, dtype=str)[order])
+	savenpy(freqfile, freqs[order])
+
+
+# Memory-mapped rest frequencies (Hz, sorted) and names for a catalogue. The .npy files are created the first time
+# a catalogue is used, or again if the original has changed since.
+def loadcatalogue(filename=defaultcatalogue):
+	freqfile, namefile = npyfiles(filename)
+	if not os.path.exists(freqfile) or not os.path.exists(namefile) or os.path.getmtime(freqfile) < os.path.getmtime(filename):
+		savecatalogue(filename)
+
+	return numpy.load(freqfile, mmap_mode='r'), numpy.load(namefile, mmap_mode='r')
+
+
+# Index range (start, stop) of the lines with rest frequencies between fmin and fmax (Hz). Works on arrays of
+# ranges as well as single ones.
+def linerange(freqs, fmin, fmax):
+	return numpy.searchsorted(freqs, fmin, side='left'), numpy.searchsorted(freqs, fmax, side='right')
+
+
+# Rest frequencies and names of the lines which would be observed between obsfmin and obsfmax (Hz) at redshift z
+def linesinband(freqs, names, obsfmin, obsfmax, z=0.0):
+	start, stop = linerange(freqs, obsfmin*(1.0+z), obsfmax*(1.0+z))
+
+	return numpy.array(freqs[start:stop]), numpy.array(names[start:stop])
+
+
+# Every catalogue line which could be each of the observed lines (frequencies in Hz) at a redshift between zmin and
+# zmax. Returns the index of the observed line, the index of the catalogue line, and the implied redshift for each
+# candidate. The candidates for all observed lines are found with one binary search, and their indices built
+# without a loop.
+def impliedredshifts(freqs, obsfreqs, zmin, zmax):
+	obsfreqs = numpy.atleast_1d(numpy.asarray(obsfreqs, dtype=float))
+	start, stop = linerange(freqs, obsfreqs*(1.0+zmin), obsfreqs*(1.0+zmax))
+	counts = stop - start
+
+	obsindex  = numpy.repeat(numpy.arange(len(obsfreqs)), counts)
+	lineindex = numpy.repeat(start - (numpy.cumsum(counts) - counts), counts) + numpy.arange(counts.sum())
+	redshift  = numpy.asarray(freqs[lineindex]) / obsfreqs[obsindex] - 1.0
+
+	return obsindex, lineindex, redshift
+
+
+# Identify a set of observed lines (frequencies in Hz) by finding the redshifts at which the most of them match a
+# catalogue line. Implied redshifts are binned in log(1+z), with bins equivalent to the given velocity tolerance
+# (km/s), and each pair of adjacent bins is scored by how many different observed lines have a candidate in it.
+# This takes a sort of the candidates rather than a comparison of every candidate with every other.
+# Returns up to nmatches matches, best first, each a tuple of the redshift, the number of observed lines matched,
+# and the observed line indices, catalogue line indices and implied redshifts of the candidates.
+def identifylines(freqs, obsfreqs, zmin, zmax, tolerance=50.0, nmatches=10):
+	obsindex, lineindex, redshift = impliedredshifts(freqs, obsfreqs, zmin, zmax)
+	if len(redshift) == 0:
+		return []
+
+	width = tolerance*1000.0 / 299792458.0
+	bins = numpy.floor(numpy.log1p(redshift) / width).astype(numpy.int64)
+
+	# Candidates sorted by bin, so those in any window are a contiguous block
+	order = numpy.argsort(bins, kind='stable')
+	obsindex, lineindex, redshift, bins = obsindex[order], lineindex[order], redshift[order], bins[order]
+
+	# Window w covers bins w-1 and w, so lines either side of a bin edge are still grouped together. Count the
+	# distinct observed lines in each window, using a single integer key for each (window, observed line) pair.
+	nobs = obsindex.max() + 1
+	keys = numpy.unique(numpy.concatenate((bins*nobs + obsindex, (bins+1)*nobs + obsindex)))
+	windows, nlines = numpy.unique(keys // nobs, return_counts=True)
+
+	# Best windows first. The redshift of a match is the median of the candidates in the window, and only those
+	# within the tolerance of it are kept. Neighbouring windows share a bin, so a window is skipped if it gives the
+	# same redshift as one already found.
+	matches = []
+	for w in windows[numpy.lexsort((windows, -nlines))]:
+		start = numpy.searchsorted(bins, w-1, side='left')
+		stop  = numpy.searchsorted(bins, w, side='right')
+		zmatch = numpy.median(redshift[start:stop])
+		if any(abs(numpy.log1p(zmatch) - numpy.log1p(match[0])) < width for match in matches):
+			continue
+
+		keep = start + numpy.nonzero(abs(numpy.log1p(redshift[start:stop]) - numpy.log1p(zmatch)) <= width)[0]
+		matches.append((zmatch, len(numpy.unique(obsindex[keep])), obsindex[keep], lineindex[keep], redshift[keep]))
+		if len(matches) == nmatches:
+			break
+
+	# Trimming to the tolerance can lose lines, so put the matches back in order
+	matches.sort(key=lambda match: -match[1])
+
+	return matches
@@ -0,0 +1,57 @@
+# Conversions between the observed frequency of a spectral line and its redshift, wavelength and velocities in the
+# optical, radio and relativistic conventions. Everything uses closed-form expressions on plain numbers in SI units
+# (Hz, m, m/s), so it works equally well on single values and on numpy arrays of any size, e.g. a whole spectral
+# axis. Used by WhatsMyLIne.py.
+
+import numpy
+
+
+# Speed of light in m/s (exact, identical to the astropy constant)
+c = 299792458.0
+
+
+# Redshift, redshifted wavelength (m), and optical, radio and relativistic velocities (km/s) for a line with the
+# given rest and observed frequencies (Hz). These are the same definitions as the astropy doppler_optical,
+# doppler_radio and doppler_relativistic equivalencies.
+def lineconversion(restfreq, obsfreq):
+	restfreq = numpy.asarray(restfreq, dtype=float)
+	obsfreq  = numpy.asarray(obsfreq, dtype=float)
+
+	ratio = obsfreq / restfreq
+
+	redshift  = 1.0/ratio - 1.0
+	redwave   = c / obsfreq
+	obsoptvel = (c/1000.0) * redshift
+	obsradvel = (c/1000.0) * (1.0 - ratio)
+	obsrelvel = (c/1000.0) * (1.0 - ratio*ratio) / (1.0 + ratio*ratio)
+
+	return redshift, redwave, obsoptvel, obsradvel, obsrelvel
+
+
+# The inverse : observed frequency (Hz) of a line with the given rest frequency (Hz), from an observed value of any
+# of the types in the WhatsMyLIne.py menu. Values must be in SI units (Hz, m, m/s, or dimensionless for redshift).
+# The type can be a single string or an array of strings, one per value. Unknown types give NaN.
+def observedfrequency(obsvalue, obstype, restfreq):
+	obsvalue = numpy.asarray(obsvalue, dtype=float)
+	restfreq = numpy.asarray(restfreq, dtype=float)
+	obstype  = numpy.asarray(obstype)
+
+	# Velocity as a fraction of the speed of light, only meaningful for the velocity types
+	k = obsvalue / c
+
+	with numpy.errstate(invalid='ignore', divide='ignore'):
+		obsfreq = numpy.select([obstype == 'Frequency',
+		                        obstype == 'Wavelength',
+		                        obstype == 'Redshift',
+		                        obstype == 'Optical velocity',
+		                        obstype == 'Radio velocity',
+		                        obstype == 'Relativistic velocity'],
+		                       [obsvalue,
+		                        c / obsvalue,
+		                        restfreq / (1.0 + obsvalue),
+		                        restfreq / (1.0 + k),
+		                        restfreq * (1.0 - k),
+		                        restfreq * numpy.sqrt((1.0 - k) / (1.0 + k))],
+		                       default=numpy.nan)
+
+	return obsfreq
@@ -0,0 +1,129 @@
+# Mock catalogue simulator for estimating survey completeness. Draws galaxies from an HI mass function, places
+# them at random distances, converts them to fluxes with the standard MHI = 2.36E5*d^2*SHI relation, adds noise,
+# and applies the ALFALFA integrated S/N criterion (see AASN.py) to decide which are detected.
+# Sources are generated in fixed-size chunks so memory use doesn't depend on the total number, and only binned
+# counts are kept. Each chunk has its own random number stream derived from a single seed, so the results are
+# identical regardless of how many processes are used.
+
+import numpy
+import imp
+from concurrent.futures import ProcessPoolExecutor
+
+# Function to calculate the total integrated S/N, array version
+import AASN
+imp.reload(AASN)
+from AASN import aasnarray
+
+
+# Default parameters. The mass function is the ALFALFA 100% Schechter fit of Jones et al. 2018. Line widths are
+# drawn from a log-normal distribution independent of mass, which is a simplification but keeps the widths
+# under direct control. Distances are in Mpc, widths and velocity resolution in km/s, rms in Jy.
+defaultparams = {'logmstar':9.94, 'alpha':-1.25, 'logmmin':6.0, 'logmmax':11.0, 'dmin':1.0, 'dmax':100.0,
+                 'w50median':150.0, 'w50scatter':0.2, 'rms':0.0016, 'vres':10.0, 'snlimit':6.5,
+                 'massbins':numpy.linspace(6.0, 11.0, 26), 'distbins':numpy.linspace(1.0, 100.0, 21)}
+
+
+# Inverse of the cumulative Schechter function in log mass, tabulated once per parameter set so that masses can
+# be drawn by interpolating uniform random numbers
+def schechtercdf(logmstar, alpha, logmmin, logmmax, npoints=4096):
+	logm = numpy.linspace(logmmin, logmmax, npoints)
+	x = 10.0**(logm - logmstar)
+	# Number per unit log mass
+	dndlogm = x**(alpha + 1.0) * numpy.exp(-x)
+
+	cdf = numpy.concatenate(([0.0], numpy.cumsum(0.5*(dndlogm[1:] + dndlogm[:-1]) * numpy.diff(logm))))
+	cdf = cdf / cdf[-1]
+
+	return cdf, logm
+
+
+# Generate one chunk of mock sources. Returns the log HI mass, distance (Mpc), line width (km/s), true and
+# observed (noisy) total flux (Jy km/s), and whether each source is detected.
+def mockchunk(rng, nsources, params, cdf=None):
+	if cdf is None:
+		cdf = schechtercdf(params['logmstar'], params['alpha'], params['logmmin'], params['logmmax'])
+
+	logm = numpy.interp(rng.random(nsources), cdf[0], cdf[1])
+
+	# Uniform in volume between the minimum and maximum distances
+	dmin3 = params['dmin']**3.0
+	dist = (dmin3 + rng.random(nsources)*(params['dmax']**3.0 - dmin3))**(1.0/3.0)
+
+	w50 = params['w50median'] * 10.0**(params['w50scatter']*rng.standard_normal(nsources))
+
+	flux = 10.0**logm / (2.36E5 * dist*dist)
+
+	# Noise on the total flux of a top-hat summed over W50/vres channels, each of width vres
+	fluxerr = params['rms'] * numpy.sqrt(w50*params['vres'])
+	obsflux = flux + fluxerr*rng.standard_normal(nsources)
+
+	detected = aasnarray(obsflux, w50, params['vres'], params['rms']) >= params['snlimit']
+
+	return logm, dist, w50, flux, obsflux, detected
+
+
+# Streaming generator of mock catalogue chunks, for when the sources themselves are wanted rather than just the
+# completeness. Yields the same tuples as mockchunk.
+def mocksources(nsources, params=defaultparams, chunksize=1000000, seed=None):
+	cdf = schechtercdf(params['logmstar'], params['alpha'], params['logmmin'], params['logmmax'])
+
+	for seedseq, n in chunkseeds(nsources, chunksize, seed):
+		yield mockchunk(numpy.random.default_rng(seedseq), n, params, cdf)
+
+
+# Split the total number of sources into chunks, each with an independent seed spawned from the main one
+def chunkseeds(nsources, chunksize, seed):
+	nchunks = int(numpy.ceil(nsources / chunksize))
+	seeds = numpy.random.SeedSequence(seed).spawn(nchunks)
+
+	for i in range(nchunks):
+		yield seeds[i], min(chunksize, nsources - i*chunksize)
+
+
+# Binned counts of all and detected sources for one chunk, in log mass (rows) and distance (columns). This is
+# all that needs to be returned from each worker process.
+def chunkcounts(task):
+	seedseq, nsources, params = task
+
+	logm, dist, w50, flux, obsflux, detected = mockchunk(numpy.random.default_rng(seedseq), nsources, params)
+
+	bins = (params['massbins'], params['distbins'])
+	allcounts = numpy.histogram2d(logm, dist, bins=bins)[0]
+	detcounts = numpy.histogram2d(logm[detected], dist[detected], bins=bins)[0]
+
+	return allcounts, detcounts
+
+
+# Run the full simulation. Returns the total and detected counts in each (log mass, distance) bin, summed over
+# all chunks. With nworkers > 1 the chunks are spread over that many processes.
+def simulate(nsources, params=defaultparams, chunksize=1000000, seed=None, nworkers=1):
+	shape = (len(params['massbins'])-1, len(params['distbins'])-1)
+	allcounts = numpy.zeros(shape)
+	detcounts = numpy.zeros(shape)
+
+	# Each task only carries a seed, not the sources, so queueing them all up front costs almost nothing
+	tasks = ((seedseq, n, params) for seedseq, n in chunkseeds(nsources, chunksize, seed))
+
+	if nworkers > 1:
+		with ProcessPoolExecutor(max_workers=nworkers) as executor:
+			for chunkall, chunkdet in executor.map(chunkcounts, tasks):
+				allcounts += chunkall
+				detcounts += chunkdet
+	else:
+		for task in tasks:
+			chunkall, chunkdet = chunkcounts(task)
+			allcounts += chunkall
+			detcounts += chunkdet
+
+	return allcounts, detcounts
+
+
+# Completeness (fraction of sources detected) as a function of mass and of distance, from the binned counts.
+# Returns NaN for empty bins.
+def completeness(allcounts, detcounts):
+	with numpy.errstate(invalid='ignore', divide='ignore'):
+		cmass = detcounts.sum(axis=1) / allcounts.sum(axis=1)
+		cdist = detcounts.sum(axis=0) / allcounts.sum(axis=0)
+		cgrid = detcounts / allcounts
+
+	return cmass, cdist, cgrid
@@ -1,13 +1,32 @@
+import numpy
+
 # Returns numbers in a sensible format
 def nicenumber(number):
-	# Very small numbers - use scientific notation
-	if abs(number) < 0.1:
-		newnumber = str("{:.2E}".format(number))
 	# Small numbers - return comma-separated thousands rounded to 2 d.p.
 	if abs(number) >= 0.01 and abs(number) < 1E6:
 		newnumber = str(f"{number:,.2f}")
-	# Large numbers - use scientific notation
-	if abs(number) >= 1E6:
+	# Very small or large numbers - use scientific notation. Anything which isn't a finite number (e.g. NaN)
+	# also ends up here, rather than falling through every branch
+	else:
 		newnumber = str("{:.2E}".format(number))
 		
 	return newnumber
+
+
+# Array version of the above, for formatting whole columns of numbers at once (e.g. for text file output). The
+# values are sorted into the two formats using numpy masks, then each group is formatted in a single pass with
+# the format method bound once, rather than testing every value individually. Returns a numpy array of strings
+# the same shape as the input.
+def nicenumbers(numbers):
+	numbers = numpy.asarray(numbers, dtype=float)
+	flat = numbers.ravel()
+	
+	# NaN compares as False, so goes into scientific notation as in nicenumber
+	with numpy.errstate(invalid='ignore'):
+		fixed = (numpy.abs(flat) >= 0.01) & (numpy.abs(flat) < 1E6)
+	
+	newnumbers = numpy.empty(flat.shape, dtype=object)
+	newnumbers[fixed]  = list(map("{:,.2f}".format, flat[fixed].tolist()))
+	newnumbers[~fixed] = list(map("{:.2E}".format, flat[~fixed].tolist()))
+	
+	return newnumbers.reshape(numbers.shape)
@@ -17,6 +17,11 @@ import AASN
 imp.reload(AASN)
 from AASN import aasn
 
+# HI masses using the luminosity distance, for sources given by redshift
+import CosmoDistance
+imp.reload(CosmoDistance)
+from CosmoDistance import cosmologies, redshiftmass
+
 
 # STYLE
 # Remove the menu button
@@ -34,7 +39,7 @@ st.write('<style>div.block-container{padding-bottom:0rem;}</style>', unsafe_allo
 st.write("# Observed HI mass calculator")
 st.write('#### Calculate the HI mass given a measured flux value')
 st.write('Simple calculator to convert HI flux into mass (solar units). Requires the flux and distance. Optionally, estimates the integrated S/N if additional parameters are provided. Can also accept input in a few different units.')
-st.write('Uses the standard mass equation : M<sub style="font-size:80%">HI</sub>&thinsp;=&thinsp;2.36x10<sup>5</sup>&thinsp;d<sup>2</sup>&thinsp;F<sub style="font-size:80%">total</sub><br>Where d is the distance in Mpc and F<sub style="font-size:80%">total</sub> is the total integrated flux in Jy&thinsp;km/s.', unsafe_allow_html=True)
+st.write('Uses the standard mass equation : M<sub style="font-size:80%">HI</sub>&thinsp;=&thinsp;2.36x10<sup>5</sup>&thinsp;d<sup>2</sup>&thinsp;F<sub style="font-size:80%">total</sub><br>Where d is the distance in Mpc and F<sub style="font-size:80%">total</sub> is the total integrated flux in Jy&thinsp;km/s. This assumes a Euclidean distance, fine for nearby sources. For more distant ones, give the redshift z instead (distance unit z), and the mass is M<sub style="font-size:80%">HI</sub>&thinsp;=&thinsp;2.36x10<sup>5</sup>&thinsp;D<sub style="font-size:80%">L</sub><sup>2</sup>&thinsp;F<sub style="font-size:80%">total</sub>&thinsp;/&thinsp;(1+z), with D<sub style="font-size:80%">L</sub> the luminosity distance for the chosen cosmology and the flux measured over observed-frame velocities.', unsafe_allow_html=True)
 
 left_column, right_column = st.columns(2)
 
@@ -58,7 +63,7 @@ with right_column:
 	# Distance unit widget, row 2 (adjacent to distance number widget)
 	# Need to provide a "key" parameter as we will be using an otherwise identical widget later on and the two must 
 	# be different
-	distunit = st.selectbox('Distance units', ('Mpc', 'kpc', 'pc'), key='obsdist') 
+	distunit = st.selectbox('Distance units', ('Mpc', 'kpc', 'pc', 'z'), key='obsdist') 
 
 	if distunit == 'pc':
 		distance = distance / 1000000.0
@@ -66,7 +71,12 @@ with right_column:
 		distance = distance / 1000.0
 		
 
-himass = 2.36E5 * distance*distance * hiflux
+# Distances given as redshifts use the luminosity distance
+if distunit == 'z':
+	cosmo = st.selectbox('Cosmology', tuple(cosmologies), key='cosmo', help='Cosmology used to find the luminosity distance from the redshift')
+	himass = float(redshiftmass(hiflux, distance, cosmo))
+else:
+	himass = 2.36E5 * distance*distance * hiflux
 himasskg = himass*1.98847E30
 
 
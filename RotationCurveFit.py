@@ -0,0 +1,239 @@
+# Rotation curve decomposition. Fits a dark matter halo (NFW or pseudo-isothermal) to observed rotation curves, with
+# the stellar disc, bulge and gas contributions fixed (given as circular speeds at each radius, as from surface
+# photometry and HI maps, with the stellar ones scaled by a mass-to-light ratio). Many galaxies are fitted at once:
+# curves are packed into 2D arrays (one row per galaxy, padded with NaN), and each Levenberg-Marquardt iteration
+# updates every galaxy together using analytic derivatives of the halo models. Chunks of galaxies can optionally be
+# fitted in parallel processes. Used by DynamicalMass.py.
+
+import numpy
+import imp
+import concurrent.futures
+
+# Constants and unit scale factors
+import Dynamics
+imp.reload(Dynamics)
+from Dynamics import G, solarmass, pc
+
+
+# G in kpc (km/s)^2 / Msolar, the units used throughout
+Gkpc = G * solarmass / (1000.0*pc) / 1E6
+
+# Supported halo models
+halos = ['NFW', 'Pseudo-isothermal']
+
+# Fields of the structured arrays returned by fitcurves. The scale radius is rs for NFW and rc for the
+# pseudo-isothermal halo; the density is rho_s or rho_0 respectively.
+fitdtype = [('scale_kpc', float), ('scale_kpc_err', float), ('density_msolar_kpc3', float), ('density_msolar_kpc3_err', float),
+            ('chi2', float), ('redchi2', float), ('npoints', int), ('niter', int), ('converged', bool)]
+
+
+# Squared halo circular speeds (km/s)^2 at radii r (kpc), and their derivatives with respect to the natural logs of
+# the two parameters: the amplitude (4 pi G rho_s rs^3 for NFW, in kpc (km/s)^2, or 4 pi G rho_0 rc^2 for the
+# pseudo-isothermal halo, in (km/s)^2), for which the derivative is just v^2 itself, and the scale radius (kpc).
+# Parameters broadcast against the radii.
+def halospeed2(halo, r, amplitude, scale):
+	x = r / scale
+	if halo == 'NFW':
+		# v^2 = A [ln(1+x) - x/(1+x)] / r
+		v2 = amplitude * (numpy.log1p(x) - x/(1.0+x)) / r
+		dscale = -amplitude * x*x / (r * (1.0+x)**2.0)
+	else:
+		# v^2 = B [1 - arctan(x)/x]
+		atanx = numpy.arctan(x) / x
+		v2 = amplitude * (1.0 - atanx)
+		dscale = amplitude * (1.0/(1.0+x*x) - atanx)
+
+	return v2, v2, dscale
+
+
+# Halo amplitude needed to give a squared speed v2 at radius r, for a given scale radius
+def haloamplitude(halo, r, v2, scale):
+	return v2 / halospeed2(halo, r, 1.0, scale)[0]
+
+
+# Squared speeds (km/s)^2 of the fixed components. The gas speed keeps its sign (negative where the gas pulls
+# outwards, e.g. in a central hole), so is added as v|v|.
+def baryonspeed2(vdisc, vgas, vbulge, mlratio, mlbulge):
+	return mlratio*vdisc*vdisc + mlbulge*vbulge*vbulge + vgas*numpy.abs(vgas)
+
+
+# Chi-squared of each galaxy for the halo parameters (natural logs) p, shape (ngalaxies, 2)
+def chisquared(halo, p, r, vobs, verr, vbar2, valid):
+	v2 = vbar2 + halospeed2(halo, r, numpy.exp(p[:,0:1]), numpy.exp(p[:,1:2]))[0]
+	resid = numpy.where(valid, (vobs - numpy.sqrt(numpy.maximum(v2, 0.0))) / verr, 0.0)
+
+	return (resid*resid).sum(axis=1)
+
+
+# Fit a halo to every rotation curve at once. Inputs are 2D arrays, one row per galaxy, padded with NaN (see
+# packcurves): radii (kpc), observed speeds and errors, and the speeds of the stellar disc, gas and bulge (all
+# km/s). Points without a valid speed and positive error are ignored. Returns a structured array of the fitted halo
+# parameters and the quality of the fit, with errors from the covariance matrix. Galaxies with fewer than three
+# points aren't fitted and give NaN.
+def fitcurves(radius, vobs, verr, vdisc, vgas, vbulge=None, halo='NFW', mlratio=0.5, mlbulge=0.7, maxiter=200, tolerance=1E-6):
+	r = numpy.atleast_2d(numpy.asarray(radius, dtype=float))
+	vobs = numpy.atleast_2d(numpy.asarray(vobs, dtype=float))
+	verr = numpy.atleast_2d(numpy.asarray(verr, dtype=float))
+	vbulge = numpy.zeros(r.shape) if vbulge is None else vbulge
+	vdisc, vgas, vbulge = [numpy.nan_to_num(numpy.atleast_2d(numpy.asarray(v, dtype=float))) for v in (vdisc, vgas, vbulge)]
+
+	with numpy.errstate(invalid='ignore', divide='ignore', over='ignore'):
+		valid = (r > 0.0) & numpy.isfinite(vobs) & (verr > 0.0)
+		# Dummy values at the invalid points keep the arithmetic finite; they're masked from every sum
+		r = numpy.where(valid, r, 1.0)
+		vobs = numpy.where(valid, vobs, 0.0)
+		verr = numpy.where(valid, verr, 1.0)
+		vbar2 = baryonspeed2(vdisc, vgas, vbulge, mlratio, mlbulge)
+
+		npoints = valid.sum(axis=1)
+		fitted = npoints >= 3
+
+		# Starting point: scale radius half the extent of the curve, amplitude giving the halo whatever the baryons
+		# leave of the outermost observed speed (or at least a tenth of it)
+		last = numpy.argmax(numpy.where(valid, r, 0.0), axis=1)[:,None]
+		rlast = numpy.take_along_axis(r, last, axis=1)
+		vlast2 = numpy.take_along_axis(vobs, last, axis=1)**2.0
+		vhalo2 = numpy.maximum(vlast2 - numpy.take_along_axis(vbar2, last, axis=1), 0.1*vlast2)
+		scale = 0.5*rlast
+		p = numpy.hstack((numpy.log(haloamplitude(halo, rlast, vhalo2, scale)), numpy.log(scale)))
+		p = numpy.where(numpy.isfinite(p), p, 0.0)
+
+		chi2 = chisquared(halo, p, r, vobs, verr, vbar2, valid)
+		damping = numpy.full(len(p), 1E-3)
+		active = fitted.copy()
+		niter = numpy.zeros(len(p), dtype=int)
+
+		for iteration in range(maxiter):
+			if not active.any():
+				break
+
+			# Model, residuals and Jacobian of the residuals for the galaxies still being fitted. Since the
+			# parameters are logs, the derivatives of v^2 are d(v^2)/dp = A d(v^2)/dA etc.
+			ia = numpy.nonzero(active)[0]
+			v2halo, damp, dscale = halospeed2(halo, r[ia], numpy.exp(p[ia,0:1]), numpy.exp(p[ia,1:2]))
+			vmodel = numpy.sqrt(numpy.maximum(vbar2[ia] + v2halo, 1E-10))
+			weight = numpy.where(valid[ia], 1.0/verr[ia], 0.0)
+			resid = (vobs[ia] - vmodel) * weight
+			jac = numpy.stack((damp, dscale), axis=2) * (weight / (2.0*vmodel))[:,:,None]
+
+			# Damped normal equations, (J^T J + lambda diag(J^T J)) dp = J^T r, solved for every galaxy at once
+			jtj = numpy.einsum('gni,gnj->gij', jac, jac)
+			jtr = numpy.einsum('gni,gn->gi', jac, resid)
+			lhs = jtj + damping[ia,None,None] * jtj * numpy.eye(2)
+			lhs = lhs + 1E-12*numpy.eye(2)
+			step = numpy.linalg.solve(lhs, jtr[:,:,None])[:,:,0]
+			# Limit the step to a factor of e^2 in either parameter
+			step = numpy.clip(numpy.nan_to_num(step), -2.0, 2.0)
+
+			ptrial = p[ia] + step
+			chi2trial = chisquared(halo, ptrial, r[ia], vobs[ia], verr[ia], vbar2[ia], valid[ia])
+			better = chi2trial < chi2[ia]
+
+			# Accept improvements and relax the damping, otherwise increase it and try again next iteration
+			change = numpy.where(better, (chi2[ia] - chi2trial) / numpy.maximum(chi2[ia], 1E-300), 0.0)
+			p[ia] = numpy.where(better[:,None], ptrial, p[ia])
+			chi2[ia] = numpy.where(better, chi2trial, chi2[ia])
+			damping[ia] = numpy.where(better, damping[ia]/10.0, damping[ia]*10.0)
+			niter[ia] = iteration + 1
+
+			# Converged when an accepted step barely changes chi-squared, or the damping has grown so large that
+			# no step will
+			done = (better & (change < tolerance)) | (damping[ia] > 1E10)
+			active[ia[done]] = False
+
+		# Parameter covariances (of the log parameters) from J^T J at the best fit, scaled by the reduced
+		# chi-squared as usual
+		v2halo, damp, dscale = halospeed2(halo, r, numpy.exp(p[:,0:1]), numpy.exp(p[:,1:2]))
+		vmodel = numpy.sqrt(numpy.maximum(vbar2 + v2halo, 1E-10))
+		jac = numpy.stack((damp, dscale), axis=2) * (numpy.where(valid, 1.0/verr, 0.0) / (2.0*vmodel))[:,:,None]
+		jtj = numpy.einsum('gni,gnj->gij', jac, jac)
+		det = jtj[:,0,0]*jtj[:,1,1] - jtj[:,0,1]*jtj[:,1,0]
+		covaa = jtj[:,1,1] / det
+		covss = jtj[:,0,0] / det
+		covas = -jtj[:,0,1] / det
+		redchi2 = chi2 / (npoints - 2)
+		redchi2 = numpy.where(npoints > 2, redchi2, numpy.nan)
+		scalecov = numpy.maximum(redchi2, 1.0)
+
+		# Convert to physical units. The density is A / (4 pi G rs^3) for NFW and B / (4 pi G rc^2) for the
+		# pseudo-isothermal halo, so its log is a linear combination of the two log parameters.
+		power = 3.0 if halo == 'NFW' else 2.0
+		scale = numpy.exp(p[:,1])
+		density = numpy.exp(p[:,0]) / (4.0*numpy.pi*Gkpc * scale**power)
+		lnscale_err = numpy.sqrt(scalecov * covss)
+		lndensity_err = numpy.sqrt(scalecov * (covaa + power*power*covss - 2.0*power*covas))
+
+		result = numpy.empty(len(p), dtype=fitdtype)
+		result['scale_kpc'] = numpy.where(fitted, scale, numpy.nan)
+		result['scale_kpc_err'] = numpy.where(fitted, scale*lnscale_err, numpy.nan)
+		result['density_msolar_kpc3'] = numpy.where(fitted, density, numpy.nan)
+		result['density_msolar_kpc3_err'] = numpy.where(fitted, density*lndensity_err, numpy.nan)
+		result['chi2'] = numpy.where(fitted, chi2, numpy.nan)
+		result['redchi2'] = numpy.where(fitted, redchi2, numpy.nan)
+		result['npoints'] = npoints
+		result['niter'] = niter
+		result['converged'] = fitted & ~active
+
+	return result
+
+
+# Model circular speeds (km/s) of the halo alone and of the total, for fitted halo parameters (scale radius in kpc
+# and density in Msolar/kpc^3) and the fixed components. Works on single curves or 2D arrays of them.
+def modelcurves(radius, scale, density, vdisc, vgas, vbulge=0.0, halo='NFW', mlratio=0.5, mlbulge=0.7):
+	r = numpy.asarray(radius, dtype=float)
+	scale = numpy.asarray(scale, dtype=float)
+	density = numpy.asarray(density, dtype=float)
+	if r.ndim == 2:
+		scale, density = scale[:,None], density[:,None]
+
+	power = 3.0 if halo == 'NFW' else 2.0
+	with numpy.errstate(invalid='ignore', divide='ignore'):
+		vhalo2 = halospeed2(halo, r, 4.0*numpy.pi*Gkpc*density*scale**power, scale)[0]
+		vbar2 = baryonspeed2(numpy.asarray(vdisc, dtype=float), numpy.asarray(vgas, dtype=float), numpy.asarray(vbulge, dtype=float), mlratio, mlbulge)
+
+		return numpy.sqrt(vhalo2), numpy.sqrt(numpy.maximum(vbar2 + vhalo2, 0.0))
+
+
+# Pack long tables of rotation curves (one row per point, with a galaxy name for each) into the 2D arrays used by
+# fitcurves, one row per galaxy in order of name, padded with NaN. Returns the galaxy names and a list of the
+# packed arrays, in the same order as the columns given.
+def packcurves(names, *columns):
+	galaxies, inverse, counts = numpy.unique(numpy.asarray(names, dtype=str), return_inverse=True, return_counts=True)
+
+	# Position of each point within its galaxy, keeping the original order of the points
+	order = numpy.argsort(inverse, kind='stable')
+	position = numpy.empty(len(inverse), dtype=int)
+	position[order] = numpy.arange(len(inverse)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+
+	packed = []
+	for column in columns:
+		array = numpy.full((len(galaxies), counts.max() if len(counts) > 0 else 0), numpy.nan)
+		array[inverse, position] = numpy.asarray(column, dtype=float)
+		packed.append(array)
+
+	return galaxies, packed
+
+
+# Fit a chunk of galaxies; a separate function so it can be run in other processes
+def fitchunk(args):
+	arrays, kwargs = args
+	return fitcurves(*arrays, **kwargs)
+
+
+# Fit many galaxies, split into chunks of chunksize galaxies. With processes > 1 the chunks are fitted in parallel
+# processes, otherwise one after another here. Inputs and result are as for fitcurves.
+def fitgalaxies(radius, vobs, verr, vdisc, vgas, vbulge=None, processes=1, chunksize=2000, **kwargs):
+	arrays = [numpy.atleast_2d(numpy.asarray(array, dtype=float)) for array in (radius, vobs, verr, vdisc, vgas)]
+	arrays.append(numpy.zeros(arrays[0].shape) if vbulge is None else numpy.atleast_2d(numpy.asarray(vbulge, dtype=float)))
+
+	chunks = [([array[start:start+chunksize] for array in arrays], kwargs) for start in range(0, len(arrays[0]), chunksize)]
+	if len(chunks) == 0:
+		return numpy.empty(0, dtype=fitdtype)
+
+	if processes > 1 and len(chunks) > 1:
+		with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+			results = list(executor.map(fitchunk, chunks))
+	else:
+		results = [fitchunk(chunk) for chunk in chunks]
+
+	return numpy.concatenate(results)
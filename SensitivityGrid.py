@@ -0,0 +1,145 @@
+# Column density sensitivity limits over whole grids of beam size, rms noise and line width, as for the "Telescope
+# parameters" mode of ColumnDensityCal.py. The grid is evaluated in one go by broadcasting the three axes against
+# each other, saved to disk as a .npz file named by a hash of the grid parameters, and reused whenever the same grid
+# is asked for again, with the least recently used grids deleted once they take up too much space. Limits at any
+# other values are found by interpolating the grid in log space, which is exact here since the limit is a power law
+# in each parameter.
+
+import numpy
+import os
+import hashlib
+import tempfile
+import imp
+
+# Column density conversion factors
+import ColumnDensityMap
+imp.reload(ColumnDensityMap)
+from ColumnDensityMap import beamarea, columnfactor
+
+
+# Where the grids are stored, and the limit on their total size in bytes
+cachedir = os.path.join(tempfile.gettempdir(), 'SensitivityGridCache')
+maxbytes = 200*1024*1024
+
+# Largest number of points along each axis. The grid holds npoints^3 values, with temporaries of the same size while
+# it's calculated, so 200 points take a few hundred MB at most.
+maxpoints = 200
+
+# Beam FWHM (arcseconds) of some common HI telescopes and surveys. Interferometer beams depend on the weighting and
+# configuration, so these are typical survey values.
+telescopes = {'Arecibo (ALFA)':210.0, 'FAST':174.0, 'GBT':546.0, 'Parkes':840.0, 'Effelsberg':540.0,
+              'ASKAP (WALLABY)':30.0, 'MeerKAT (MIGHTEE-HI)':15.0, 'VLA (D array)':45.0, 'WSRT (Apertif)':15.0}
+
+# Names of the grid axes, in the order of the grid dimensions
+gridaxes = ['beam', 'rms', 'width']
+
+
+# Logarithmically-spaced grid axis between two (positive) values
+def logaxis(minimum, maximum, npoints):
+	return numpy.geomspace(minimum, maximum, max(int(npoints), 2))
+
+
+# Column density limits (atoms cm^-2) for every combination of beam FWHM (arcseconds), rms noise (mJy) and line
+# width (km/s), at the given S/N. Returns an array of shape (nbeam, nrms, nwidth). The source is assumed to fill
+# the beam, as in ColumnDensityCal.py.
+def sensitivitygrid(beams, rmss, widths, snr=5.0):
+	omega = beamarea(numpy.asarray(beams, dtype=float)/3600.0)[:,None,None]
+	rmss = numpy.asarray(rmss, dtype=float)[None,:,None] / 1000.0
+	widths = numpy.asarray(widths, dtype=float)[None,None,:]
+
+	return columnfactor(omega, widths) * snr * rmss
+
+
+# Name of the .npz file for a grid, from a hash of its parameters
+def gridfile(parameters):
+	key = hashlib.sha1(repr(tuple(float(value) for value in parameters)).encode()).hexdigest()[0:16]
+
+	return os.path.join(cachedir, 'grid_'+key+'.npz')
+
+
+# Delete the least recently used grids until the total size of the stored grids is within the limit
+def evict(limit=maxbytes):
+	entries = []
+	for entry in os.scandir(cachedir):
+		if entry.name.startswith('grid_') and entry.name.endswith('.npz'):
+			try:
+				info = entry.stat()
+			except OSError:
+				# Removed by another session since the directory was listed
+				continue
+			entries.append((info.st_mtime, info.st_size, entry.path))
+
+	total = sum(size for mtime, size, path in entries)
+	for mtime, size, path in sorted(entries):
+		if total <= limit:
+			break
+		try:
+			os.remove(path)
+		except OSError:
+			pass
+		total = total - size
+
+
+# Grid axes and column density limits for the given ranges (minimum, maximum and number of points for each axis)
+# and S/N. Loaded from disk if this grid has been made before, otherwise calculated and saved. Returns a dictionary
+# of the three axes and the grid. Grids with more than maxpoints points along any axis aren't allowed.
+def loadgrid(beamrange, rmsrange, widthrange, snr=5.0):
+	if max(beamrange[2], rmsrange[2], widthrange[2]) > maxpoints:
+		raise ValueError('Grids can have at most '+str(maxpoints)+' points along each axis')
+
+	filename = gridfile(tuple(beamrange) + tuple(rmsrange) + tuple(widthrange) + (snr,))
+	try:
+		with numpy.load(filename) as stored:
+			grid = {name: stored[name] for name in stored.files}
+		# Marks the grid as recently used
+		os.utime(filename)
+		return grid
+	except OSError:
+		pass
+
+	grid = {'beam':logaxis(*beamrange), 'rms':logaxis(*rmsrange), 'width':logaxis(*widthrange)}
+	grid['nhi'] = sensitivitygrid(grid['beam'], grid['rms'], grid['width'], snr)
+
+	os.makedirs(cachedir, exist_ok=True)
+	# Written to a uniquely-named temporary file first, so another session never reads a half-written grid
+	handle, tempname = tempfile.mkstemp(dir=cachedir, suffix='.tmp')
+	try:
+		with os.fdopen(handle, 'wb') as outfile:
+			numpy.savez(outfile, **grid)
+		os.replace(tempname, filename)
+	except BaseException:
+		os.remove(tempname)
+		raise
+	evict()
+
+	return grid
+
+
+# Interpolate the grid at any number of points, given as arrays (or single values) of beam FWHM, rms and line width
+# which broadcast against each other. Interpolation is linear in the logs of all the values. Points outside the
+# grid give NaN.
+def interpolategrid(grid, beams, rmss, widths):
+	points = numpy.broadcast_arrays(*[numpy.log(numpy.asarray(value, dtype=float)) for value in (beams, rmss, widths)])
+	logaxes = [numpy.log(grid[name]) for name in gridaxes]
+	loggrid = numpy.log(grid['nhi'])
+
+	# Lower index of the cell containing each point along each axis, and the fractional position within it
+	lower = []
+	fraction = []
+	inside = numpy.ones(points[0].shape, dtype=bool)
+	for axis, point in zip(logaxes, points):
+		index = numpy.clip(numpy.searchsorted(axis, point, side='right') - 1, 0, len(axis)-2)
+		lower.append(index)
+		fraction.append((point - axis[index]) / (axis[index+1] - axis[index]))
+		inside = inside & (point >= axis[0]) & (point <= axis[-1])
+
+	# Weighted sum over the eight corners of each cell
+	result = numpy.zeros(points[0].shape)
+	for corner in range(8):
+		offsets = [(corner >> dim) & 1 for dim in range(3)]
+		weight = numpy.ones(points[0].shape)
+		for dim, offset in enumerate(offsets):
+			weight = weight * (fraction[dim] if offset == 1 else 1.0 - fraction[dim])
+		result = result + weight * loggrid[tuple(lower[dim] + offsets[dim] for dim in range(3))]
+
+	return numpy.where(inside, numpy.exp(result), numpy.nan)
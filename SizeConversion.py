@@ -0,0 +1,105 @@
+# Conversions between angular and projected physical size for AngularSize.py. Works on single values or whole
+# arrays (e.g. sources at different distances), with units given as a single string or one per value and converted
+# with fixed scale factors. As well as the usual small-angle formula, gives the exact result for a source
+# subtending the angle at the given distance, which matters for large angles. Tables of sizes are converted from CSV
+# a chunk of rows at a time, with both formulae evaluated together.
+
+import numpy
+import imp
+
+# Scale factors for tables of units
+import UnitScale
+imp.reload(UnitScale)
+from UnitScale import scalefactor
+
+# Reading and writing tables a chunk at a time
+import TableIO
+imp.reload(TableIO)
+from TableIO import tonumbers, stripped, converttable
+
+# Angular diameter distances for sources given by redshift
+import CosmoDistance
+imp.reload(CosmoDistance)
+from CosmoDistance import angulardistance
+
+
+# Scale factors to degrees and parsecs. Distances can also be given as a redshift, with the unit 'z'.
+angularscale = {'degrees':1.0, 'arcminutes':1.0/60.0, 'arcseconds':1.0/3600.0}
+distancescale = {'pc':1.0, 'kpc':1E3, 'Mpc':1E6}
+
+# Columns read from a table, and added to the output of a table conversion for each direction
+incolumns = ['size', 'size_unit', 'distance', 'distance_unit']
+outcolumns = {'Angular to Physical':['Size (pc)', 'Size (kpc)', 'Size (Mpc)', 'Exact size (pc)'],
+              'Physical to Angular':['Size (degrees)', 'Size (arcminutes)', 'Size (arcseconds)', 'Exact size (degrees)']}
+
+
+# Distance(s) in parsecs. Values with the unit 'z' are redshifts, converted to the angular diameter distance in the
+# given cosmology, so sizes are correct at any redshift; other units are Euclidean distances.
+def distancepc(distance, distance_unit, cosmology='Planck18'):
+	distance = numpy.asarray(distance, dtype=float)
+	isredshift = numpy.asarray(distance_unit, dtype=str) == 'z'
+	if not isredshift.any():
+		return distance * scalefactor(distance_unit, distancescale)
+
+	return numpy.where(isredshift, angulardistance(numpy.where(isredshift, distance, 0.0), cosmology)*1E6, distance * scalefactor(distance_unit, distancescale))
+
+
+# Convert angular to physical size, returned in parsecs. With exact=True, the size is 2 D tan(theta/2) rather than
+# the small-angle approximation (theta/360) 2 pi D, the fraction of the circumference of a circle.
+def angular_to_physical(angular_size, distance, angular_unit, distance_unit, exact=False, cosmology='Planck18'):
+	angular_size = numpy.asarray(angular_size, dtype=float) * scalefactor(angular_unit, angularscale)
+	distance = distancepc(distance, distance_unit, cosmology)
+
+	if exact:
+		return 2.0 * distance * numpy.tan(numpy.radians(angular_size / 2.0))
+
+	return (angular_size / 360.0) * 2.0 * numpy.pi * distance
+
+
+# Convert physical to angular size, returned in degrees. With exact=True, the angle is 2 atan(s / 2D) rather than
+# the small-angle approximation 360 s / (2 pi D). Distances of zero or less give NaN.
+def physical_to_angular(physical_size, physical_unit, distance, distance_unit, exact=False, cosmology='Planck18'):
+	physical_size = numpy.asarray(physical_size, dtype=float) * scalefactor(physical_unit, distancescale)
+	distance = distancepc(distance, distance_unit, cosmology)
+	distance = numpy.where(distance > 0.0, distance, numpy.nan)
+
+	with numpy.errstate(invalid='ignore', divide='ignore'):
+		if exact:
+			return 2.0 * numpy.degrees(numpy.arctan(physical_size / (2.0*distance)))
+
+		return (360.0*physical_size) / (2.0 * numpy.pi * distance)
+
+
+# Convert one chunk of rows in the given direction. Sizes and distances are lists of strings; units can be lists
+# of the same length or single values. Returns the converted sizes in each of the output units, followed by the
+# exact size, with NaN where a row can't be converted.
+def convertchunk(direction, sizes, sizeunits, distances, distanceunits, cosmology='Planck18'):
+	sizes = tonumbers(sizes)
+	distances = tonumbers(distances)
+	sizeunits = stripped(sizeunits)
+	distanceunits = stripped(distanceunits)
+
+	if direction == 'Angular to Physical':
+		approx = angular_to_physical(sizes, distances, sizeunits, distanceunits, cosmology=cosmology)
+		exact = angular_to_physical(sizes, distances, sizeunits, distanceunits, exact=True, cosmology=cosmology)
+		return approx, approx/1E3, approx/1E6, exact
+
+	approx = physical_to_angular(sizes, sizeunits, distances, distanceunits, cosmology=cosmology)
+	exact = physical_to_angular(sizes, sizeunits, distances, distanceunits, exact=True, cosmology=cosmology)
+	return approx, approx*60.0, approx*3600.0, exact
+
+
+# Raise a ValueError if a table doesn't have the columns needed
+def checkcolumns(columns):
+	if 'size' not in columns or 'distance' not in columns:
+		raise ValueError('The table must have a header row with columns named size and distance')
+
+
+# Convert a whole CSV table, from an open input file to an open output file. The input needs a header row with
+# size and distance columns; size_unit and distance_unit columns are optional, with the given defaults used if
+# they're missing. Distances with the unit z are redshifts, for the given cosmology. All the input columns are copied
+# to the output, followed by the converted sizes. Returns the number of rows converted.
+def convertcsv(infile, outfile, direction, defsizeunit, defdistanceunit, cosmology='Planck18', chunksize=100000):
+	convert = lambda table, number: convertchunk(direction, table['size'], table.get('size_unit', defsizeunit), table['distance'], table.get('distance_unit', defdistanceunit), cosmology)
+
+	return converttable(infile, outfile, convert, incolumns, outcolumns[direction], checkcolumns, chunksize)
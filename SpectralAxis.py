@@ -0,0 +1,132 @@
+# Spectral axes of FITS cubes. Reads the header of a cube, builds the channel values from its WCS a chunk at a time,
+# and converts them to frequency, wavelength, redshift and velocities using LineConversion.py. Can also write a new
+# header with the spectral axis re-expressed in another convention (e.g. frequency to optical velocity), and a copy
+# of the cube with that header. Files are opened with memmap=True and everything is written to disk in chunks, so
+# cubes of many GB never have to be loaded into memory.
+
+import numpy
+import imp
+from astropy.io import fits
+from astropy import wcs
+
+# Conversions between observed frequency, redshift, wavelength and velocities
+import LineConversion
+imp.reload(LineConversion)
+from LineConversion import lineconversion, observedfrequency
+
+
+# FITS spectral axis types (Greisen et al. 2006) and the equivalent observed types in WhatsMyLIne.py. VELO is the
+# relativistic velocity in the FITS standard; FELO is the old AIPS name for optical velocity.
+spectraltypes = {'FREQ':'Frequency', 'WAVE':'Wavelength', 'ZOPT':'Redshift', 'VOPT':'Optical velocity', 'FELO':'Optical velocity',
+                 'VRAD':'Radio velocity', 'VELO':'Relativistic velocity'}
+
+# Axis types that a header can be converted to. The algorithm code is left for wcslib to choose, e.g. an axis linear
+# in frequency becomes VOPT-F2W when converted to optical velocity.
+outputtypes = {'Frequency':'FREQ-???', 'Wavelength':'WAVE-???', 'Redshift':'ZOPT-???', 'Optical velocity':'VOPT-???',
+               'Radio velocity':'VRAD-???', 'Relativistic velocity':'VELO-???'}
+
+# Column names for the axis table
+axiscolumns = ['Channel', 'Frequency (Hz)', 'Wavelength (m)', 'Redshift', 'Optical velocity (km/s)', 'Radio velocity (km/s)', 'Relativistic velocity (km/s)']
+
+
+# Header of the first HDU in the file which has a spectral axis, its index, and the WCS of the spectral axis alone.
+# Only the header is read; the data stays on disk.
+def spectralaxis(filename):
+	with fits.open(filename, memmap=True) as hdul:
+		for i, hdu in enumerate(hdul):
+			if hdu.header.get('NAXIS', 0) > 0:
+				fullwcs = wcs.WCS(hdu.header)
+				if fullwcs.wcs.spec >= 0:
+					return hdu.header.copy(), i, fullwcs.sub([wcs.WCSSUB_SPECTRAL])
+
+	raise ValueError('No spectral axis found in '+str(filename))
+
+
+# Number of channels, the WhatsMyLIne.py observed type of the spectral axis, and the rest frequency given in the
+# header (zero if there isn't one)
+def axisinfo(header, specwcs):
+	fullwcs = wcs.WCS(header)
+	nchan = header['NAXIS'+str(fullwcs.wcs.spec+1)]
+
+	basetype = specwcs.wcs.ctype[0][0:4]
+	if basetype not in spectraltypes:
+		raise ValueError('Spectral axis type '+specwcs.wcs.ctype[0]+' is not supported')
+
+	return nchan, spectraltypes[basetype], float(specwcs.wcs.restfrq)
+
+
+# Channel numbers (starting from 1, as in FITS) and all the converted values for the spectral axis, in chunks of at
+# most chunksize channels. Channel values are computed from the WCS as they're needed, so only one chunk is ever in
+# memory. Values are in SI units (as wcslib normalises them), velocities in km/s.
+def axischunks(specwcs, nchan, obstype, restfreq, chunksize=100000):
+	for start in range(0, nchan, chunksize):
+		channels = numpy.arange(start, min(start+chunksize, nchan))
+		values = specwcs.all_pix2world(channels, 0)[0]
+
+		obsfreq = observedfrequency(values, obstype, restfreq)
+		redshift, redwave, obsoptvel, obsradvel, obsrelvel = lineconversion(restfreq, obsfreq)
+
+		yield channels+1, obsfreq, redwave, redshift, obsoptvel, obsradvel, obsrelvel
+
+
+# Write the converted spectral axis to a CSV file, one chunk at a time
+def writeaxistable(outfile, specwcs, nchan, obstype, restfreq, chunksize=100000):
+	with open(outfile, 'w') as outtable:
+		outtable.write(','.join(axiscolumns)+'\n')
+		for chunk in axischunks(specwcs, nchan, obstype, restfreq, chunksize):
+			numpy.savetxt(outtable, numpy.column_stack(chunk), delimiter=',', fmt=['%d']+['%.10g']*6)
+
+
+# Copy of the header with the spectral axis converted to another type (one of the keys of outputtypes). The reference
+# value and increment are recalculated by wcslib, so the new axis describes exactly the same channels. A rest
+# frequency is required for conversions between frequency and velocity; it's taken from the header if present.
+def regriddedheader(header, outtype, restfreq=0.0):
+	newheader = header.copy()
+
+	# wcslib only rescales CDELT when converting, so a CD matrix is passed to it as the equivalent PC matrix with unit
+	# CDELT. The spectral axis is assumed to be independent of the others, as it is for any normal cube.
+	workheader = header.copy()
+	usecd = any(key.startswith('CD') and '_' in key for key in header)
+	if usecd:
+		for key in list(workheader):
+			if key.startswith('CD') and '_' in key:
+				workheader.rename_keyword(key, 'PC'+key[2:])
+		for n in range(1, header['NAXIS']+1):
+			workheader['CDELT'+str(n)] = 1.0
+
+	fullwcs = wcs.WCS(workheader)
+	if fullwcs.wcs.restfrq == 0.0:
+		fullwcs.wcs.restfrq = restfreq
+
+	fullwcs.wcs.sptr(outputtypes[outtype])
+
+	i = fullwcs.wcs.spec
+	n = str(i+1)
+	newheader['CTYPE'+n] = fullwcs.wcs.ctype[i]
+	newheader['CRVAL'+n] = fullwcs.wcs.crval[i]
+	newheader['CUNIT'+n] = fullwcs.wcs.cunit[i].to_string('fits')
+	newheader['RESTFRQ'] = fullwcs.wcs.restfrq
+	if 'RESTFREQ' in newheader:
+		del newheader['RESTFREQ']
+
+	if usecd:
+		newheader['CD'+n+'_'+n] = fullwcs.wcs.cdelt[i] * fullwcs.wcs.get_pc()[i, i]
+	else:
+		newheader['CDELT'+n] = fullwcs.wcs.cdelt[i]
+
+	return newheader
+
+
+# Copy the data of the given HDU to a new file with a new header, streaming it through in blocks of whole planes of
+# at most chunkbytes. The raw (unscaled) values are copied, so BSCALE and BZERO carry over unchanged.
+def copycube(infile, hduindex, outfile, newheader, chunkbytes=64*1024**2):
+	with fits.open(infile, memmap=True, do_not_scale_image_data=True) as hdul:
+		data = hdul[hduindex].data
+
+		outhdu = fits.StreamingHDU(outfile, newheader)
+		if data is not None:
+			planebytes = max(data[0:1].nbytes, 1)
+			nplanes = max(int(chunkbytes // planebytes), 1)
+			for start in range(0, data.shape[0], nplanes):
+				outhdu.write(data[start:start+nplanes])
+		outhdu.close()
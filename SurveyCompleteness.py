@@ -0,0 +1,100 @@
+# Estimates the completeness of an HI survey by simulating a mock catalogue. Galaxies are drawn from an HI mass
+# function and a line width distribution, placed at random distances, and detected or not according to the
+# ALFALFA integrated S/N criterion. Reports the fraction detected as a function of mass and distance.
+
+import streamlit as st
+import numpy
+import os
+import imp
+
+# EXTERNAL SCRIPTS IMPORTED AS FUNCTIONS
+# Mock catalogue generation and completeness calculation
+import MockCatalogue
+imp.reload(MockCatalogue)
+from MockCatalogue import simulate, completeness
+
+
+# Results depend only on the parameters and seed, so identical runs (e.g. when changing the display options) are
+# served from the cache rather than simulated again. The number of processes doesn't change the result, so it's
+# excluded from the cache key (the leading underscore tells Streamlit not to hash it).
+@st.cache_data(max_entries=16)
+def cachedsimulation(nsources, paramitems, chunksize, seed, _nworkers):
+	params = dict(paramitems)
+	params['massbins'] = numpy.linspace(params['logmmin'], params['logmmax'], params.pop('nmassbins')+1)
+	params['distbins'] = numpy.linspace(params['dmin'], params['dmax'], params.pop('ndistbins')+1)
+
+	allcounts, detcounts = simulate(nsources, params, chunksize, seed, _nworkers)
+
+	return params['massbins'], params['distbins'], allcounts, detcounts
+
+
+# STYLE
+# Remove the menu button
+st.markdown(""" <style>
+#MainMenu {visibility: hidden;}
+footer {visibility: hidden;}
+</style> """, unsafe_allow_html=True)
+
+# Remove vertical whitespace padding
+st.write('<style>div.block-container{padding-top:0rem;}</style>', unsafe_allow_html=True)
+st.write('<style>div.block-container{padding-bottom:0rem;}</style>', unsafe_allow_html=True)
+
+
+# MAIN CODE
+st.write("# Survey completeness simulator")
+st.write('Estimates the completeness of an HI survey from a mock catalogue. Galaxies are drawn from a Schechter HI mass function (default values are the ALFALFA fit of Jones et al. 2018) and a log-normal line width distribution, and placed uniformly in volume. Fluxes follow from M<sub style="font-size:80%">HI</sub>&thinsp;=&thinsp;2.36x10<sup>5</sup>&thinsp;d<sup>2</sup>&thinsp;F<sub style="font-size:80%">total</sub>, with noise added for a top-hat profile, and sources count as detected if their integrated S/N (Saintonge 2007) reaches the chosen limit.', unsafe_allow_html=True)
+st.write('Sources are simulated in chunks so millions can be used without running out of memory. The same seed always gives the same result, however many processes are used.')
+
+st.write('##### Mass function and line widths')
+left_column, right_column = st.columns(2)
+
+with left_column:
+	logmstar = st.number_input('log(M*)', value=9.94, key='logmstar', help='Characteristic mass of the Schechter function, in logarithmic solar masses')
+	logmrange = st.slider('log(MHI) range', min_value=5.0, max_value=12.0, value=(6.0, 11.0), key='logmrange')
+	w50median = st.number_input('Median line width (km/s)', min_value=1.0, value=150.0, key='w50median')
+
+with right_column:
+	alpha = st.number_input('Faint-end slope', value=-1.25, key='alpha', help='Low-mass slope of the Schechter function')
+	distrange = st.slider('Distance range (Mpc)', min_value=0.1, max_value=300.0, value=(1.0, 100.0), key='distrange')
+	w50scatter = st.number_input('Line width scatter (dex)', min_value=0.0, value=0.2, key='w50scatter')
+
+st.write('##### Observational parameters')
+left_column2, right_column2 = st.columns(2)
+
+with left_column2:
+	rms = st.number_input('Spectra rms (mJy)', min_value=0.001, value=1.6, key='rms')
+	snlimit = st.number_input('Integrated S/N limit', min_value=0.1, value=6.5, key='snlimit')
+
+with right_column2:
+	vres = st.number_input('Velocity resolution (km/s)', min_value=0.1, value=10.0, key='vres', help='Velocity resolution after smoothing')
+
+st.write('##### Simulation parameters')
+left_column3, right_column3 = st.columns(2)
+
+with left_column3:
+	nsources = st.number_input('Number of sources', min_value=1000, value=1000000, step=100000, key='nsources')
+	seed = st.number_input('Random seed', min_value=0, value=1, key='seed')
+
+with right_column3:
+	chunksize = st.number_input('Chunk size', min_value=1000, value=250000, step=50000, key='chunksize', help='Number of sources held in memory at once, per process')
+	nworkers = st.number_input('Processes', min_value=1, max_value=os.cpu_count() or 1, value=1, key='nworkers', help='Number of processes to spread the chunks over')
+
+if logmrange[0] < logmrange[1] and distrange[0] < distrange[1]:
+	# Parameters are passed as a sorted tuple of items so they can be hashed for the cache
+	params = {'logmstar':logmstar, 'alpha':alpha, 'logmmin':logmrange[0], 'logmmax':logmrange[1], 'dmin':distrange[0], 'dmax':distrange[1],
+	          'w50median':w50median, 'w50scatter':w50scatter, 'rms':rms/1000.0, 'vres':vres, 'snlimit':snlimit, 'nmassbins':25, 'ndistbins':20}
+
+	massbins, distbins, allcounts, detcounts = cachedsimulation(nsources, tuple(sorted(params.items())), chunksize, seed, nworkers)
+	cmass, cdist, cgrid = completeness(allcounts, detcounts)
+
+	st.write('#### Detected '+f'{int(detcounts.sum()):,}'+' of '+f'{int(allcounts.sum()):,}'+' sources')
+
+	st.write('##### Completeness as a function of HI mass')
+	st.line_chart({'log(MHI)': 0.5*(massbins[1:] + massbins[:-1]), 'Completeness': cmass}, x='log(MHI)')
+
+	st.write('##### Completeness as a function of distance')
+	st.line_chart({'Distance (Mpc)': 0.5*(distbins[1:] + distbins[:-1]), 'Completeness': cdist}, x='Distance (Mpc)')
+
+	st.write('Completeness depends on the mass function and distance range as well as the sensitivity, since these set how many sources fall in each bin close to the detection limit.')
+else:
+	st.write('#### The upper ends of the mass and distance ranges must be above the lower ends.')
@@ -0,0 +1,100 @@
+# Survey sensitivity calculations for top-hat profiles. Rather than one (line width, rms, S/N, distance) point
+# at a time, these evaluate the flux, HI mass and integrated S/N over every combination of the input values at
+# once using numpy broadcasting. Used by the survey grid mode of TophatHIMass.py.
+
+import numpy
+import imp
+
+# Function to calculate the total integrated S/N, array version
+import AASN
+imp.reload(AASN)
+from AASN import aasnarray
+
+
+# Evaluate the top-hat flux, HI mass and integrated S/N over the full parameter hypercube. Inputs are 1D arrays
+# of line widths (km/s), rms values (Jy), peak S/N values and distances (Mpc), plus the velocity resolution
+# (km/s). All three outputs are indexed as [linewidth, rms, sn, distance].
+def sensitivitygrid(linewidths, rmsvals, snvals, distances, vres):
+	# Give each parameter its own axis so they broadcast against each other
+	w50 = numpy.asarray(linewidths, dtype=float)[:, None, None, None]
+	rms = numpy.asarray(rmsvals, dtype=float)[None, :, None, None]
+	sn  = numpy.asarray(snvals, dtype=float)[None, None, :, None]
+	d   = numpy.asarray(distances, dtype=float)[None, None, None, :]
+
+	# Flux and integrated S/N don't depend on distance, so only the mass needs the full 4D array
+	topflux = sn*w50*rms
+	topmass = 2.36E5 * d*d * topflux
+	intsn = aasnarray(topflux, w50, vres, rms)
+
+	# Expand the others to the full shape as read-only views, so all three can be indexed the same way
+	# without using any more memory
+	topflux = numpy.broadcast_to(topflux, topmass.shape)
+	intsn = numpy.broadcast_to(intsn, topmass.shape)
+
+	return topflux, topmass, intsn
+
+
+# From a sensitivity grid, find the lowest HI mass which reaches the given integrated S/N limit at each line
+# width, rms and distance. This is taken over the S/N axis of the grid, so its accuracy depends on how finely
+# the S/N values are sampled. Returns NaN wherever no S/N value in the grid reaches the limit.
+def thresholdmass(topmass, intsn, snlimit=6.5):
+	detected = intsn >= snlimit
+
+	minmass = numpy.where(detected, topmass, numpy.inf).min(axis=2)
+	minmass[numpy.isinf(minmass)] = numpy.nan
+
+	return minmass
+
+
+# Find the detection threshold directly instead of by trial and error. For a top-hat profile the total flux is
+# S/N x W50 x rms, which substituted into the ALFALFA relation (see AASN.py) gives simply :
+#   integrated S/N = peak S/N x sqrt(wsmo),   where wsmo = min(W50, 400) / (2 x vres)
+# So the peak S/N needed to reach the limit is snlimit / sqrt(wsmo), and the flux and mass follow from that.
+# Line widths (km/s) and distances (Mpc) can be arrays of any shapes that broadcast together; rms is in Jy and
+# vres in km/s. Returns the threshold peak S/N, total flux (Jy km/s) and HI mass (solar masses).
+# Optionally a different integrated S/N function can be given, with the same arguments as aasn; this has no
+# closed-form inverse in general so is solved numerically instead.
+def detectionthreshold(linewidths, distances, rms, vres, snlimit=6.5, snfunc=None):
+	w50 = numpy.asarray(linewidths, dtype=float)
+	d   = numpy.asarray(distances, dtype=float)
+	
+	if snfunc is None:
+		wsmo = numpy.minimum(w50, 400.0) / (2.0*vres)
+		topflux = (snlimit / numpy.sqrt(wsmo)) * w50 * rms
+	else:
+		topflux = thresholdflux(snfunc, w50, vres, rms, snlimit)
+		
+	snpeak = topflux / (w50*rms)
+	topmass = 2.36E5 * d*d * topflux
+	
+	# Make sure all three have the full broadcast shape, since the S/N and flux don't depend on distance
+	snpeak, topflux, topmass = numpy.broadcast_arrays(snpeak, topflux, topmass)
+	
+	return snpeak, topflux, topmass
+	
+
+# Numerical fallback for the above. Bisects on the total flux (in log space, since it can span many orders of
+# magnitude) for every element at once, assuming only that the integrated S/N increases with flux. Elements where
+# the limit can't be bracketed (e.g. an S/N which never reaches it) give NaN.
+def thresholdflux(snfunc, w50, vres, rms, snlimit, niter=60):
+	w50 = numpy.asarray(w50, dtype=float)
+	
+	# Bracket the solution. Start from the flux of a 1-sigma top-hat and expand until the limit is straddled.
+	lower = numpy.array(w50*rms, dtype=float)
+	upper = lower.copy()
+	for i in range(100):
+		toohigh = snfunc(lower, w50, vres, rms) > snlimit
+		toolow  = snfunc(upper, w50, vres, rms) < snlimit
+		if not (toohigh.any() or toolow.any()):
+			break
+		lower[toohigh] = lower[toohigh] / 10.0
+		upper[toolow]  = upper[toolow] * 10.0
+	bracketed = (snfunc(lower, w50, vres, rms) <= snlimit) & (snfunc(upper, w50, vres, rms) >= snlimit)
+		
+	for i in range(niter):
+		middle = numpy.sqrt(lower*upper)
+		below = snfunc(middle, w50, vres, rms) < snlimit
+		lower = numpy.where(below, middle, lower)
+		upper = numpy.where(below, upper, middle)
+		
+	return numpy.where(bracketed, numpy.sqrt(lower*upper), numpy.nan)
@@ -0,0 +1,121 @@
+# CSV tables for the batch modes of the apps. Tables are read and written a chunk of rows at a time, with each chunk
+# converted in one go with numpy by a function given for each kind of table, so memory use stays the same however
+# long the table is. Chunks can also be spread over several processes. Uploaded tables are read as text without
+# copying them, and the output goes to a temporary file on disk as it's converted rather than being built up in
+# memory.
+
+import numpy
+import csv
+import io
+import itertools
+import tempfile
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+import streamlit as st
+
+
+# Convert a column of strings to numbers, with NaN for anything that isn't a number. Tries the whole column at once
+# first, since normally every entry is fine.
+def tonumbers(strings):
+	try:
+		return numpy.array(strings, dtype=float)
+	except (ValueError, TypeError):
+		pass
+
+	values = numpy.full(len(strings), numpy.nan)
+	for i, string in enumerate(strings):
+		try:
+			values[i] = float(string)
+		except (ValueError, TypeError):
+			pass
+
+	return values
+
+
+# Strings with surrounding whitespace removed. Only the distinct strings are stripped, since columns such as the
+# units will usually only have a few.
+def stripped(strings):
+	names, inverse = numpy.unique(numpy.asarray(strings, dtype=str), return_inverse=True)
+
+	return numpy.char.strip(names)[inverse].reshape(numpy.shape(strings))
+
+
+# Convert a whole CSV table, from an open input file to an open output file. The input needs a header row, whose
+# column names are passed to checkcolumns (if given) to raise a ValueError if any it needs are missing. Each chunk
+# of chunksize rows is passed to convertchunk as a dictionary of those of the incolumns the table has, each a list
+# of strings, and the number of the chunk counting from zero; it returns one array per name in outcolumns, with a
+# value for each row (or a single value for all of them). All the input columns are copied to the output, followed
+# by the results. With nworkers > 1 that many chunks are converted at once in separate processes, so convertchunk
+# must be a module-level function (or a functools.partial of one). Returns the number of rows converted.
+def converttable(infile, outfile, convertchunk, incolumns, outcolumns, checkcolumns=None, chunksize=100000, nworkers=1):
+	reader = csv.reader(infile)
+	columns = [name.strip() for name in next(reader, [])]
+	if checkcolumns is not None:
+		checkcolumns(columns)
+
+	writer = csv.writer(outfile)
+	writer.writerow(columns + list(outcolumns))
+
+	# Position of each of the input columns the table has
+	positions = {name: columns.index(name) for name in incolumns if name in columns}
+
+	executor = ProcessPoolExecutor(max_workers=nworkers) if nworkers > 1 else None
+	nrows = 0
+	nchunks = 0
+	try:
+		while True:
+			# Up to nworkers chunks are read and converted together
+			blocks = []
+			for i in range(max(nworkers, 1)):
+				rows = list(itertools.islice(reader, chunksize))
+				if len(rows) == 0:
+					break
+				# Short rows are padded so every column can be read
+				blocks.append([row + ['']*(len(columns) - len(row)) for row in rows])
+
+			if len(blocks) == 0:
+				break
+
+			tables = [{name: [row[i] for row in rows] for name, i in positions.items()} for rows in blocks]
+			numbers = range(nchunks, nchunks + len(blocks))
+			results = executor.map(convertchunk, tables, numbers) if executor is not None else map(convertchunk, tables, numbers)
+			for rows, result in zip(blocks, results):
+				values = numpy.column_stack(numpy.broadcast_arrays(*result))
+				writer.writerows([row + ['%.10g' % value for value in line] for row, line in zip(rows, values.tolist())])
+				nrows = nrows + len(rows)
+			nchunks = nchunks + len(blocks)
+	finally:
+		if executor is not None:
+			executor.shutdown()
+
+	return nrows
+
+
+# Text file for reading an upload from st.file_uploader without copying it. The upload is detached afterwards rather
+# than closed along with the text file, so it can still be read on later reruns of the app.
+@contextlib.contextmanager
+def uploadtext(upload):
+	infile = io.TextIOWrapper(upload, encoding='utf-8', newline='')
+	try:
+		yield infile
+	finally:
+		infile.detach()
+
+
+# Convert an uploaded CSV table with convert(infile, outfile), which returns the number of rows converted, and offer
+# the output for download as filename. Errors in the table are shown in the app, starting with failed, and the
+# number of rows converted is reported with done and noun. Returns the number of rows, or None if the table couldn't
+# be converted.
+def convertupload(upload, convert, filename, failed='Could not convert the table', done='Converted', noun='rows'):
+	with uploadtext(upload) as infile, tempfile.TemporaryFile('w+', newline='') as outfile:
+		try:
+			nrows = convert(infile, outfile)
+		except (ValueError, UnicodeDecodeError) as err:
+			st.write('#### '+failed+' : '+str(err))
+			return None
+
+		st.write(done, str(nrows), noun+'.')
+		outfile.seek(0)
+		st.download_button('Download CSV file', outfile.read(), file_name=filename)
+
+	return nrows
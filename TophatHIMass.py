@@ -4,6 +4,7 @@
 
 import streamlit as st
 import math
+import numpy
 import imp
 
 # EXTERNAL SCRIPTS IMPORTED AS FUNCTIONS
@@ -18,6 +19,26 @@ import AASN
 imp.reload(AASN)
 from AASN import aasn
 
+# Survey sensitivity grid, evaluates the mass and integrated S/N over many parameter values at once
+import SurveySensitivity
+imp.reload(SurveySensitivity)
+from SurveySensitivity import sensitivitygrid, thresholdmass, detectionthreshold
+
+
+# The grid is cached for each set of parameter ranges, so moving the sliders which only select from the grid
+# doesn't recompute it. Uses cache_resource rather than cache_data so that the (large) arrays are shared
+# rather than copied on every rerun.
+@st.cache_resource(max_entries=8)
+def cachedgrid(w50range, nw50, rmsrange, snrange, distrange, vres):
+	w50vals  = numpy.linspace(w50range[0], w50range[1], nw50)
+	rmsvals  = numpy.linspace(rmsrange[0], rmsrange[1], 20) / 1000.0
+	snvals   = numpy.linspace(snrange[0], snrange[1], 200)
+	distvals = numpy.linspace(distrange[0], distrange[1], 100)
+	
+	topflux, topmass, intsn = sensitivitygrid(w50vals, rmsvals, snvals, distvals, vres)
+	
+	return w50vals, rmsvals, snvals, distvals, topflux, topmass, intsn
+
 
 # STYLE
 # Remove the menu button
@@ -128,3 +149,81 @@ if totsn is not None:
 if totsn is None and dosncalc == True:
 		st.write('#### Errors in input values, cannot calculate integrated S/N value.')
 		st.write('#### Check that the wdith and rms values are not zero.')
+
+
+# Optionally sweep over ranges of all the parameters at once, to map the mass sensitivity of a whole survey
+st.write('')
+if st.checkbox('Survey grid mode', key='dogrid', help='Evaluate the flux, mass and integrated S/N over ranges of line width, rms, S/N and distance, and plot the minimum detectable mass'):
+	st.write('##### Survey grid parameters')
+	st.write('Computes the HI mass and integrated S/N for every combination of the parameter ranges below, then finds the lowest mass reaching the chosen integrated S/N limit at each distance and line width. The grid is only recomputed when the ranges change, so the rms and S/N limit sliders beneath the plot update immediately.')
+	
+	left_column4, right_column4 = st.columns(2)
+	
+	with left_column4:
+		gridw50 = st.slider('Line width range (km/s)', min_value=10.0, max_value=1000.0, value=(50.0, 400.0), key='gridw50')
+		gridrms = st.slider('Rms range (mJy)', min_value=0.1, max_value=10.0, value=(0.5, 3.0), key='gridrms')
+		griddist = st.slider('Distance range (Mpc)', min_value=1.0, max_value=250.0, value=(1.0, 100.0), key='griddist')
+		
+	with right_column4:
+		gridsn = st.slider('Peak S/N range', min_value=0.5, max_value=50.0, value=(1.0, 20.0), key='gridsn')
+		gridnw50 = st.number_input('Number of line widths', min_value=1, max_value=20, value=5, key='gridnw50', help='Number of line widths in the grid. Each is shown as a separate curve on the plot')
+		gridvres = st.number_input('Velocity resolution (km/s)', min_value=0.1, value=10.0, key='gridvres', help='Velocity resolution after smoothing')
+		
+	w50vals, rmsvals, snvals, distvals, gridflux, gridmass, gridintsn = cachedgrid(gridw50, gridnw50, gridrms, gridsn, griddist, gridvres)
+	
+	# These only select from the existing grid
+	gridrmschoice = st.select_slider('Rms (mJy)', options=list(range(len(rmsvals))), format_func=lambda i: nicenumber(rmsvals[i]*1000.0), key='gridrmschoice')
+	gridsnlimit = st.slider('Integrated S/N limit', min_value=1.0, max_value=20.0, value=6.5, key='gridsnlimit')
+	
+	# Keep the rms axis (as a single element) so the grid layout matches what thresholdmass expects
+	rmsslice = slice(gridrmschoice, gridrmschoice+1)
+	minmass = thresholdmass(gridmass[:, rmsslice], gridintsn[:, rmsslice], gridsnlimit)[:, 0]
+	
+	# One curve per line width, in logarithmic units since the mass varies so strongly with distance
+	chartdata = {'Distance (Mpc)': distvals}
+	for i in range(len(w50vals)):
+		chartdata['W50 = '+nicenumber(w50vals[i])+' km/s'] = numpy.log10(minmass[i])
+		
+	st.write('##### Minimum detectable HI mass, log(M<sub style="font-size:60%">&#9737;</sub>)', unsafe_allow_html=True)
+	st.line_chart(chartdata, x='Distance (Mpc)')
+	st.write('Gaps in a curve mean no S/N value in the grid reaches the limit for that line width; increase the upper end of the peak S/N range.')
+
+
+# Optionally solve directly for the detection threshold, rather than adjusting the S/N by hand until the integrated
+# S/N reaches the limit
+st.write('')
+if st.checkbox('Detection threshold solver', key='dosolve', help='Find the peak S/N, flux and HI mass at which a top-hat source just reaches the integrated S/N limit, for several line widths and distances at once'):
+	st.write('##### Detection threshold parameters')
+	st.write('For a top-hat profile the integrated S/N is simply the peak S/N multiplied by w<sub style="font-size:60%">smo</sub><sup style="font-size:60%">1/2</sup>, so the threshold can be found exactly without iterating. Enter one or more line widths and distances, separated by commas or spaces; results are given for every combination.', unsafe_allow_html=True)
+	
+	left_column5, right_column5 = st.columns(2)
+	
+	with left_column5:
+		solvew50 = st.text_input('Line widths (km/s)', '50, 100, 200, 400', key='solvew50')
+		solvedist = st.text_input('Distances (Mpc)', '10, 20, 50', key='solvedist')
+		solvesnlimit = st.number_input('Integrated S/N limit', min_value=0.1, value=6.5, key='solvesnlimit')
+		
+	with right_column5:
+		solverms = st.number_input('Spectra rms (mJy)', min_value=0.0, value=1.0, key='solverms')
+		solvevres = st.number_input('Velocity resolution (km/s)', min_value=0.0, value=10.0, key='solvevres', help='Velocity resolution after smoothing')
+	
+	try:
+		w50vals  = numpy.array([float(x) for x in solvew50.replace(',', ' ').split()])
+		distvals = numpy.array([float(x) for x in solvedist.replace(',', ' ').split()])
+	except ValueError:
+		w50vals  = numpy.array([])
+		distvals = numpy.array([])
+		
+	if len(w50vals) == 0 or len(distvals) == 0 or numpy.any(w50vals <= 0.0) or solverms <= 0.0 or solvevres <= 0.0:
+		st.write('#### Enter positive line widths, distances, rms and velocity resolution to solve for the threshold.')
+	else:
+		# Every line width against every distance
+		snpeak, threshflux, threshmass = detectionthreshold(w50vals[:, None], distvals[None, :], solverms/1000.0, solvevres, solvesnlimit)
+		
+		solvetable = {'W50 (km/s)': numpy.repeat(w50vals, len(distvals)),
+		              'Distance (Mpc)': numpy.tile(distvals, len(w50vals)),
+		              'Peak S/N': snpeak.ravel(),
+		              'Total flux (Jy km/s)': threshflux.ravel(),
+		              'HI mass (Msolar)': threshmass.ravel(),
+		              'log HI mass': numpy.log10(threshmass.ravel())}
+		st.dataframe(solvetable, hide_index=True)
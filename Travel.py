@@ -0,0 +1,97 @@
+# Travel time, distance and speed from t = d / v, for arrays of any size. Given any two of the three (e.g. the
+# distances of every galaxy in a cluster and their velocities), calculates the third and returns all of them in
+# every supported unit as a structured array. Missing values can also be marked per element with NaN, so each row of
+# a table can have a different unknown. Unit conversions are fixed scale factors to SI. Used by TravelTime.py.
+
+import numpy
+import importlib as imp
+
+# Reading and writing tables a chunk at a time
+import TableIO
+imp.reload(TableIO)
+from TableIO import tonumbers, stripped, converttable
+
+# Scale factors for tables of units
+import UnitScale
+imp.reload(UnitScale)
+from UnitScale import scalefactor
+
+
+# Unit conversions
+pc = 3.0856775812799588E16 # 1 pc in m
+yr = 365.0*24.0*3600.0 # 1 yr in seconds
+myr = 365.0*24.0*3600.0*1000000.0 # 1 Myr in seconds
+
+# Scale factors to SI for each supported unit
+distancescale = {'m':1.0, 'pc':pc, 'kpc':1000.0*pc, 'Mpc':1000000.0*pc}
+speedscale    = {'m/s':1.0, 'km/s':1000.0, 'pc/yr':pc/yr, 'kpc/Myr':1000.0*pc/myr}
+timescale     = {'Seconds':1.0, 'Years':yr, 'Myrs':myr, 'Gyrs':1000.0*myr}
+
+# Fields of the structured arrays returned by solvetravel
+traveldtype = [('distance_m', float), ('distance_kpc', float), ('distance_mpc', float),
+               ('speed_ms', float), ('speed_kms', float), ('speed_kpcmyr', float),
+               ('time_s', float), ('time_myr', float), ('time_gyr', float)]
+
+
+# Solve t = d / v for whichever of distance, speed and time is missing, from the other two. Each can be None (the
+# same one missing everywhere), or an array or single value, with NaN marking the missing one element by element.
+# Units can be single strings or arrays of them. Everything is broadcast together, so e.g. distances of shape (n,1)
+# and speeds of shape (m,) give all n x m combinations. Returns a structured array of all three quantities in every
+# unit; elements with more than one missing value, or which can't be solved (e.g. zero speed), give NaN.
+def solvetravel(distance=None, speed=None, time=None, distanceunit='kpc', speedunit='km/s', timeunit='Myrs'):
+	d = numpy.nan if distance is None else numpy.asarray(distance, dtype=float) * scalefactor(distanceunit, distancescale)
+	v = numpy.nan if speed is None else numpy.asarray(speed, dtype=float) * scalefactor(speedunit, speedscale)
+	t = numpy.nan if time is None else numpy.asarray(time, dtype=float) * scalefactor(timeunit, timescale)
+	d, v, t = numpy.broadcast_arrays(d, v, t)
+
+	with numpy.errstate(invalid='ignore', divide='ignore'):
+		# Each missing value is found from the original values of the other two, so two missing gives NaN
+		vsolve = numpy.where(numpy.isnan(v), d / numpy.where(t > 0.0, t, numpy.nan), v)
+		tsolve = numpy.where(numpy.isnan(t), d / numpy.where(v > 0.0, v, numpy.nan), t)
+		dsolve = numpy.where(numpy.isnan(d), v * t, d)
+
+		result = numpy.empty(dsolve.shape, dtype=traveldtype)
+		result['distance_m']   = dsolve
+		result['distance_kpc'] = dsolve / distancescale['kpc']
+		result['distance_mpc'] = dsolve / distancescale['Mpc']
+		result['speed_ms']     = vsolve
+		result['speed_kms']    = vsolve / speedscale['km/s']
+		result['speed_kpcmyr'] = vsolve / speedscale['kpc/Myr']
+		result['time_s']       = tsolve
+		result['time_myr']     = tsolve / timescale['Myrs']
+		result['time_gyr']     = tsolve / timescale['Gyrs']
+
+	return result
+
+
+# Raise a ValueError if a table doesn't have the columns needed
+def checkcolumns(columns):
+	if sum(name in columns for name in ['distance', 'speed', 'time']) < 2:
+		raise ValueError('The table must have a header row with at least two columns named distance, speed and time')
+
+
+# Solve one chunk of a table, given as a dictionary of its columns (see TableIO.converttable). Missing or empty unit
+# entries take the defaults.
+def solvechunk(table, defdistanceunit, defspeedunit, deftimeunit):
+	values = [tonumbers(table[name]) if name in table else None for name in ['distance', 'speed', 'time']]
+	units = [defdistanceunit, defspeedunit, deftimeunit]
+	for i, name in enumerate(['distance_unit', 'speed_unit', 'time_unit']):
+		if name in table:
+			unit = stripped(table[name])
+			units[i] = numpy.where(unit == '', units[i], unit)
+
+	solved = solvetravel(*values, *units)
+
+	return [solved[name] for name, dtype in traveldtype]
+
+
+# Convert a whole CSV table, from an open input file to an open output file. The input needs a header row with at
+# least two of distance, speed and time columns; a row's missing value can be left empty and is solved for.
+# distance_unit, speed_unit and time_unit columns are optional, with the given defaults used if they're missing.
+# All the input columns are copied to the output, followed by all the quantities in every unit. Returns the number
+# of rows converted.
+def convertcsv(infile, outfile, defdistanceunit='kpc', defspeedunit='km/s', deftimeunit='Myrs', chunksize=100000):
+	convert = lambda table, number: solvechunk(table, defdistanceunit, defspeedunit, deftimeunit)
+	incolumns = ['distance', 'speed', 'time', 'distance_unit', 'speed_unit', 'time_unit']
+
+	return converttable(infile, outfile, convert, incolumns, [name for name, dtype in traveldtype], checkcolumns, chunksize)
@@ -1,8 +1,7 @@
 # Calculate distance, speed or travel time in different, friendly units
 
 import streamlit as st
-import math
-from math import pi as pi
+import os
 import importlib as imp
 
 # EXTERNAL SCRIPTS IMPORTED AS FUNCTIONS
@@ -12,6 +11,21 @@ import NiceNumber
 imp.reload(NiceNumber)
 from NiceNumber import nicenumber
 
+# Travel time, distance and speed for single values or arrays, and for CSV tables
+import Travel
+imp.reload(Travel)
+from Travel import solvetravel, convertcsv, distancescale, speedscale, timescale
+
+# Converting uploaded tables
+import TableIO
+imp.reload(TableIO)
+from TableIO import convertupload
+
+# Timescales for whole catalogues of cluster members, deprojected by Monte Carlo
+import ClusterTimescales
+imp.reload(ClusterTimescales)
+from ClusterTimescales import defaultparams
+
 
 # STYLE
 # Remove the menu button
@@ -26,12 +40,6 @@ st.write('<style>div.block-container{padding-bottom:0rem;}</style>', unsafe_allo
 
 
 # MAIN CODE
-# Unit conversions
-pc = 3.0856775812799588E16 # 1 pc in m
-yr = 365.0*24.0*3600.0 # 1 yr in seconds
-myr = 365.0*24.0*3600.0*1000000.0 # 1 Myr in seconds
-
-
 # Three different calculations : time, distance, and speed. Since each use the same parameters, but the whole script is re-run each time
 # a value is updated, give them different variable names to avoid conflicts. E.g. dist_ft = distance for time, fd = for distance, fs = 
 # for speed
@@ -54,38 +62,16 @@ if st.checkbox('Calculate travel time'):
 		
 	with right_column:
 		# Distance unit widget, row 1 
-		distunit_ft = st.selectbox('Distance unit', ('m', 'pc', 'kpc', 'Mpc', 'm'), index=2, key="munitfortime")
+		distunit_ft = st.selectbox('Distance unit', ('m', 'pc', 'kpc', 'Mpc'), index=2, key="munitfortime")
 
 		# Speed unit widget, row 2 
 		speedunit_ft = st.selectbox('Speed unit', ('km/s', 'pc/yr', 'kpc/Myr'), key="sunitfortime")
 				
-	# Get everything into SI units
-	if distunit_ft == 'm':
-		distance_ft = dist_ft
-
-	if distunit_ft == 'pc':
-		distance_ft = dist_ft*pc
-		
-	if distunit_ft == 'kpc':
-		distance_ft = dist_ft*1000.0*pc	
-		
-	if distunit_ft == 'Mpc':
-		distance_ft = dist_ft*1000000.0*pc
-
-	if speed_ft > 0.0:		
-		if speedunit_ft == 'km/s':
-			velocity_ft = speed_ft*1000.0
-		
-		if speedunit_ft == 'pc/yr':
-			velocity_ft = speed_ft*pc / yr
-		
-		if speedunit_ft == 'kpc/Myr':
-			velocity_ft = speed_ft*1000.0*pc / myr
-		
-		sitime_ft = distance_ft/ velocity_ft
-	
-		myrtime_ft = sitime_ft / myr
-	
+	# Solve for the time, in all units
+	if speed_ft > 0.0:
+		travel_ft = solvetravel(dist_ft, speed_ft, None, distunit_ft, speedunit_ft)
+		sitime_ft = float(travel_ft['time_s'])
+		myrtime_ft = float(travel_ft['time_myr'])
 	
 		st.write("#### Time taken = ", nicenumber(myrtime_ft),' in Myr, or ', nicenumber(sitime_ft),' in seconds.') 
 		st.write('Exact values are '+str(myrtime_ft)+' in Myr and '+str(sitime_ft)+' in seconds.')
@@ -109,30 +95,10 @@ if st.checkbox('Calculate distance travelled'):
 		# Time unit widget, row 2 
 		timeunit_fd = st.selectbox('Time unit', ('Seconds', 'Years', 'Myrs', 'Gyrs'), index=2, key="tunitfordist")
 
-	# Get into SI units
-	if speedunit_fd == 'km/s':
-		velocity_fd = speed_fd*1000.0
-		
-	if speedunit_fd == 'pc/yr':
-		velocity_fd = speed_fd*pc / yr
-		
-	if speedunit_fd == 'kpc/Myr':
-		velocity_fd = speed_fd*1000.0*pc / myr
-		
-	if timeunit_fd == 'Seconds':
-		sitime_fd = time_fd
-	
-	if timeunit_fd == 'Years':
-		sitime_fd = time_fd * yr
-		
-	if timeunit_fd == 'Myrs':
-		sitime_fd = time_fd * myr	
-		
-	if timeunit_fd == 'Gyrs':
-		sitime_fd = time_fd * (1000.0*myr)
-			
-	sidist_fd = velocity_fd * sitime_fd	
-	stnddist_fd = sidist_fd / (1000.0*pc)
+	# Solve for the distance, in all units
+	travel_fd = solvetravel(None, speed_fd, time_fd, speedunit=speedunit_fd, timeunit=timeunit_fd)
+	sidist_fd = float(travel_fd['distance_m'])
+	stnddist_fd = float(travel_fd['distance_kpc'])
 			
 	st.write("#### Distance travelled = ", nicenumber(stnddist_fd),' in kpc, or ', nicenumber(sidist_fd),' in metres.') 
 	st.write('Exact values are '+str(stnddist_fd)+' in kpc and '+str(sidist_fd)+' in metres.')
@@ -156,36 +122,81 @@ if st.checkbox('Calculate average speed'):
 		# Time unit widget, row 2 
 		timeunit_fs = st.selectbox('Time unit', ('Seconds', 'Years', 'Myrs', 'Gyrs'), index=2, key="tunitforspeed")
 
-	# Get into SI units
-	if distunit_fs == 'm':
-		distance_fs = dist_fs	
-	
-	if distunit_fs == 'pc':
-		distance_fs = dist_fs*pc
-		
-	if distunit_fs == 'kpc':
-		distance_fs = dist_fs*1000.0*pc	
-		
-	if distunit_fs == 'Mpc':
-		distance_fs = dist_fs*1000000.0*pc
-		
-	if timeunit_fs == 'Seconds':
-		sitime_fs = time_fs
-	
-	if timeunit_fs == 'Years':
-		sitime_fs = time_fs * yr
-		
-	if timeunit_fs == 'Myrs':
-		sitime_fs = time_fs * myr	
-		
-	if timeunit_fs == 'Gyrs':
-		sitime_fs = time_fs * (1000.0*myr)
-		
-	if sitime_fs > 0.0:
-		# Calculate speed in km/s
-		sispeed = (distance_fs/1000.) / sitime_fs
-		# And also in kpc / Myr
-		stnspeed = (distance_fs/ (1000.0*pc)) / (sitime_fs / myr)
+	# Solve for the speed, in km/s and also in kpc / Myr
+	if time_fs > 0.0:
+		travel_fs = solvetravel(dist_fs, None, time_fs, distunit_fs, timeunit=timeunit_fs)
+		sispeed = float(travel_fs['speed_kms'])
+		stnspeed = float(travel_fs['speed_kpcmyr'])
 		
 		st.write("#### Average speed = ", nicenumber(sispeed),' in km/s, or ', nicenumber(stnspeed),' kpc/Myr.') 	
 		st.write('Exact values are '+str(sispeed)+' in km/s and '+str(stnspeed)+' in kpc/Myr.')
+
+
+# TABLE CONVERSION
+# Solves a whole table at once, e.g. the crossing time of every galaxy in a cluster
+st.write('###')
+st.write('#### Table conversion')
+if st.checkbox('Calculate for a table', key='dotraveltable', help='Upload a CSV table with any two of distance, speed and time for each row, and get the third'):
+	st.write('Upload a CSV file with a header row and at least two of the columns **distance**, **speed** and **time**. Leave the unknown value empty in each row (it can be a different one in every row) and it will be calculated. Optionally include **distance_unit**, **speed_unit** and **time_unit** columns to set the units for each row; otherwise the units below are used for all of them. Any other columns (e.g. names) are copied to the output, followed by all three quantities in several units. The table is converted a chunk at a time, so it can be as long as you like. Rows which can\'t be solved are given NaN.')
+
+	left_column, mid_column, right_column = st.columns(3)
+
+	with left_column:
+		tabledistunit = st.selectbox('Default distance unit', tuple(distancescale), index=2, key='tabledistunit')
+
+	with mid_column:
+		tablespeedunit = st.selectbox('Default speed unit', tuple(speedscale), index=1, key='tablespeedunit')
+
+	with right_column:
+		tabletimeunit = st.selectbox('Default time unit', tuple(timescale), index=2, key='tabletimeunit')
+
+	travelfile = st.file_uploader('Table of distances, speeds and times', type=['csv', 'txt'], key='travelfile')
+
+	if travelfile is not None:
+		convertupload(travelfile, lambda infile, outfile: convertcsv(infile, outfile, tabledistunit, tablespeedunit, tabletimeunit), 'travel.csv')
+
+
+# CLUSTER MEMBERS
+st.write('###')
+st.write('#### Cluster member timescales')
+if st.checkbox('Calculate for a cluster catalogue', key='doclustertable', help='Upload a CSV catalogue of cluster members and get the infall time to the cluster centre, the time to cross R200, and the ram pressure for each'):
+	st.write('Upload a CSV file with a header row giving the projected position of each galaxy, either as **rproj** (projected distance from the cluster centre, in kpc) or as **ra** and **dec** (degrees), and its velocity, either as **vlos** (line-of-sight velocity relative to the cluster, km/s) or as **velocity** (recession velocity, km/s). Only these two of the six phase-space coordinates are known, so each galaxy is deprojected over many random orientations : its depth along the line of sight is drawn assuming members are spread uniformly through a sphere around the cluster, and its two tangential velocity components from an isotropic Gaussian with the cluster velocity dispersion. The output gives the median and 16th and 84th percentiles of the 3D radius, speed and radial velocity (negative for infall), the time to cross R200 at the present speed, and the ram pressure (dyn cm<sup>-2</sup>) from a beta model of the intracluster medium. The infall time, to reach the centre at the present radial speed, only exists for orientations where the galaxy is moving inwards : its percentiles are over those alone, and **inbound_fraction** gives the fraction of orientations where it is. Times since pericentre would need the orbits integrating in a model of the cluster potential, so aren\'t given. Any other columns (e.g. names) are copied to the output.', unsafe_allow_html=True)
+
+	left_column, mid_column, right_column = st.columns(3)
+
+	with left_column:
+		clusterra = st.number_input('Cluster RA (degrees)', min_value=0.0, max_value=360.0, value=187.70593, format='%.5f', key='clusterra', help='Only used if the table gives ra and dec rather than rproj')
+		clusterdec = st.number_input('Cluster Dec (degrees)', min_value=-90.0, max_value=90.0, value=12.39112, format='%.5f', key='clusterdec')
+		clusterdist = st.number_input('Cluster distance (Mpc)', min_value=0.0, value=16.5, key='clusterdist', help='Angular diameter distance, to convert separations on the sky to projected distances')
+		clustervel = st.number_input('Cluster velocity (km/s)', value=1100.0, key='clustervel', help='Only used if the table gives recession velocities rather than vlos')
+
+	with mid_column:
+		clusterr200 = st.number_input('R200 (kpc)', min_value=1.0, value=defaultparams['r200'], key='clusterr200')
+		clustersigma = st.number_input('Velocity dispersion (km/s)', min_value=0.0, value=defaultparams['sigma'], key='clustersigma', help='Line-of-sight velocity dispersion, used for the tangential velocities')
+		clusterrlimit = st.number_input('Extent (R200)', min_value=0.01, value=defaultparams['rlimit'], key='clusterrlimit', help='Radius of the sphere members are assumed to be spread through, in units of R200')
+
+	with right_column:
+		clustern0 = st.number_input('ICM central density (cm^-3)', min_value=0.0, value=defaultparams['n0'], format='%.4g', key='clustern0')
+		clusterrc = st.number_input('ICM core radius (kpc)', min_value=0.01, value=defaultparams['rc'], key='clusterrc')
+		clusterbeta = st.number_input('ICM beta', min_value=0.0, value=defaultparams['beta'], key='clusterbeta')
+
+	left_column, mid_column, right_column = st.columns(3)
+
+	with left_column:
+		clustersamples = st.number_input('Orientations per galaxy', min_value=10, value=1000, step=100, key='clustersamples')
+		clusterseed = st.number_input('Random seed', min_value=0, value=1, key='clusterseed')
+
+	with mid_column:
+		clusterchunk = st.number_input('Chunk size', min_value=10, value=1000, step=100, key='clusterchunk', help='Number of galaxies held in memory at once, per process')
+
+	with right_column:
+		clusterworkers = st.number_input('Processes', min_value=1, max_value=os.cpu_count() or 1, value=1, key='clusterworkers', help='Number of processes to spread the chunks over. The same seed always gives the same result, however many processes are used.')
+
+	clusterfile = st.file_uploader('Catalogue of cluster members', type=['csv', 'txt'], key='clusterfile')
+
+	if clusterfile is not None:
+		cluster = {'ra':clusterra, 'dec':clusterdec, 'distance':clusterdist, 'velocity':clustervel}
+		params = {'r200':clusterr200, 'sigma':clustersigma, 'rlimit':clusterrlimit, 'n0':clustern0, 'rc':clusterrc, 'beta':clusterbeta}
+
+		convertupload(clusterfile, lambda infile, outfile: ClusterTimescales.convertcsv(infile, outfile, cluster, params, clustersamples, clusterchunk, clusterseed, clusterworkers),
+		              'clustertimescales.csv', 'Could not process the catalogue', 'Processed', 'galaxies')
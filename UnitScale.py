@@ -0,0 +1,47 @@
+# Unit handling for WhatsMyLIne.py. Every supported unit is a fixed scale factor from SI (Hz, m, m/s, or nothing for
+# redshift), so values are normalised with a single multiplication rather than by attaching astropy units. Units can
+# be given as a single string or as an array with one per value. Other tables of scale factors can be used too.
+
+import numpy
+
+
+# Scale factor to SI for each unit
+unitscale = {'Hz':1.0, 'kHz':1E3, 'MHz':1E6, 'GHz':1E9, 'THz':1E12, 'm':1.0, 'cm':1E-2, 'None':1.0, 'km/s':1E3, 'm/s':1.0}
+
+# Units which can be used for each type of value
+typeunits = {'Frequency':('Hz', 'kHz', 'MHz', 'GHz', 'THz'),
+             'Wavelength':('m', 'cm'),
+             'Redshift':('None',),
+             'Optical velocity':('km/s', 'm/s'),
+             'Radio velocity':('km/s', 'm/s'),
+             'Relativistic velocity':('km/s', 'm/s')}
+
+
+# Scale factors for a unit or array of units, from the given table of scale factors (by default the SI ones above).
+# Unknown units give NaN. Arrays are converted with one dictionary lookup per distinct unit, not per value.
+def scalefactor(units, scales=unitscale):
+	units = numpy.asarray(units, dtype=str)
+	names, inverse = numpy.unique(units, return_inverse=True)
+	factors = numpy.array([scales.get(name, numpy.nan) for name in names])
+
+	return factors[inverse].reshape(units.shape)
+
+
+# Value(s) in SI units
+def tosi(values, units):
+	return numpy.asarray(values, dtype=float) * scalefactor(units)
+
+
+# Value(s) in SI converted to the given units
+def fromsi(values, units):
+	return numpy.asarray(values, dtype=float) / scalefactor(units)
+
+
+# Whether the unit(s) can be used for the type(s) of value
+def unitmatch(units, types):
+	units = numpy.asarray(units, dtype=str)
+	types = numpy.asarray(types, dtype=str)
+	pairs = numpy.char.add(numpy.char.add(types, ':'), units)
+	valid = [valuetype+':'+unit for valuetype in typeunits for unit in typeunits[valuetype]]
+
+	return numpy.isin(pairs, valid)
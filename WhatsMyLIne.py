@@ -3,10 +3,8 @@
 # Returns the optical, radio, and relativisitic velocities, as well as frequency and redshift.
 
 import numpy
-import astropy
-from astropy import units as u
-import math
 import imp
+import os
 import streamlit as st
 from streamlit.components.v1 import html
 from astropy import constants
@@ -20,6 +18,36 @@ import NiceNumber
 imp.reload(NiceNumber)
 from NiceNumber import nicenumber
 
+# Conversions between observed frequency, redshift, wavelength and velocities
+import LineConversion
+imp.reload(LineConversion)
+from LineConversion import lineconversion, observedfrequency
+
+# Scale factors between the supported units and SI
+import UnitScale
+imp.reload(UnitScale)
+from UnitScale import tosi, fromsi, unitmatch, typeunits
+
+# Batch conversion of CSV tables
+import LineBatch
+imp.reload(LineBatch)
+from LineBatch import convertcsv
+
+# Converting uploaded tables
+import TableIO
+imp.reload(TableIO)
+from TableIO import convertupload
+
+# Spectral axes of FITS cubes
+import SpectralAxis
+imp.reload(SpectralAxis)
+from SpectralAxis import spectralaxis, axisinfo, axischunks, axiscolumns, writeaxistable, regriddedheader, copycube, outputtypes
+
+# Local spectral line catalogue
+import LineCatalogue
+imp.reload(LineCatalogue)
+from LineCatalogue import loadcatalogue, linesinband, identifylines, defaultcatalogue
+
 # User can provide :
 # Velocity
 # Frequency
@@ -32,73 +60,23 @@ from NiceNumber import nicenumber
 
 
 # Standard conversion routine. Calculation of the rest/observed frequency, if not provided directly, is done within the main code.
-# This part does the standard conversions to all the other possible values. 
+# This part does the standard conversions to all the other possible values, using the closed-form expressions in LineConversion.py
+# (which also work on whole arrays of frequencies). Velocities are returned in km/s and the redshifted wavelength in m.
 # NOTE : Both input values must be real numbers in units of Hz, not astropy objects containing the unit types.
 def conversion(restfreq, obsfrq):
-	# Set up the equivalences for the conversion of the observed values
-	restfreq = restfreq*u.Hz
-	obsfrq = obsfrq*u.Hz
-	
-	freq_to_radvel = u.doppler_radio(restfreq)
-	freq_to_optvel = u.doppler_optical(restfreq)
-	freq_to_relvel = u.doppler_relativistic(restfreq)
-													 
-	# Calculate observed optical, radio, relativistic velocities
-	obsoptvel = (obsfrq).to(u.km / u.s, equivalencies=freq_to_optvel)
-	obsradvel = (obsfrq).to(u.km / u.s, equivalencies=freq_to_radvel)
-	obsrelvel = (obsfrq).to(u.km / u.s, equivalencies=freq_to_relvel)
-											
-	# Calculate observed redshift (unless specified already)
-	if obstype != 'Redshift':
-		redshift = (restfreq.value - obsfrq.value) / restfreq.value
-	if obstype == 'Redshift':
-		redshift = obsvalue
-		
-	restfrq_astro = restfreq
-	waveval_astro = (restfrq_astro).to(u.m, equivalencies=u.spectral())
-	
-	# *** DEPRECATED. Since the input is always in Hz (unitless real number), there is no point in
-	# using the GUI value - the input has already been standardised ! ***
-	
-	# Calculate observed wavelength. Need to have this here with the astropy units for the equivalencies
-	# to work. Below, this is converted to a real number for the wavelength calculation itself.
-	# This assumes implicitly that the unit type is frequency. This is a safe assumption as this routine
-	# is only invoked if the unit-types are compatible.
-	#if restunits == 'Hz':
-	#	restfrq_astro   =  restvalue * u.Hz
-	#	waveval_astro   =  (restfrq_astro).to(u.m, equivalencies=u.spectral())
-
-	#if restunits == 'kHz':
-	#	restfrq_astro   =  restvalue * 1000.0 * u.kHz
-	#	waveval_astro   =  (restfrq_astro).to(u.m, equivalencies=u.spectral())
-	
-	#if restunits == 'MHz':
-	#	restfrq_astro   =  restvalue * 1E6 * u.MHz
-	#	waveval_astro   =  (restfrq_astro).to(u.m, equivalencies=u.spectral())
-		
-	#if restunits == 'GHz':
-	#	restfrq_astro   =  restvalue * 1E9 * u.GHz
-	#	waveval_astro   =  (restfrq_astro).to(u.m, equivalencies=u.spectral())
-
-	#if restunits == 'THz':
-	#	restfrq_astro   =  restvalue * 1E12 * u.THz
-	#	waveval_astro   =  (restfrq_astro).to(u.m, equivalencies=u.spectral())
-		
-	# For user input of frequency we use the unit boxes as above. When the user inputs wavelength,
-	# we have to assume the rest frequency provided here is in Hz.
-	#if resttype == 'Wavelength':
-	#	restfrq_astro = restfreq #* u.Hz
-	#	waveval_astro   =  (restfrq_astro).to(u.m, equivalencies=u.spectral())
-		
-	waveval  = waveval_astro.value
-					
-	# Calculate redshifted wavelength
-	redwave = (redshift*waveval) + waveval
+	redshift, redwave, obsoptvel, obsradvel, obsrelvel = lineconversion(restfreq, obsfrq)
 			
-	return redshift, redwave, obsoptvel, obsradvel, obsrelvel
+	return float(redshift), float(redwave), float(obsoptvel), float(obsradvel), float(obsrelvel)
 
 
 
+# Catalogues are memory-mapped, so opening them is cheap, but they're still kept open between reruns rather than
+# reopened every time. The modification time is part of the key so that edited catalogues are reloaded.
+@st.cache_resource(max_entries=4)
+def cachedcatalogue(filename, mtime):
+	return loadcatalogue(filename)
+
+
 # STREAMLIT STYLE
 # Remove the menu button
 st.markdown(""" <style>
@@ -117,11 +95,8 @@ st.write("Calculates the frequency of a spectral line at a given redshit, veloci
 st.image('AGESRuler.png')
 
 
-# Dictionary for line frequencies, all in Hz. Here we set the default dictionary, which assumes the user has chosen frequency with units of Hz.
-# Later the dictionary will be updated if the user chooses other unit/types, hence we need to use the st.session_state to preseve the variable,
-# rather than just setting its value in the usual way.
-if 'linefs' not in st.session_state:
-	st.session_state['linefs'] = {'HI':1420.40575E6, 'CO(1-0)':115.27120180E9, 'CO(2-1)':230.53800000E9, 'Custom':0.0, 'Splatalogue':0.0}
+# Preset line frequencies, all in Hz. These are converted to the chosen rest units when the line is picked.
+linefs = {'HI':1420.40575E6, 'CO(1-0)':115.27120180E9, 'CO(2-1)':230.53800000E9, 'Custom':0.0, 'Splatalogue':0.0}
 
 
 # REST VALUES
@@ -132,38 +107,30 @@ st.write('Enter the numerical value of the rest frequency or wavelength of the l
 left_column, left_mid_column, right_mid_column, right_column = st.columns(4)
 
 with left_column:
-	presetlines = st.selectbox('Line', ('HI', 'CO(1-0)', 'CO(2-1)', 'Custom', 'Splatalogue'), key="linepicker", help="Choose a present spectral line, specify a custom value, or access the Splatalogue database. If you alter the units or unit types, reselect the line in this menu to update its rest value.")
+	presetlines = st.selectbox('Line', ('HI', 'CO(1-0)', 'CO(2-1)', 'Custom', 'Splatalogue'), key="linepicker", help="Choose a present spectral line, specify a custom value, or access the Splatalogue database.")
 	
-with left_mid_column:
-	restvalue = st.number_input("Rest value", format="%.6f", min_value = 0.0, value=st.session_state['linefs'][presetlines], key="linevalue", step=1.0, help='Specify the numerical value of the rest frequency or wavelength, according to the menus on the right')
-
 with right_mid_column:
 	resttype = st.selectbox('Rest unit type', ('Frequency', 'Wavelength'), key="resttype", help='Choose whether the rest value refers to frequency or wavelength')
 	
 with right_column:
 	restunits = st.selectbox('Rest units', ('Hz', 'kHz', 'MHz', 'GHz', 'THz', 'm', 'cm', ), key="restunits", help='Specify the rest value units')
- 
-
-# Now we update the line frequencies dictionary according to the user's parameters
-if resttype == 'Frequency':
-	if restunits == 'kHz':
-		st.session_state['linefs'] = {'HI':1420.40575E3, 'CO(1-0)':115.27120180E6, 'CO(2-1)':230.53800000E6, 'Custom':0.0, 'Splatalogue':0.0}
 
-	if restunits == 'MHz':
-		st.session_state['linefs'] = {'HI':1420.40575, 'CO(1-0)':115.27120180E3, 'CO(2-1)':230.53800000E3, 'Custom':0.0, 'Splatalogue':0.0}
-		
-	if restunits == 'GHz':
-		st.session_state['linefs'] = {'HI':1420.40575E-3, 'CO(1-0)':115.27120180, 'CO(2-1)':230.53800000, 'Custom':0.0, 'Splatalogue':0.0}
-		
-	if restunits == 'THz':
-		st.session_state['linefs'] = {'HI':1420.40575E-6, 'CO(1-0)':115.27120180E-3, 'CO(2-1)':230.53800000E-3, 'Custom':0.0, 'Splatalogue':0.0}
+# Value of the preset line in the chosen units (the wavelength if that's the chosen type). This is only put into
+# the rest value box when the line, type or units are changed, so that values typed in by hand aren't overwritten.
+# Custom values are left alone.
+presetvalue = linefs[presetlines]
+if presetvalue > 0.0 and unitmatch(restunits, resttype):
+	if resttype == 'Wavelength':
+		presetvalue = c / presetvalue
+	presetvalue = float(fromsi(presetvalue, restunits))
 
-if resttype == 'Wavelength':
-	if restunits == 'm':
-		st.session_state['linefs'] = {'HI':0.2110611408043089, 'CO(1-0)':0.0026007576334647012, 'CO(2-1)':0.0013004036557964413, 'Custom':0.0, 'Splatalogue':0.0}
+if st.session_state.get('linepreset') != (presetlines, resttype, restunits):
+	st.session_state['linepreset'] = (presetlines, resttype, restunits)
+	if linefs[presetlines] > 0.0 or 'linevalue' not in st.session_state:
+		st.session_state['linevalue'] = presetvalue
 
-	if restunits == 'cm':
-		st.session_state['linefs'] = {'HI':21.10611408043089, 'CO(1-0)':0.26007576334647012, 'CO(2-1)':0.13004036557964413, 'Custom':0.0, 'Splatalogue':0.0}
+with left_mid_column:
+	restvalue = st.number_input("Rest value", format="%.6f", min_value = 0.0, key="linevalue", step=1.0, help='Specify the numerical value of the rest frequency or wavelength, according to the menus on the right')
 
 # If the user chooses Splatogoue as the preset line, open the webpage
 if presetlines == 'Splatalogue':
@@ -192,35 +159,9 @@ with right_column:
 	obsunits = st.selectbox('Observed units', ('Hz', 'kHz', 'MHz', 'GHz', 'THz', 'm', 'cm', 'None', 'km/s', 'm/s'), key="obsunits", help='Specify the observed value units, or use "None" for redshift')
 
 
-# Default is to assume units are mistmatched
-inpunitmatch = False
-outunitmatch = False
-
-# 1) Check INPUT units are consistent
-if resttype == 'Frequency':
-	if restunits in ['Hz', 'kHz', 'MHz', 'GHz', 'THz']:
-		inpunitmatch = True
-		
-if resttype == 'Wavelength':
-	if restunits in ['m', 'cm']:
-		inpunitmatch = True
-		
-# 2) Check OUPTUT units are consistent
-if obstype == 'Frequency':
-	if obsunits in ['Hz', 'kHz', 'MHz', 'GHz', 'THz']:
-		outunitmatch = True
-		
-if obstype == 'Wavelength':
-	if obsunits in ['m', 'cm']:
-		outunitmatch = True
-		
-if obstype == 'Redshift':
-	if obsunits == 'None':
-		outunitmatch = True
-		
-if obstype in ['Optical velocity', 'Radio velocity', 'Relativistic velocity']:
-	if obsunits in ['km/s', 'm/s']:
-		outunitmatch = True
+# Check the units are consistent with the types of the rest and observed values
+inpunitmatch = bool(unitmatch(restunits, resttype))
+outunitmatch = bool(unitmatch(obsunits, obstype))
 		
 
 # If there is a mismatch in the input units/type, print a warning
@@ -233,197 +174,217 @@ if inpunitmatch == False :
 if inpunitmatch == True: 
 	st.write('#### Standardised rest line values')
 	
-	# Rest values of wavelength and frequency, in astropy composite units
-	wavel = None
-	frqvl = None
-	
 	# 1) First get standardised values for the rest frequency in Hz and the wavelength in m. We do this just so we
 	# can print the rest wavelength here, in case that wasn't entered (or vice-versa).
-	# A) If the user specifies frequency for the rest value :
 	if resttype == 'Frequency':
-		
-		# Multiply by e.g. "u.MHz" to attach the unit, required for other astropy processing. Note that this does
-		# not affect the numerical value ! So if we give it a numerical entry of 100.0, that will become 100 Hz,
-		# 100 MHz, etc. However this DOES affect the conversion afterwards, e.g. 100 MHz converted to Hz will
-		# indeed be 100 million Hz.
-		if restunits == 'Hz':
-			frqvl   =  restvalue * u.Hz
-			wavel   =  (frqvl).to(u.m, equivalencies=u.spectral())
-
-		if restunits == 'kHz':
-			frqvl   =  restvalue * u.kHz
-			wavel   =  (frqvl).to(u.m, equivalencies=u.spectral())
-	
-		if restunits == 'MHz':
-			frqvl   =  restvalue * u.MHz
-			wavel   =  (frqvl).to(u.m, equivalencies=u.spectral())
-		
-		if restunits == 'GHz':
-			frqvl   =  restvalue * u.GHz
-			wavel   =  (frqvl).to(u.m, equivalencies=u.spectral())
-
-		if restunits == 'THz':
-			frqvl   =  restvalue * u.THz
-			wavel   =  (frqvl).to(u.m, equivalencies=u.spectral())
-
-		# Likely impossible that we can't calculate the wavelength thanks to the unit consistency check, but no
-		# harm including this additional safety check in case it couldn't be calculated
-		if wavel == None:
-			st.write('### Error : rest unit/type mismatch !')
-		# If everything is good, we can now just print the values in standardised units
-		else:			
-			waveln  = wavel.value	
-			frqvln  = frqvl.to(u.Hz).value	#		(frqvl.value * u.Hz).value
-			
-			st.write('Rest wavelength :',str(waveln),'m')
-			st.write('Rest frequency  :',str(frqvln),'Hz')
-									
+		frqvln = float(tosi(restvalue, restunits))
+		waveln = c / frqvln if frqvln > 0.0 else numpy.inf
 	
-	# B) As above, but for the case where the user specifies wavelength for the rest value :
 	if resttype == 'Wavelength':
+		waveln = float(tosi(restvalue, restunits))
+		frqvln = c / waveln if waveln > 0.0 else numpy.inf
 		
-		if restunits == 'm':
-			wavel   =  restvalue * u.m
-			frqvl = (wavel).to(u.Hz, equivalencies=u.spectral())
-			
-		if restunits == 'cm':
-			wavel   =  restvalue * u.cm
-			frqvl = (wavel).to(u.Hz, equivalencies=u.spectral())			
-		
-		if wavel == None:
-			st.write('### Error : rest unit/type mismatch !')
-		else:			
-			waveln  = wavel.value	
-			frqvln  = (frqvl.value * u.Hz).value
-			
-			st.write('Rest wavelength :',str(waveln),'m')
-			st.write('Rest frequency  :',str(frqvln),'Hz')
-			
+	st.write('Rest wavelength :',str(waveln),'m')
+	st.write('Rest frequency  :',str(frqvln),'Hz')
 	
 	
 	# 2) Now we can convert the redshifted value to all the other units, as long as the units match
 	if outunitmatch == False:
 		st.write('#### Output units must be self-consistent to calculate redshifted values.')
 		
-	if wavel != None and outunitmatch == True:
+	if outunitmatch == True:
 		st.write('###')
 		st.write('#### Redshifted values')
 		
-		# A) Redshifted value is frequency
-		if obstype == 'Frequency': #and obsunits in ['Hz', 'kHz', 'MHz', 'GHz', 'THz']:			
-			restfreq = frqvln
-			
-			# We already have the rest frequency (frqvl.value) in Hz. We just need to get the redshifted frequency value,
-			# accounting for the user-specified units.
-			if obsunits == 'Hz':
-				obsfrq = obsvalue * 1.0
-			if obsunits == 'kHz':
-				obsfrq = obsvalue * 1000.0 	
-			if obsunits == 'MHz':
-				obsfrq = obsvalue * 1E6	
-			if obsunits == 'GHz':
-				obsfrq = obsvalue * 1E9 
-			if obsunits == 'THz':
-				obsfrq = obsvalue * 1E12
-			
-			# Do the conversions
-			redshift, redwave, obsoptvel, obsradvel, obsrelvel = conversion(restfreq, obsfrq)
-			
-			st.write('Redshifted **optical** velocity :',str(obsoptvel))
-			st.write('Redshifted **radio** velocity :',str(obsradvel))
-			st.write('Redshifted **relativisitic** velocity :',str(obsrelvel))			
-			st.write('Redshift :',str(redshift))			
-			st.write('Redshifted wavelength :',str(redwave),'m')
-			st.write('Redshifted frequency :',str(obsfrq),'Hz')
-			
-	
-		# B) Redshifted value is wavelength 
-		if obstype == 'Wavelength' and obsunits in ['cm', 'm']:
-			# Convert to redshifted frequency
-			if obsunits == 'cm':
-				redwfrq = (obsvalue * u.cm).to(u.Hz, equivalencies=u.spectral())
-			if obsunits == 'm':
-				redwfrq = (obsvalue * u.m).to(u.Hz, equivalencies=u.spectral())
-							
-			# Now we can repeat the case of frequency !		
-			redshift, redwave, obsoptvel, obsradvel, obsrelvel = conversion(frqvln, redwfrq.value)
-			
-			st.write('Redshifted **optical** velocity :',str(obsoptvel))
-			st.write('Redshifted **radio** velocity :',str(obsradvel))
-			st.write('Redshifted **relativisitic** velocity :',str(obsrelvel))
-			st.write('Redshift :',str(redshift))
-			st.write('Redshifted wavelength :',str(redwave),'m')
-			st.write('Redshifted frequency :',str(redwfrq.value),'Hz')
-			
-			
-		# C) Redshifted value is redshift
-		if obstype == 'Redshift' and obsunits == 'None':
-			redfrq = frqvln / (1.0 + obsvalue)
-		
-			redshift, redwave, obsoptvel, obsradvel, obsrelvel = conversion(frqvln, redfrq)
-			
-			st.write('Redshifted **optical** velocity :',str(obsoptvel))
-			st.write('Redshifted **radio** velocity :',str(obsradvel))
-			st.write('Redshifted **relativisitic** velocity :',str(obsrelvel))
-			st.write('Redshift :',str(redshift))
-			st.write('Redshifted wavelength :',str(redwave),'m')
-			st.write('Redshifted frequency :',str(redfrq),'Hz')
-		
-		
-		# D) Redshifted value is optical velocity
-		if obstype == 'Optical velocity' and obsunits in ['m/s', 'km/s']:
-			if obsunits == 'm/s':
-				waveobs = (obsvalue / c)*waveln + waveln
-			
-			if obsunits == 'km/s':
-				waveobs = (obsvalue*1000.0 / c)*waveln + waveln
-			
-			fobs = (waveobs * u.m).to(u.Hz, equivalencies=u.spectral())
-			
-			redshift, redwave, obsoptvel, obsradvel, obsrelvel = conversion(frqvln, fobs.value)
-			
-			st.write('Redshifted **optical** velocity :',str(obsoptvel))
-			st.write('Redshifted **radio** velocity :',str(obsradvel))
-			st.write('Redshifted **relativisitic** velocity :',str(obsrelvel))
-			st.write('Redshift :',str(redshift))
-			st.write('Redshifted wavelength :',str(redwave),'m')
-			st.write('Redshifted frequency :',str(fobs.value),'Hz')
-		
+		# Whatever type of value is given, convert it to the observed frequency and then do the standard conversions
+		obsfrq = float(observedfrequency(tosi(obsvalue, obsunits), obstype, frqvln))
+		redshift, redwave, obsoptvel, obsradvel, obsrelvel = conversion(frqvln, obsfrq)
 		
-		# E) Redshifted value is radio velocity
-		if obstype == 'Radio velocity' and obsunits in ['m/s', 'km/s']:
-			if obsunits == 'm/s':
-				fobs = -1.0*((obsvalue / c)*frqvln - frqvln)
-			
-			if obsunits == 'km/s':
-				fobs = -1.0*((obsvalue*1000.0 / c)*frqvln - frqvln)
-						
-			redshift, redwave, obsoptvel, obsradvel, obsrelvel = conversion(frqvln, fobs)
-			
-			st.write('Redshifted **optical** velocity :',str(obsoptvel))
-			st.write('Redshifted **radio** velocity :',str(obsradvel))
-			st.write('Redshifted **relativisitic** velocity :',str(obsrelvel))
-			st.write('Redshift :',str(redshift))
-			st.write('Redshifted wavelength :',str(redwave),'m')
-			st.write('Redshifted frequency :',str(fobs),'Hz')
+		st.write('Redshifted **optical** velocity :',str(obsoptvel),'km/s')
+		st.write('Redshifted **radio** velocity :',str(obsradvel),'km/s')
+		st.write('Redshifted **relativisitic** velocity :',str(obsrelvel),'km/s')
+		st.write('Redshift :',str(redshift))
+		st.write('Redshifted wavelength :',str(redwave),'m')
+		st.write('Redshifted frequency :',str(obsfrq),'Hz')
 
-		
-		# F) Redshifted value is relativistic velocity
-		if obstype == 'Relativistic velocity' and obsunits in ['m/s', 'km/s']:
-			# Let v/c = k for simplicity
-			if obsunits == 'm/s':
-				k = obsvalue / c
-				
-			if obsunits == 'km/s':
-				k = obsvalue*1000.0 / c	
-				
-			fobs = math.sqrt( (frqvln**2.0 * (k-1.0)) / (-1.0 - k))
-			
-			redshift, redwave, obsoptvel, obsradvel, obsrelvel = conversion(frqvln, fobs)
-			
-			st.write('Redshifted **optical** velocity :',str(obsoptvel))
-			st.write('Redshifted **radio** velocity :',str(obsradvel))
-			st.write('Redshifted **relativisitic** velocity :',str(obsrelvel))
-			st.write('Redshift :',str(redshift))
-			st.write('Redshifted wavelength :',str(redwave),'m')
-			st.write('Redshifted frequency :',str(fobs),'Hz')
+
+# BATCH CONVERSION
+# Converts a whole table of observed values at once, e.g. a list of optical velocities to observed HI frequencies
+st.write('###')
+st.write('#### Batch conversion')
+dolinebatch = st.checkbox('Convert a table of values', key='dolinebatch', help='Upload a CSV table of observed values to convert them all to the other units')
+
+if dolinebatch:
+	st.write('Upload a CSV file with a header row and a column named **value**. Optionally include **type** (e.g. Optical velocity, Redshift), **unit** (e.g. km/s, None, MHz) and **restline** columns to set these for each row; otherwise the defaults below are used for all of them. Rest lines can be any of the preset lines (HI, CO(1-0), CO(2-1)) or a rest frequency in Hz. Any other columns (e.g. names) are copied to the output. The table is converted a chunk at a time, so it can be as long as you like. Rows which can\'t be converted (e.g. units which don\'t match the type) are given NaN.')
+
+	left_column, mid_column, right_column = st.columns(3)
+
+	with left_column:
+		batchtype = st.selectbox('Default type', tuple(typeunits), index=3, key='batchtype')
+
+	with mid_column:
+		batchunit = st.selectbox('Default units', typeunits[batchtype], key='batchunit')
+
+	with right_column:
+		batchrest = st.selectbox('Default rest line', ('HI', 'CO(1-0)', 'CO(2-1)'), key='batchrest')
+
+	linebatchfile = st.file_uploader('Table of values', type=['csv', 'txt'], key='linebatchfile')
+
+	if linebatchfile is not None:
+		convertupload(linebatchfile, lambda infile, outfile: convertcsv(infile, outfile, linefs, batchtype, batchunit, batchrest), 'converted.csv')
+
+
+# LINE CATALOGUE
+# Searches a local catalogue for all the lines that would be seen in a given observed band at a given redshift
+st.write('###')
+st.write('#### Line catalogue search')
+docatalogue = st.checkbox('Search a line catalogue', key='docatalogue', help='Find all the lines from a catalogue which would be observed in a given frequency range')
+
+if docatalogue:
+	st.write('Lists the catalogue lines whose redshifted frequencies fall within the observed band. By default this uses a small catalogue of common radio and mm lines, but you can give the path to a line list exported from Splatalogue (CSV or colon-separated) or a JPL/CDMS .cat file. Catalogues are converted to a sorted, memory-mapped form the first time they\'re used, so even very large ones are searched instantly.')
+
+	catfile = st.text_input('Catalogue file', '', key='catfile', help='Path to a Splatalogue export or JPL/CDMS .cat file. Leave blank to use the default catalogue.')
+	if catfile == '':
+		catfile = defaultcatalogue
+
+	left_column, mid_column, right_column = st.columns(3)
+
+	with left_column:
+		bandmin = st.number_input('Band minimum (MHz)', format='%.6f', min_value=0.0, value=1300.0, key='bandmin')
+
+	with mid_column:
+		bandmax = st.number_input('Band maximum (MHz)', format='%.6f', min_value=0.0, value=1450.0, key='bandmax')
+
+	with right_column:
+		bandz = st.number_input('Redshift', format='%.6f', min_value=0.0, value=0.0, key='bandz')
+
+	try:
+		catfreqs, catnames = cachedcatalogue(catfile, os.path.getmtime(catfile))
+	except (OSError, ValueError, StopIteration) as err:
+		st.write('#### Could not read the catalogue : '+str(err))
+		catfreqs = None
+
+	if catfreqs is not None:
+		linefreqs, linenames = linesinband(catfreqs, catnames, bandmin*1E6, bandmax*1E6, bandz)
+
+		st.write('Found',str(len(linefreqs)),'of',str(len(catfreqs)),'catalogue lines in the band.')
+		if len(linefreqs) > 0:
+			st.dataframe({'Line':linenames, 'Rest frequency (MHz)':linefreqs/1E6, 'Observed frequency (MHz)':linefreqs/(1E6*(1.0+bandz))}, hide_index=True)
+
+
+# LINE IDENTIFICATION
+# The reverse of the above : given observed frequencies, finds the redshifts at which they best match catalogue lines
+st.write('###')
+st.write('#### Line identification')
+doident = st.checkbox('Identify observed lines', key='doident', help='Find which catalogue lines, at which redshift, best explain one or more observed frequencies')
+
+if doident:
+	st.write('Give one or more observed frequencies. Every catalogue line that could be each of them within the redshift range is found, and the redshifts where the most observed lines have a match (within the velocity tolerance) are listed, best first. With a single frequency this just lists the possible lines. Uses the same catalogue as the search above.')
+
+	identfreqs = st.text_input('Observed frequencies (MHz)', '113859.3, 108851.6, 108437.5', key='identfreqs', help='Comma-separated list of observed frequencies')
+
+	left_column, mid_column, right_column = st.columns(3)
+
+	with left_column:
+		identzmin = st.number_input('Minimum redshift', format='%.6f', min_value=0.0, value=0.0, key='identzmin')
+
+	with mid_column:
+		identzmax = st.number_input('Maximum redshift', format='%.6f', min_value=0.0, value=0.1, key='identzmax')
+
+	with right_column:
+		identtol = st.number_input('Velocity tolerance (km/s)', min_value=0.1, value=50.0, key='identtol', help='How closely the redshifts of different lines must agree for them to count as a match')
+
+	identcatfile = st.session_state['catfile'] if 'catfile' in st.session_state and st.session_state['catfile'] != '' else defaultcatalogue
+
+	try:
+		obsfreqs = numpy.array([float(value) for value in identfreqs.split(',') if value.strip() != '']) * 1E6
+		identvalid = len(obsfreqs) > 0 and numpy.all(obsfreqs > 0.0)
+	except ValueError:
+		identvalid = False
+
+	try:
+		catfreqs, catnames = cachedcatalogue(identcatfile, os.path.getmtime(identcatfile))
+	except (OSError, ValueError, StopIteration) as err:
+		st.write('#### Could not read the catalogue : '+str(err))
+		catfreqs = None
+
+	if identvalid == False:
+		st.write('#### Observed frequencies must be a comma-separated list of positive numbers.')
+	elif identzmin >= identzmax:
+		st.write('#### The maximum redshift must be above the minimum.')
+	elif catfreqs is not None:
+		matches = identifylines(catfreqs, obsfreqs, identzmin, identzmax, identtol)
+
+		if len(matches) == 0:
+			st.write('No catalogue lines match in this redshift range.')
+
+		for zmatch, nmatched, obsindex, lineindex, redshift in matches:
+			st.write('##### z = '+str(round(zmatch, 6))+' : matches '+str(nmatched)+' of '+str(len(obsfreqs))+' observed lines')
+			st.dataframe({'Observed frequency (MHz)':obsfreqs[obsindex]/1E6, 'Line':numpy.asarray(catnames[lineindex]), 'Rest frequency (MHz)':numpy.asarray(catfreqs[lineindex])/1E6,
+			              'Redshift':redshift, 'Offset (km/s)':(c/1000.0)*(redshift - zmatch)/(1.0 + zmatch)}, hide_index=True)
+
+
+# FITS CUBES
+# Converts the whole spectral axis of a cube at once. Files are read from a local path rather than uploaded, since
+# cubes can be many GB; only the header is read and outputs are written straight to disk.
+st.write('###')
+st.write('#### Spectral axis of a FITS cube')
+dofits = st.checkbox('Convert the spectral axis of a FITS cube', key='dofits', help='Convert every channel of a cube to all the other units, or write a new header with the spectral axis in a different convention')
+
+if dofits:
+	st.write('Give the path to a cube on this machine. The spectral axis is read from the header and converted using the rest frequency from the header or from the rest value above. You can write a table of the converted axis, a new header with the spectral axis converted to another type (e.g. frequency to optical velocity), or a copy of the cube with the new header. The data is never loaded into memory, so this works for cubes of any size.')
+
+	left_column, right_column = st.columns(2)
+
+	with left_column:
+		fitsfile = st.text_input('FITS file', key='fitsfile', help='Path to the FITS cube')
+		fitsrest = st.selectbox('Rest frequency', ('From header', 'From rest value above'), key='fitsrest', help='If the header has no rest frequency, the rest value above is used')
+
+	with right_column:
+		fitsoutput = st.selectbox('Output', ('Axis table (CSV)', 'Header', 'Cube with new header'), key='fitsoutput')
+		fitsouttype = st.selectbox('New spectral axis type', tuple(outputtypes), index=3, key='fitsouttype', help='Type of the spectral axis in the new header or cube')
+
+	if fitsfile != '':
+		try:
+			header, hduindex, specwcs = spectralaxis(fitsfile)
+			nchan, axistype, headerrest = axisinfo(header, specwcs)
+		except (OSError, ValueError) as err:
+			st.write('#### Could not read the spectral axis : '+str(err))
+			header = None
+
+		if header is not None:
+			# Rest frequency from the header if requested and available, otherwise from the rest value above
+			if fitsrest == 'From header' and headerrest > 0.0:
+				fitsrestfreq = headerrest
+			elif inpunitmatch == True:
+				fitsrestfreq = frqvln
+			else:
+				fitsrestfreq = headerrest
+
+			st.write('Spectral axis :',specwcs.wcs.ctype[0],'with',str(nchan),'channels. Rest frequency :',str(fitsrestfreq),'Hz')
+
+			if not numpy.isfinite(fitsrestfreq) or fitsrestfreq <= 0.0:
+				st.write('#### A rest frequency is needed, either in the header or as the rest value above.')
+			else:
+				# Preview of the first few channels
+				preview = next(axischunks(specwcs, min(nchan, 10), axistype, fitsrestfreq, chunksize=10))
+				st.dataframe(dict(zip(axiscolumns, preview)), hide_index=True)
+
+				outdefaults = {'Axis table (CSV)':'_axis.csv', 'Header':'_header.txt', 'Cube with new header':'_'+fitsouttype.split()[0].lower()+'.fits'}
+				fitsbase = fitsfile[:-5] if fitsfile.lower().endswith('.fits') else fitsfile
+				outfile = st.text_input('Output file', fitsbase+outdefaults[fitsoutput])
+
+				if st.button('Write', type='primary', key='fitswrite'):
+					# Never overwrite an existing file, particularly not the input cube
+					if os.path.exists(outfile):
+						st.write('#### Output file already exists, please choose another name.')
+					else:
+						if fitsoutput == 'Axis table (CSV)':
+							writeaxistable(outfile, specwcs, nchan, axistype, fitsrestfreq)
+						else:
+							newheader = regriddedheader(header, fitsouttype, fitsrestfreq)
+							if fitsoutput == 'Header':
+								newheader.totextfile(outfile)
+							else:
+								copycube(fitsfile, hduindex, outfile, newheader)
+						st.write('Written to',outfile)